@@ -2,6 +2,7 @@ import json
 import re
 from dataclasses import asdict
 from core.agent_base import AgentBase
+from core.tracing import span
 from core.schemas import Component, ComponentChild, PageSpec
 
 ARCH_PROMPT = """
@@ -36,27 +37,38 @@ class ArchitectAgent(AgentBase):
     def __init__(self):
         super().__init__("Architect", ARCH_PROMPT)
 
-    def process(self, prd, context=None):
-        output = self.run(
-            json.dumps(asdict(prd), ensure_ascii=False), context=context, json_mode=False
-        )
+    def process(self, prd, context=None, on_partial=None):
+        """Build the PageSpec; with ``on_partial`` each component is reported as
+        soon as it closes in the streamed output."""
+
+        user_prompt, context = self.compose(asdict(prd), context)
+        if on_partial is None:
+            output = self.run(user_prompt, context=context, json_mode=False)
+        else:
+            output = self.run_json_stream(
+                user_prompt,
+                context=context,
+                watch=[("components",)],
+                on_item=lambda path, comp: isinstance(comp, dict) and on_partial(self._component(comp)),
+            )
 
         if not output or not output.strip():
             raise ValueError("Architect agent returned empty output; cannot build page spec")
 
-        data = self._parse_output(output)
-        components = []
-        for comp in data.get("components", []):
-            children = [ComponentChild(**child) for child in comp.get("children", [])]
-            components.append(
-                Component(id=comp.get("id", ""), html=comp.get("html", ""), children=children)
-            )
+        with span("Architect._parse_output", output_bytes=len(output.encode("utf-8"))):
+            data = self._parse_output(output)
+        components = [self._component(comp) for comp in data.get("components", [])]
         return PageSpec(
             layout=data.get("layout", ""),
             colors=data.get("colors", []),
             components=components,
         )
 
+    @staticmethod
+    def _component(comp: dict) -> Component:
+        children = [ComponentChild(**child) for child in comp.get("children", [])]
+        return Component(id=comp.get("id", ""), html=comp.get("html", ""), children=children)
+
     def _parse_output(self, output: str):
         """Accept either JSON or structured Chinese text and normalize to PageSpec fields."""
 
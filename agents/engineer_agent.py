@@ -1,7 +1,13 @@
-import json
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import asdict
 from dataclasses import is_dataclass
 from core.agent_base import AgentBase
+from core.feature_check import FeatureChecker
+from core.fragment_library import MARKER, splice_fragments
+from core.metrics import collect_calls, note, record_call
 
 # ENGINEER_PROMPT = """
 # 你是一名前端工程师。
@@ -23,8 +29,14 @@ ENGINEER_PROMPT = (
 class EngineerAgent(AgentBase):
     def __init__(self):
         super().__init__("Engineer", ENGINEER_PROMPT)
+        # 可选的组件片段库：adapt 把历史实现作为参考交给模型改写，
+        # verbatim 让模型只输出占位注释，生成后原样拼接已验证的片段
+        self.fragment_library = None
+        self.fragment_mode = "adapt"
+
+    def process(self, task_plan, context=None, candidates: int = 1, brief=None, **kwargs):
+        """生成页面；candidates > 1 时并发生成多个候选，首个通过离线检查的候选被采纳。"""
 
-    def process(self, page_spec, context=None, **kwargs):
         page_payload = None
         if "page_spec" in kwargs and kwargs["page_spec"] is not None:
             ps = kwargs["page_spec"]
@@ -33,15 +45,171 @@ class EngineerAgent(AgentBase):
             elif isinstance(ps, dict):
                 page_payload = ps
 
-        if is_dataclass(page_spec):
-            plan_payload = asdict(page_spec)
-        elif isinstance(page_spec, dict):
-            plan_payload = page_spec
+        if is_dataclass(task_plan):
+            plan_payload = asdict(task_plan)
+        elif isinstance(task_plan, dict):
+            plan_payload = task_plan
         else:
-            plan_payload = {"brief": page_spec}
+            plan_payload = {"brief": task_plan}
 
         payload = plan_payload
         if page_payload:
             payload = {"task_plan": plan_payload, "page_spec": page_payload}
 
-        return self.run(json.dumps(payload, ensure_ascii=False), context=context)
+        fragments = {}
+        if self.fragment_library is not None and page_payload:
+            fragments = self.fragment_library.match(page_payload)
+            if fragments:
+                payload = {**payload, **self._fragment_payload(fragments)}
+
+        if brief is None and isinstance(task_plan, str):
+            brief = task_plan
+        user_prompt, context = self.compose(payload, context)
+        if candidates <= 1:
+            html = self.run(user_prompt, context=context)
+        else:
+            checker = FeatureChecker.from_inputs(page_spec=page_payload, brief=brief)
+            html = self._best_of(user_prompt, context, candidates, checker)
+
+        if self.fragment_library is None or not page_payload:
+            return html
+        return self._apply_fragments(html, fragments, page_payload, brief)
+
+    def _verbatim(self, fragments):
+        """可原样拼接的片段：verbatim 模式下脚本不依赖组件外元素的片段。"""
+        if self.fragment_mode != "verbatim":
+            return {}
+        return {cid: f for cid, f in fragments.items() if f.self_contained}
+
+    def _fragment_payload(self, fragments):
+        """把命中的片段写进提示词：verbatim 只给占位注释，adapt（及无法原样拼接的片段）给出完整实现供改写。"""
+
+        verbatim = self._verbatim(fragments)
+        adapt = {cid: f for cid, f in fragments.items() if cid not in verbatim}
+        payload = {}
+        if verbatim:
+            payload["fragment_placeholders"] = {
+                "instruction": (
+                    "以下组件已有经过验证的实现：不要为它们编写 HTML/CSS/JS，"
+                    "只在页面中对应位置原样输出给出的占位注释，系统会自动替换为完整实现。"
+                ),
+                "markers": {cid: MARKER.format(id=cid) for cid in verbatim},
+            }
+        if adapt:
+            payload["reusable_fragments"] = {
+                "instruction": (
+                    "以下组件有经过验证的历史实现，请在此基础上按本次需求调整文案与样式后复用，"
+                    "保持 id 与 class 命名不变，不要从零重写。"
+                ),
+                "fragments": [
+                    {"component_id": cid, "html": f.html, "css": f.css, "js": f.js}
+                    for cid, f in adapt.items()
+                ],
+            }
+        return payload
+
+    def _apply_fragments(self, html, fragments, page_payload, brief):
+        """拼接 verbatim 片段；页面通过离线检查后把各组件收录进片段库。"""
+
+        verbatim = self._verbatim(fragments)
+        if verbatim:
+            html = splice_fragments(html, verbatim)
+        result = FeatureChecker.from_inputs(page_spec=page_payload, brief=brief).check(html)
+        harvested = self.fragment_library.harvest(html, page_payload) if result.passed else []
+        note(
+            fragments={
+                "mode": self.fragment_mode,
+                "matched": sorted(fragments),
+                "spliced": sorted(verbatim),
+                "harvested": harvested,
+                "validated": result.passed,
+            }
+        )
+        return html
+
+    def _best_of(self, user_prompt, context, n: int, checker: FeatureChecker):
+        """并发生成 n 个候选，按完成顺序打分；首个通过的候选被采纳，其余流式请求即时断开。
+
+        每个候选在独立的作用域中收集调用记录，只有返回前已完成的候选计入步骤记录；
+        被放弃的候选在步骤记录之后才结束，其记录丢弃，并在 best_of 中计为 cancelled。
+        """
+
+        cancel = threading.Event()
+        started = time.perf_counter()
+
+        def generate(index):
+            if cancel.is_set():
+                return index, None, None
+            with collect_calls() as calls:
+                text = self.run(
+                    user_prompt,
+                    context=context,
+                    on_delta=lambda piece: cancel.is_set(),
+                    coalesce=False,  # 相同提示词的候选必须独立生成
+                )
+            return index, text, calls
+
+        pool = ThreadPoolExecutor(max_workers=n)
+        futures = [pool.submit(contextvars.copy_context().run, generate, i) for i in range(n)]
+        scored = []
+        errors = []
+        kept = []
+        accepted = None
+        try:
+            for future in as_completed(futures):
+                try:
+                    index, text, calls = future.result()
+                except Exception as exc:
+                    errors.append(exc)
+                    continue
+                if text is None:
+                    continue
+                kept.append(calls)
+                result = checker.check(text)
+                scored.append((result.score, index, text, result))
+                if result.passed:
+                    accepted = scored[-1]
+                    cancel.set()
+                    break
+        finally:
+            cancel.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        for calls in kept:
+            for record in calls:
+                record_call(**record)
+        if not scored:
+            raise errors[-1] if errors else ValueError("Engineer produced no candidate")
+        best = accepted or max(scored, key=lambda item: item[0])
+        note(
+            best_of={
+                "candidates": n,
+                "completed": len(scored),
+                "failed": len(errors),
+                "cancelled": n - len(scored) - len(errors),
+                "accepted": best[1],
+                "passed": best[3].passed,
+                "score": best[0],
+                "missing_features": best[3].missing_features,
+                "missing_components": best[3].missing_components,
+                "seconds_to_accept": round(time.perf_counter() - started, 3),
+            }
+        )
+        return best[2]
+
+    def revise(self, html, context=None, perf_audit=None, **kwargs):
+        """根据静态性能审计结果做一次修订；无违规项时原样返回，不调用模型。"""
+
+        violations = getattr(perf_audit, "violations", None) or []
+        if not violations or not isinstance(html, str):
+            return html
+
+        issues = "\n".join(f"- {item.rule}: {item.detail}" for item in violations)
+        user_prompt = (
+            "以下是你生成的页面以及静态性能审计发现的问题。\n"
+            "请在不删减任何功能与内容的前提下逐条修复，并输出修复后的完整 HTML：\n"
+            f"{issues}\n\n"
+            "页面代码：\n"
+            f"{html}"
+        )
+        return self.run(user_prompt, context=context)
@@ -1,6 +1,7 @@
 import json
 import re
 from core.agent_base import AgentBase
+from core.tracing import span
 from core.schemas import PRD, PageSection
 
 # PM_PROMPT = """
@@ -65,13 +66,29 @@ class PMAgent(AgentBase):
     def __init__(self):
         super().__init__("PM", PM_PROMPT)
 
-    def process(self, brief, context=None):
-        output = self.run(brief, context=context, json_mode=False)
+    def process(self, brief, context=None, on_partial=None):
+        """Build the PRD; with ``on_partial`` each page section is reported as
+        soon as it closes in the streamed output."""
+
+        # 共享上下文已包含 brief 时只发送引用，不重复发送简报
+        user_prompt, context = self.compose(brief, context)
+        if on_partial is None:
+            output = self.run(user_prompt, context=context, json_mode=False)
+        else:
+            output = self.run_json_stream(
+                user_prompt,
+                context=context,
+                watch=[("page_sections",)],
+                on_item=lambda path, item: isinstance(item, dict) and on_partial(
+                    PageSection(id=item.get("id", ""), purpose=item.get("purpose", ""), kpi=item.get("kpi"))
+                ),
+            )
 
         if not output or not output.strip():
             raise ValueError("PM agent returned empty output; cannot build PRD")
 
-        data = self._parse_output(output)
+        with span("PM._parse_output", output_bytes=len(output.encode("utf-8"))):
+            data = self._parse_output(output)
         sections = [PageSection(**section) for section in data.get("page_sections", [])]
         return PRD(
             product=data.get("product", ""),
@@ -2,6 +2,7 @@ import json
 from dataclasses import asdict, is_dataclass
 
 from core.agent_base import AgentBase
+from core.tracing import span
 from core.schemas import TaskItem, TaskPlan
 
 
@@ -37,31 +38,36 @@ class ProjectAgent(AgentBase):
     def __init__(self):
         super().__init__("Project", PROJECT_PROMPT)
 
-    def process(self, page_spec, context=None, prd=None):
+    def process(self, page_spec, context=None, prd=None, on_partial=None):
+        """Build the TaskPlan; with ``on_partial`` each task is reported as soon
+        as it closes in the streamed output."""
+
         payload = {
             "prd": asdict(prd) if prd is not None and is_dataclass(prd) else prd,
             "page_spec": asdict(page_spec) if is_dataclass(page_spec) else page_spec,
         }
 
-        output = self.run(json.dumps(payload, ensure_ascii=False), context=context)
+        user_prompt, context = self.compose(payload, context)
+        if on_partial is None:
+            output = self.run(user_prompt, context=context)
+        else:
+            streamed = []
+
+            def on_task(path, task):
+                if isinstance(task, dict):
+                    streamed.append(self._task(task, len(streamed)))
+                    on_partial(streamed[-1])
+
+            output = self.run_json_stream(
+                user_prompt, context=context, watch=[("prioritized_tasks",)], on_item=on_task
+            )
 
         if not output or not output.strip():
             raise ValueError("Project agent returned empty output; cannot build task plan")
 
-        data = self._parse_output(output)
-        tasks = []
-        for idx, task in enumerate(data.get("prioritized_tasks", [])):
-            depends_on = task.get("depends_on", [])
-            if isinstance(depends_on, str):
-                depends_on = [depends_on]
-            tasks.append(
-                TaskItem(
-                    id=task.get("id", f"task-{idx+1}"),
-                    description=task.get("description", ""),
-                    depends_on=list(depends_on),
-                    deliverable=task.get("deliverable"),
-                )
-            )
+        with span("Project._parse_output", output_bytes=len(output.encode("utf-8"))):
+            data = self._parse_output(output)
+        tasks = [self._task(task, idx) for idx, task in enumerate(data.get("prioritized_tasks", []))]
 
         summary = data.get("summary", "")
         if not tasks:
@@ -76,6 +82,18 @@ class ProjectAgent(AgentBase):
 
         return TaskPlan(summary=summary, prioritized_tasks=tasks)
 
+    @staticmethod
+    def _task(task: dict, idx: int) -> TaskItem:
+        depends_on = task.get("depends_on", [])
+        if isinstance(depends_on, str):
+            depends_on = [depends_on]
+        return TaskItem(
+            id=task.get("id", f"task-{idx+1}"),
+            description=task.get("description", ""),
+            depends_on=list(depends_on),
+            deliverable=task.get("deliverable"),
+        )
+
     def _parse_output(self, output: str):
         try:
             data = json.loads(output)
@@ -1,20 +1,11 @@
 import json
-from dataclasses import dataclass
 from typing import List
 
 from core.agent_base import AgentBase
+from core.schemas import RoleTask, TeamPlan
+from core.tracing import span
 
 
-@dataclass
-class RoleTask:
-    role: str
-    tasks: List[str]
-
-
-@dataclass
-class TeamPlan:
-    available_roles: List[str]
-    tasks: List[RoleTask]
 TEAMLEADER_PROMPT = """
 你是一名电商营销项目的团队负责人（TeamLeader），负责统筹多智能体协作，使整个团队的工作对齐商业目标（如点击率、加购率、成交转化率）。
 
@@ -116,7 +107,8 @@ class TeamLeaderAgent(AgentBase):
         if not raw_output or not raw_output.strip():
             raise ValueError("TeamLeader agent returned empty output; cannot plan tasks")
 
-        return self._parse_output(raw_output, available_roles)
+        with span("TeamLeader._parse_output", output_bytes=len(raw_output.encode("utf-8"))):
+            return self._parse_output(raw_output, available_roles)
 
     def _parse_output(self, output: str, available_roles: List[str]) -> TeamPlan:
         try:
@@ -0,0 +1,100 @@
+"""Memory benchmark for a long-running process that handles many runs.
+
+Simulates the bus traffic of ``Manager.run`` without calling any model: each
+run publishes a brief, planning specs and a large HTML page, renders the
+Engineer/Auditor prompt context and dumps the bus for the artifact store. The
+most recent runs are kept alive (as a service keeping recent results would)
+and Python heap usage is measured with ``tracemalloc``, once with inline
+payloads and once with blob handles.
+
+    python -m benchmarks.bus_memory --runs 200 --keep 20 --html-kb 300
+"""
+
+import argparse
+import gc
+import json
+import random
+import string
+import time
+import tracemalloc
+from collections import deque
+
+from core.blob_store import BlobStore
+from core.message_bus import MessageBus
+
+
+def _page(size_kb: int, seed: int) -> str:
+    rng = random.Random(seed)
+    blocks = []
+    while sum(map(len, blocks)) < size_kb * 1024:
+        word = "".join(rng.choices(string.ascii_lowercase, k=8))
+        blocks.append(f'<section class="{word}"><h2>商品卖点 {word}</h2><p>{word * 12}</p></section>\n')
+    return "<!DOCTYPE html><html><head><style>body{margin:0}</style></head><body>" + "".join(blocks) + "</body></html>"
+
+
+def _spec(components: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    return {
+        "layout": "single-column",
+        "colors": ["#E4393C", "#FFFFFF"],
+        "components": [
+            {
+                "id": f"component-{i}-{rng.randint(0, 10**6)}",
+                "html": "section",
+                "children": [{"tag": "p", "content_hint": "文案" * 40} for _ in range(6)],
+            }
+            for i in range(components)
+        ],
+    }
+
+
+def simulate(runs: int, keep: int, html_kb: int, threshold: int) -> dict:
+    blobs = BlobStore(threshold=threshold)
+    recent = deque(maxlen=keep)
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    for run in range(runs):
+        bus = MessageBus(blobs=blobs)
+        bus.publish("brief", "User", f"第 {run} 个营销页面需求")
+        bus.publish("prd", "PM", _spec(20, run))
+        bus.publish("page_spec", "Architect", _spec(40, run + 1))
+        bus.publish("task_plan", "Project", _spec(20, run + 2))
+        engineer_context = bus.chat_history(topics=["brief", "prd", "page_spec", "task_plan"])
+        bus.publish("html", "Engineer", _page(html_kb, run))
+        audit_context = bus.chat_history(topics=["html"])
+        dumped = json.dumps(bus.dump(), ensure_ascii=False)
+        del engineer_context, audit_context, dumped
+        recent.append(bus)
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = blobs.stats()
+    blobs.close()
+    return {
+        "threshold": threshold,
+        "seconds": round(elapsed, 2),
+        "retained_mb": round(current / 2**20, 1),
+        "peak_mb": round(peak / 2**20, 1),
+        "disk_mb": round(stats["disk_bytes"] / 2**20, 1),
+        "segments": stats["segments"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bus memory benchmark: inline payloads vs blob handles")
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--keep", type=int, default=20, help="recent runs kept alive")
+    parser.add_argument("--html-kb", type=int, default=300)
+    parser.add_argument("--threshold", type=int, default=16 * 1024)
+    args = parser.parse_args()
+
+    for threshold in (0, args.threshold):
+        result = simulate(args.runs, args.keep, args.html_kb, threshold)
+        label = "inline" if threshold == 0 else "blob handles"
+        print(f"{label:>12}: " + ", ".join(f"{k}={v}" for k, v in result.items()))
+
+
+if __name__ == "__main__":
+    main()
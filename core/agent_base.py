@@ -1,5 +1,17 @@
+import json
 import os
-from openai import OpenAI
+import time
+
+from core import batch, deadline
+from core.continuation import CONTINUABLE, continuation_messages, html_closed, needs_continuation, stitch, strip_fences
+from core.endpoints import shared_pool
+from core.json_stream import IncrementalJSONParser
+from core.metrics import note, record_call
+from core.output_budget import OUTPUT_BUDGET
+from core.prompt_assembler import assemble_prompt
+from core.rate_limiter import CHARS_PER_TOKEN, GOVERNOR, estimate_tokens
+from core.singleflight import AGENT_CALLS, request_key
+from core.tracing import span
 
 # 设置http和https的代理
 # os.environ["HTTP_PROXY"] = "http://211.81.248.212:3128"
@@ -7,38 +19,374 @@ from openai import OpenAI
 
 
 class AgentBase:
-    def __init__(self, name, system_prompt, model="gpt-5-chat-latest", api_key: str | None = None):
+    # 截断文档最多续写的次数（超过仍未闭合时返回已拼接的内容）
+    max_continuations = 3
+
+    def __init__(
+        self,
+        name,
+        system_prompt,
+        model="gpt-5-chat-latest",
+        api_key: str | None = None,
+        router=None,
+    ):
         self.name = name
         self.model = model
+        # 可选的 ModelRouter：按角色选择模型并在失败时切换到备选模型
+        self.router = router
         self.system_prompt = system_prompt
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         if not self.api_key:
             raise ValueError(
                 "OPENAI_API_KEY is not set. Set it in the environment or pass api_key explicitly."
             )
-        self.client = OpenAI(api_key=self.api_key, base_url="http://98.81.169.220:3000/v1")
+        # 端点池（WEBGEN_ENDPOINTS 配置多个网关）：按负载选择端点，熔断与健康状态在进程内共享
+        self.endpoints = shared_pool(self.api_key)
+        self.client = self.endpoints.primary.client
 
-    def run(self, user_prompt, context=None, json_mode: bool = False):
+    def run(
+        self,
+        user_prompt,
+        context=None,
+        json_mode: bool = False,
+        on_delta=None,
+        coalesce: bool = True,
+    ):
         """Invoke the LLM with optional conversational context.
 
         The agent's system prompt is always injected as the first message so
         every call uses the agent-specific instructions.
+
+        With ``on_delta`` the completion is streamed: the callback receives each
+        text delta and may return True to stop reading the stream early (the
+        text received so far is returned). ``on_delta(None)`` signals that the
+        stream restarted on a fallback model and earlier deltas are void.
+        ``coalesce=False`` bypasses single-flight (e.g. independent candidates).
+        Only calls with the same request options and the same streaming mode
+        are coalesced; a streaming follower receives the shared text as one
+        delta once the leader finishes.
+        """
+        with span("AgentBase.run", role=self.name) as run_span:
+            with span("request.build", role=self.name) as build_span:
+                messages = [
+                    {"role": "system", "content": [{"type": "text", "text": self.system_prompt}]}
+                ]
+                print(messages)
+                if context:
+                    messages.extend(context)
+                messages.append({"role": "user", "content": [{"type": "text", "text": user_prompt}]})
+
+                candidates = self.router.candidates(self.name, self.model) if self.router else [self.model]
+
+                # 本次请求的输出上限 / stop 等选项在这里定下，同时作为合并键的一部分
+                options = OUTPUT_BUDGET.request_options(self.name, adaptive=batch.current_session() is None)
+                # 相同 (agent, model, messages, 选项, 是否流式) 的并发请求只发起一次调用，其余等待同一结果
+                key = request_key(self.name, candidates[0], messages, options, on_delta is not None)
+                if build_span:
+                    build_span.set(
+                        messages=len(messages),
+                        payload_bytes=len(json.dumps(messages, ensure_ascii=False).encode("utf-8")),
+                    )
+
+            started = time.perf_counter()
+            if coalesce:
+                (text, route, info), shared = AGENT_CALLS.do(
+                    key, lambda: self._dispatch(messages, candidates, on_delta, options)
+                )
+                if shared and on_delta is not None and text:
+                    on_delta(text)  # 跟随者没有收到领导者的流式片段，结果一次性交给它的解析器
+            else:
+                (text, route, info), shared = self._dispatch(messages, candidates, on_delta, options), False
+            record_call(
+                agent=self.name,
+                model=route["model"],
+                latency=round(time.perf_counter() - started, 3),
+                coalesced=shared,
+                route=route,
+                **info,
+            )
+            if run_span:
+                run_span.set(model=route["model"], coalesced=shared, output_bytes=len(text.encode("utf-8")))
+            return text
+
+    def compose(self, payload, context=None):
+        """Assemble (user_prompt, context) without re-sending artifacts already in the context.
+
+        The bytes/tokens saved are attached to the current step's metrics.
         """
-        messages = [
-            {"role": "system", "content": [{"type": "text", "text": self.system_prompt}]}
-        ]
-        print(messages)
-        if context:
-            messages.extend(context)
-        messages.append({"role": "user", "content": [{"type": "text", "text": user_prompt}]})
-
-        resp = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            # response_format={"type": "json_object"} if json_mode else None,
-        )
-
-        return self._extract_text(resp)
+        assembled = assemble_prompt(payload, context)
+        note(prompt_assembly=assembled.report)
+        return assembled.user_prompt, assembled.context
+
+    def run_json_stream(self, user_prompt, context=None, watch=(), on_item=None):
+        """Stream a JSON completion through an incremental parser.
+
+        ``on_item(path, value)`` fires as each element of a watched array path
+        closes, and reading stops as soon as the root object closes. Returns
+        the root object's text (or the raw text if it never closed).
+        """
+
+        state = {"parser": IncrementalJSONParser(watch, on_item)}
+
+        def on_delta(piece):
+            if piece is None:  # 切换到备选模型，重新开始解析
+                state["parser"] = IncrementalJSONParser(watch, on_item)
+                return False
+            return state["parser"].feed(piece)
+
+        text = self.run(user_prompt, context=context, on_delta=on_delta)
+        return state["parser"].root_text() or text
+
+    def _dispatch(self, messages, candidates, on_delta=None, options=None):
+        """Try the routed models in order; return (text, route, call info)."""
+
+        failures = []
+        for model in candidates:
+            started = time.perf_counter()
+            if failures and on_delta is not None:
+                on_delta(None)
+            info = {}
+            try:
+                text = self._complete(messages, model, on_delta, info, options)
+            except deadline.DeadlineExceeded:
+                raise
+            except Exception as exc:
+                if self.router:
+                    self.router.record(model, time.perf_counter() - started, ok=False, role=self.name)
+                failures.append({"model": model, "error": type(exc).__name__})
+                if model == candidates[-1]:
+                    raise
+                continue
+            if self.router:
+                self.router.record(model, time.perf_counter() - started, ok=True, role=self.name)
+            return text, {"model": model, "candidates": candidates, "failures": failures}, info
+
+    def _complete(self, messages, model=None, on_delta=None, info=None, options=None):
+        """Send one chat completion request and return its text.
+
+        Inside a ``deadline.budget`` scope the remaining budget is sent as the
+        request timeout, and a timeout after the budget ran out is reported as
+        ``DeadlineExceeded``. Requests are admitted by the process-wide
+        ``GOVERNOR`` (except batch replays, which send nothing) and carry the
+        role's adaptive ``OUTPUT_BUDGET`` options (unless ``options`` is given);
+        ``info`` receives the token usage, admission wait and finish reason.
+        A truncated document of a ``CONTINUABLE`` role is continued from its
+        tail instead of being regenerated (``info["continuation"]``).
+        """
+        info = {} if info is None else info
+        # 批量回放中的请求体必须逐轮一致，不使用随历史变化的自适应上限，也不重复学习
+        batching = batch.current_session() is not None
+        if options is None:
+            options = OUTPUT_BUDGET.request_options(self.name, adaptive=not batching)
+        continuable = self.name in CONTINUABLE
+        waited = 0.0
+        while True:
+            cap = options.get(OUTPUT_BUDGET.token_param)
+            text, usage, finish_reason, permit_wait, started = self._admitted_send(
+                messages, model, on_delta, options, info
+            )
+            waited += permit_wait
+            if batching:
+                report = {"max_tokens": None, "stop": bool(options.get("stop")), "finish_reason": finish_reason}
+            else:
+                # 只学习端点报告的 usage；被取消的流与缺少 usage 的响应只计数不采样
+                report = OUTPUT_BUDGET.record(
+                    self.name, options, usage, time.perf_counter() - started, finish_reason, text
+                )
+            # 文档类角色被截断时续写即可，不必整篇翻倍重发
+            if not report.get("truncated") or info.get("budget_retry") or continuable:
+                break
+            # 自适应上限截断了输出：上限翻倍重发一次（流式调用方丢弃已收到的片段）
+            options = dict(options, **{OUTPUT_BUDGET.token_param: cap * 2})
+            info["budget_retry"] = True
+            if on_delta is not None:
+                on_delta(None)
+        info["governor_wait"] = round(waited, 3)
+        info["usage"] = usage
+        info["finish_reason"] = finish_reason
+        if options:
+            info["output_budget"] = report
+        text = OUTPUT_BUDGET.finish(self.name, text, options, finish_reason)
+        if continuable and needs_continuation(text, finish_reason):
+            text = self._continue(messages, model, on_delta, options, text, info)
+        return text
+
+    def _admitted_send(self, messages, model, on_delta, options, info):
+        """Send once through the governor; returns (text, usage, finish_reason, admission wait, start time)."""
+        if batch.current_session() is not None:
+            # 批量回放的结果来自批次文件，不发出实时请求，不占用限流额度
+            started = time.perf_counter()
+            text, usage, finish_reason = self._send(messages, model, on_delta, options, info)
+            return text, usage, finish_reason, 0.0, started
+        cap = options.get(OUTPUT_BUDGET.token_param)
+        permit = GOVERNOR.acquire(self.name, estimate_tokens(messages, self.name, cap))
+        started = time.perf_counter()
+        with permit:
+            text, usage, finish_reason = self._send(messages, model, on_delta, options, info)
+            permit.settle(usage.get("total_tokens"))
+        return text, usage, finish_reason, permit.waited, started
+
+    def _continue(self, messages, model, on_delta, options, text, info):
+        """Continue a truncated document from its tail until it closes (at most ``max_continuations``)."""
+
+        first_usage = dict(info.get("usage") or {})
+        report = {"continuations": 0, "overlap_chars": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        finish_reason = info.get("finish_reason")
+        with span("AgentBase.continue", role=self.name) as continue_span:
+            while report["continuations"] < self.max_continuations and needs_continuation(text, finish_reason):
+                follow_up = continuation_messages(messages, text)
+                chunk, usage, finish_reason, permit_wait, _ = self._admitted_send(
+                    follow_up, model, on_delta, options, info
+                )
+                text, overlap = stitch(text, chunk)
+                text = OUTPUT_BUDGET.finish(self.name, text, options, finish_reason)
+                report["continuations"] += 1
+                report["overlap_chars"] += overlap
+                report["prompt_tokens"] += usage.get("prompt_tokens", estimate_tokens(follow_up, self.name, 0))
+                report["completion_tokens"] += usage.get("completion_tokens", int(len(chunk) / CHARS_PER_TOKEN))
+                info["governor_wait"] = round(info.get("governor_wait", 0.0) + permit_wait, 3)
+            report["complete"] = html_closed(strip_fences(text))
+            # 对比整篇重跑：原提示词 + 重新生成完整文档；续写只多付出各次续写的提示词与新增输出
+            rerun = first_usage.get("prompt_tokens", estimate_tokens(messages, self.name, 0)) + int(
+                len(text) / CHARS_PER_TOKEN
+            )
+            report["rerun_tokens"] = rerun
+            report["tokens_saved"] = rerun - report["prompt_tokens"] - report["completion_tokens"]
+            report["completion_tokens_saved"] = int(len(text) / CHARS_PER_TOKEN) - report["completion_tokens"]
+            if continue_span:
+                continue_span.set(**report)
+        info["continuation"] = report
+        info["finish_reason"] = finish_reason
+        info["usage"] = {
+            name: first_usage.get(name, 0) + report[name]
+            for name in ("prompt_tokens", "completion_tokens")
+        }
+        info["usage"]["total_tokens"] = info["usage"]["prompt_tokens"] + info["usage"]["completion_tokens"]
+        return text
+
+    def _send(self, messages, model=None, on_delta=None, options=None, info=None):
+        """Issue the request (streamed when ``on_delta`` is set); returns (text, usage, finish_reason).
+
+        Inside a batch sweep the request is answered from the batch results
+        (or queued for the next batch) instead of being sent. Otherwise the
+        request goes to an endpoint of ``self.endpoints`` and fails over to
+        the next one when the endpoint is at fault; ``info`` receives the
+        endpoint used and the endpoints that failed.
+        """
+        session = batch.current_session()
+        if session is not None:
+            text, usage, finish_reason = session.resolve(
+                self.name, {"model": model or self.model, "messages": messages, **(options or {})}
+            )
+            if on_delta is not None and text:
+                on_delta(text)  # 批量结果一次性交给流式解析器
+            return text, usage, finish_reason
+
+        info = {} if info is None else info
+        tried = []
+        while True:
+            endpoint = self.endpoints.acquire(exclude=tried)
+            started = time.perf_counter()
+            try:
+                result = self._send_to(endpoint, messages, model, on_delta, options)
+            except deadline.DeadlineExceeded:
+                self.endpoints.abandon(endpoint)
+                raise
+            except Exception as exc:
+                tried.append(endpoint)
+                failover = self.endpoints.release(endpoint, time.perf_counter() - started, exc)
+                if not failover or len(tried) >= len(self.endpoints):
+                    raise
+                self.endpoints.note_failover(endpoint)
+                info.setdefault("endpoint_failures", []).append(
+                    {"endpoint": endpoint.base_url, "error": type(exc).__name__}
+                )
+                if on_delta is not None:
+                    on_delta(None)  # 换端点重新生成，已收到的流式片段作废
+                continue
+            self.endpoints.release(endpoint, time.perf_counter() - started)
+            info["endpoint"] = endpoint.base_url
+            return result
+
+    def _send_to(self, endpoint, messages, model=None, on_delta=None, options=None):
+        """Send the request to one endpoint; returns (text, usage, finish_reason)."""
+
+        request = dict(options or {})
+        left = deadline.remaining()
+        if left is not None:
+            if left <= 0:
+                raise deadline.DeadlineExceeded(f"{self.name}: no time budget left")
+            request["timeout"] = left
+        if on_delta is not None:
+            request["stream"] = True
+            # 流式响应默认不带 usage；需要它来结算限流预扣并学习输出长度
+            request["stream_options"] = {"include_usage": True}
+        with span("network", role=self.name, model=model or self.model, endpoint=endpoint.base_url) as net_span:
+            try:
+                resp = endpoint.client.chat.completions.create(
+                    model=model or self.model,
+                    messages=messages,
+                    # response_format={"type": "json_object"} if json_mode else None,
+                    **request,
+                )
+                if on_delta is not None:
+                    text, usage, finish_reason = self._consume_stream(resp, on_delta)
+                    if net_span:
+                        net_span.set(streamed=True, finish_reason=finish_reason, **usage)
+                    return text, usage, finish_reason
+            except Exception as exc:
+                if deadline.expired():
+                    raise deadline.DeadlineExceeded(f"{self.name}: time budget exhausted") from exc
+                raise
+            usage = self._usage(resp)
+            choices = getattr(resp, "choices", None) or []
+            finish_reason = getattr(choices[0], "finish_reason", None) if choices else None
+            if net_span:
+                net_span.set(finish_reason=finish_reason, **usage)
+
+        with span("_extract_text", role=self.name):
+            return self._extract_text(resp), usage, finish_reason
+
+    def _consume_stream(self, stream, on_delta):
+        """Read a streamed completion, forwarding deltas; returns (text, usage, finish_reason)."""
+
+        chunks = []
+        usage = {}
+        finish_reason = None
+        stopped = False
+        try:
+            for event in stream:
+                usage = self._usage(event) or usage
+                for choice in getattr(event, "choices", None) or []:
+                    finish_reason = getattr(choice, "finish_reason", None) or finish_reason
+                    piece = getattr(getattr(choice, "delta", None), "content", None)
+                    if not piece:
+                        continue
+                    chunks.append(piece)
+                    if on_delta(piece):
+                        stopped = True
+                        break
+                if stopped:
+                    break
+        finally:
+            close = getattr(stream, "close", None)
+            if stopped and close is not None:
+                close()  # 已拿到所需内容，提前断开以免继续生成尾部 token
+        if stopped:
+            finish_reason = "cancelled"  # 调用方主动断开，输出不完整是预期的（不续写）
+        return "".join(chunks), usage, finish_reason
+
+    @staticmethod
+    def _usage(resp):
+        """Token usage reported by the response (empty dict when absent)."""
+        usage = getattr(resp, "usage", None)
+        if usage is None:
+            return {}
+        return {
+            name: getattr(usage, name)
+            for name in ("prompt_tokens", "completion_tokens", "total_tokens")
+            if isinstance(getattr(usage, name, None), int)
+        }
 
     def _extract_text(self, resp):
         """Normalize different SDK response shapes to a plain string."""
@@ -0,0 +1,197 @@
+"""Content-addressed, compressed artifact store for run outputs.
+
+``run.py`` used to write, for every run, a full HTML file, a pretty-printed
+bus dump that contains the same HTML again, and a resp log. Across thousands
+of experiment runs that is mostly duplicated text. The store keeps:
+
+* ``objects/<2-char prefix>/<sha256>`` – zlib-compressed blobs, written once
+  per distinct payload and shared across runs;
+* ``runs/<run_id>.json`` – a small index mapping artifact names to digests.
+
+JSON artifacts (bus dump, metrics) are stored as a skeleton in which every
+long string is replaced by ``{"$blob": digest}``, so the HTML inside the dump
+is the very same blob as the ``html`` artifact. ``materialize`` re-inlines
+them on demand. Keys of the original data that start with ``$`` are escaped
+with one more ``$``, so a user dict that happens to look like a marker (e.g.
+``{"$blob": "abc"}``) round-trips unchanged.
+
+Command line::
+
+    python -m core.artifact_store list
+    python -m core.artifact_store show <run_id> html > index.html
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List
+
+
+BLOB_KEY = "$blob"
+
+
+def _escape(key: Any) -> Any:
+    return "$" + key if isinstance(key, str) and key.startswith("$") else key
+
+
+def _unescape(key: str) -> str:
+    return key[1:] if key.startswith("$$") else key
+
+
+class ArtifactStore:
+    def __init__(
+        self,
+        root: str = "output/artifacts",
+        level: int = 6,
+        inline_threshold: int = 256,
+        cache_size: int = 64,
+    ):
+        self.root = root
+        self.level = level
+        self.inline_threshold = inline_threshold
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(root, "runs"), exist_ok=True)
+
+    # ------------------------------------------------------------------ blobs
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.root, "objects", digest[:2], digest)
+
+    def put_blob(self, data: bytes) -> str:
+        """Store ``data`` once and return its sha256 digest."""
+
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            self._atomic_write(path, zlib.compress(data, self.level))
+        return digest
+
+    def get_blob(self, digest: str) -> bytes:
+        """Return a blob's bytes (recently read blobs are kept decompressed)."""
+
+        with self._lock:
+            if digest in self._cache:
+                self._cache.move_to_end(digest)
+                return self._cache[digest]
+        with open(self._object_path(digest), "rb") as fh:
+            data = zlib.decompress(fh.read())
+        with self._lock:
+            self._cache[digest] = data
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return data
+
+    # ------------------------------------------------------------------ JSON
+    def _externalize(self, value: Any) -> Any:
+        if isinstance(value, str) and len(value) >= self.inline_threshold:
+            return {BLOB_KEY: self.put_blob(value.encode("utf-8"))}
+        if isinstance(value, dict):
+            return {_escape(k): self._externalize(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._externalize(v) for v in value]
+        return value
+
+    def _inline(self, value: Any) -> Any:
+        if isinstance(value, dict):
+            if len(value) == 1 and BLOB_KEY in value:
+                return self.get_blob(value[BLOB_KEY]).decode("utf-8")
+            return {_unescape(k): self._inline(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._inline(v) for v in value]
+        return value
+
+    def put_json(self, value: Any) -> str:
+        skeleton = self._externalize(value)
+        raw = json.dumps(skeleton, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+        return self.put_blob(raw.encode("utf-8"))
+
+    def get_json(self, digest: str) -> Any:
+        return self._inline(json.loads(self.get_blob(digest)))
+
+    # ------------------------------------------------------------------ runs
+    def save_run(self, run_id: str, meta: Dict[str, Any] | None = None, **artifacts: Any) -> Dict[str, Any]:
+        """Store a run's artifacts (str → text blob, anything else → JSON) and its index."""
+
+        entries = {}
+        for name, value in artifacts.items():
+            if isinstance(value, str):
+                entries[name] = {"kind": "text", "digest": self.put_blob(value.encode("utf-8"))}
+            else:
+                entries[name] = {"kind": "json", "digest": self.put_json(value)}
+        index = {"run_id": run_id, "created": time.time(), "meta": meta or {}, "artifacts": entries}
+        payload = json.dumps(index, ensure_ascii=False, indent=2).encode("utf-8")
+        self._atomic_write(os.path.join(self.root, "runs", f"{run_id}.json"), payload)
+        return index
+
+    def index(self, run_id: str) -> Dict[str, Any]:
+        with open(os.path.join(self.root, "runs", f"{run_id}.json"), encoding="utf-8") as fh:
+            return json.load(fh)
+
+    def runs(self) -> List[str]:
+        return sorted(name[:-5] for name in os.listdir(os.path.join(self.root, "runs")) if name.endswith(".json"))
+
+    def materialize(self, run_id: str, name: str) -> Any:
+        """Rebuild one artifact of a run (text for HTML, the original JSON otherwise)."""
+
+        entry = self.index(run_id)["artifacts"][name]
+        if entry["kind"] == "text":
+            return self.get_blob(entry["digest"]).decode("utf-8")
+        return self.get_json(entry["digest"])
+
+    def stats(self) -> Dict[str, int]:
+        """Object count and compressed bytes on disk."""
+
+        objects = 0
+        stored = 0
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, "objects")):
+            for filename in filenames:
+                objects += 1
+                stored += os.path.getsize(os.path.join(dirpath, filename))
+        return {"runs": len(self.runs()), "objects": objects, "stored_bytes": stored}
+
+    @staticmethod
+    def _atomic_write(path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Inspect the run artifact store")
+    parser.add_argument("--root", default="output/artifacts")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list")
+    sub.add_parser("stats")
+    show = sub.add_parser("show")
+    show.add_argument("run_id")
+    show.add_argument("name", help="artifact name, e.g. html / dump / resp")
+    args = parser.parse_args()
+
+    store = ArtifactStore(args.root)
+    if args.command == "list":
+        print("\n".join(store.runs()))
+    elif args.command == "stats":
+        print(json.dumps(store.stats(), indent=2))
+    else:
+        value = store.materialize(args.run_id, args.name)
+        if isinstance(value, str):
+            sys.stdout.write(value)
+        else:
+            json.dump(value, sys.stdout, ensure_ascii=False, indent=2)
@@ -0,0 +1,325 @@
+"""Offline batch-submission mode for experiment sweeps.
+
+The OP/CP sweeps in ``run.py`` do not need interactive latency, but they do
+need throughput at low cost, which is what provider batch APIs are for.
+``BatchSweep`` drives many runs stage by stage. Each round replays every
+unfinished run from its brief inside a ``BatchSession``. Every LLM call whose
+result is already known is answered from the sweep state. Calls without a
+result are collected, and the run stops at that point (``BatchPending``).
+The pending requests of all runs go into one JSONL file in the OpenAI batch
+format (``custom_id`` / ``method`` / ``url`` / ``body``). The file is
+submitted and polled, and the results are stored before the next round.
+
+Requests that failed inside a batch (lines of the batch's error file, error
+lines of its output file, requests missing from both, or every unanswered
+request of a batch that ended failed, expired or cancelled) are resubmitted in
+the next round until they have failed ``max_attempts`` times; only then is
+the error stored as their result, which fails the run that needs it.
+
+The sweep state (known results, failed attempts, finished runs, the batch in
+flight) is kept in ``state_dir``. An interrupted sweep started again with the same
+``state_dir`` resumes polling its batch and continues where it stopped.
+
+``LocalBatchEndpoint`` provides the same files/batches surface backed by a
+directory. It answers each request with a callable (by default the chat
+completions endpoint), so sweeps can be tested, or run against proxies that
+have no batch API.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import types
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from core.singleflight import request_key
+
+
+CHAT_COMPLETIONS_URL = "/v1/chat/completions"
+
+_SESSION: ContextVar["BatchSession | None"] = ContextVar("batch_session", default=None)
+
+
+class BatchPending(BaseException):
+    """Raised when a run reaches an LLM call whose batch result is not known yet.
+
+    Derives from ``BaseException`` so model failover and best-of-N error
+    handling (which catch ``Exception``) do not mistake it for a failed call.
+    """
+
+
+class BatchSession:
+    """Per-run replay scope: answers known calls, collects the unknown ones."""
+
+    def __init__(self, run_id: str, results: Dict[str, Dict[str, Any]]):
+        self.run_id = run_id
+        self.results = results
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.replayed = 0
+        self._seen: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, agent: str, body: Dict[str, Any]) -> Tuple[str, Dict[str, int], str | None]:
+        """Return (text, usage, finish_reason) for a request, or raise ``BatchPending``."""
+
+        key = request_key(self.run_id, agent, body)
+        with self._lock:
+            # 同一请求在一次运行中可能出现多次（如 best-of-N 的候选），按出现次序区分
+            occurrence = self._seen.get(key, 0)
+            self._seen[key] = occurrence + 1
+        custom_id = f"{key[:32]}-{occurrence}"
+        result = self.results.get(custom_id)
+        if result is None:
+            with self._lock:
+                self.pending[custom_id] = batch_line(custom_id, body)
+            raise BatchPending(custom_id)
+        if "error" in result:
+            raise RuntimeError(f"batch request {custom_id} failed: {result['error']}")
+        with self._lock:
+            self.replayed += 1
+        return result["text"], result.get("usage", {}), result.get("finish_reason")
+
+
+def current_session() -> BatchSession | None:
+    return _SESSION.get()
+
+
+@contextmanager
+def session_scope(session: BatchSession) -> Iterator[BatchSession]:
+    token = _SESSION.set(session)
+    try:
+        yield session
+    finally:
+        _SESSION.reset(token)
+
+
+def batch_line(custom_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    return {"custom_id": custom_id, "method": "POST", "url": CHAT_COMPLETIONS_URL, "body": body}
+
+
+def parse_output_line(line: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """Turn one batch output line into (custom_id, stored result)."""
+
+    custom_id = line.get("custom_id", "")
+    response = line.get("response") or {}
+    if line.get("error") or response.get("status_code", 200) >= 400:
+        return custom_id, {"error": line.get("error") or response.get("body")}
+    body = response.get("body") or {}
+    choice = (body.get("choices") or [{}])[0]
+    usage = {
+        name: value
+        for name, value in (body.get("usage") or {}).items()
+        if name in ("prompt_tokens", "completion_tokens", "total_tokens") and isinstance(value, int)
+    }
+    return custom_id, {
+        "text": (choice.get("message") or {}).get("content") or "",
+        "usage": usage,
+        "finish_reason": choice.get("finish_reason"),
+    }
+
+
+class LocalBatchEndpoint:
+    """Directory-backed stand-in for the provider's files + batches API.
+
+    ``complete(body) -> dict`` produces a chat completion response body for one
+    request; a batch is processed the first time it is retrieved.
+    """
+
+    def __init__(self, root: str = "output/batch/local", complete: Callable[[Dict], Dict] | None = None):
+        self.root = root
+        self.complete = complete
+        os.makedirs(root, exist_ok=True)
+        self.files = types.SimpleNamespace(create=self._create_file, content=self._file_content)
+        self.batches = types.SimpleNamespace(create=self._create_batch, retrieve=self._retrieve_batch)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def _create_file(self, file, purpose: str = "batch"):
+        name, data = file if isinstance(file, tuple) else (getattr(file, "name", "input.jsonl"), file.read())
+        file_id = "file-" + hashlib.sha256(data).hexdigest()[:24]
+        with open(self._path(file_id), "wb") as fh:
+            fh.write(data)
+        return types.SimpleNamespace(id=file_id, filename=os.path.basename(name), purpose=purpose)
+
+    def _file_content(self, file_id: str):
+        with open(self._path(file_id), "rb") as fh:
+            data = fh.read()
+        return types.SimpleNamespace(text=data.decode("utf-8"), content=data)
+
+    def _create_batch(self, input_file_id: str, endpoint: str, completion_window: str = "24h", **kwargs):
+        batch_id = f"batch-{input_file_id[5:]}"
+        meta = {"id": batch_id, "input_file_id": input_file_id, "endpoint": endpoint, "status": "validating"}
+        with open(self._path(f"{batch_id}.json"), "w", encoding="utf-8") as fh:
+            json.dump(meta, fh)
+        return types.SimpleNamespace(**meta, output_file_id=None)
+
+    def _retrieve_batch(self, batch_id: str):
+        with open(self._path(f"{batch_id}.json"), encoding="utf-8") as fh:
+            meta = json.load(fh)
+        if meta["status"] != "completed":
+            lines = self._file_content(meta["input_file_id"]).text.splitlines()
+            out, errors = [], []
+            for raw in filter(None, lines):
+                request = json.loads(raw)
+                try:
+                    body = self._complete(request["body"])
+                    out.append({"custom_id": request["custom_id"], "response": {"status_code": 200, "body": body}})
+                except Exception as exc:
+                    errors.append({"custom_id": request["custom_id"], "error": {"message": str(exc)}})
+            # 与服务商一致：失败的请求写入单独的 error 文件，没有内容的文件 id 为 None
+            for kind, records in (("output", out), ("error", errors)):
+                data = "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in records).encode("utf-8")
+                meta[f"{kind}_file_id"] = self._create_file((f"{batch_id}-{kind}.jsonl", data)).id if records else None
+            meta["status"] = "completed"
+            with open(self._path(f"{batch_id}.json"), "w", encoding="utf-8") as fh:
+                json.dump(meta, fh)
+        return types.SimpleNamespace(**{"output_file_id": None, "error_file_id": None, **meta})
+
+    def _complete(self, body: Dict) -> Dict:
+        if self.complete is not None:
+            return self.complete(body)
+        # 默认直接调用 chat completions：对没有 batch API 的代理端点同样适用
+        from openai import OpenAI
+
+        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("WEBGEN_BATCH_BASE_URL"))
+        return client.chat.completions.create(**body).model_dump()
+
+
+class BatchSweep:
+    def __init__(
+        self, client, state_dir: str = "output/batch/sweep", poll_interval: float = 30.0, max_attempts: int = 3
+    ):
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be a positive integer")
+        self.client = client
+        self.state_dir = state_dir
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self._runs: List[Tuple[str, Callable[[], Any], Any, Dict[str, Any]]] = []
+        os.makedirs(state_dir, exist_ok=True)
+        self.state = self._load()
+
+    def add(self, run_id: str, factory: Callable[[], Any], brief, **run_kwargs) -> None:
+        """Register a run: ``factory()`` builds its Manager, ``run_kwargs`` go to ``Manager.run``."""
+        self._runs.append((run_id, factory, brief, run_kwargs))
+
+    def _state_path(self) -> str:
+        return os.path.join(self.state_dir, "state.json")
+
+    def _load(self) -> Dict[str, Any]:
+        state = {"results": {}, "attempts": {}, "done": {}, "failed": {}, "inflight": None, "batches": []}
+        if os.path.exists(self._state_path()):
+            with open(self._state_path(), encoding="utf-8") as fh:
+                state.update(json.load(fh))
+        return state
+
+    def _save(self) -> None:
+        tmp = self._state_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.state, fh, ensure_ascii=False)
+        os.replace(tmp, self._state_path())
+
+    def run(self, on_done: Callable[[str, str, Dict, Any], None] | None = None) -> Dict[str, Any]:
+        """Advance all runs until every one has finished; returns the sweep summary."""
+
+        if self.state["inflight"]:
+            self._collect(self.state["inflight"])  # 续跑：先取回中断前已提交的批次
+        while True:
+            pending: Dict[str, Dict[str, Any]] = {}
+            for run_id, factory, brief, run_kwargs in self._runs:
+                if run_id in self.state["done"] or run_id in self.state["failed"]:
+                    continue
+                session = BatchSession(run_id, self.state["results"])
+                with session_scope(session):
+                    try:
+                        manager = factory()
+                        html, metrics = manager.run(brief, **run_kwargs)
+                    except BatchPending:
+                        pending.update(session.pending)
+                        continue
+                    except Exception as exc:
+                        # 单个运行失败（如批次中的请求报错）不影响其余运行
+                        self.state["failed"][run_id] = f"{type(exc).__name__}: {exc}"
+                        self._save()
+                        continue
+                self.state["done"][run_id] = {"calls": session.replayed, "finished": time.time()}
+                if on_done is not None:
+                    on_done(run_id, html, metrics, manager)
+                self._save()
+            if not pending:
+                return self.summary()
+            self._collect(self._submit(pending))
+
+    def _submit(self, pending: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        data = "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in pending.values()).encode("utf-8")
+        round_no = len(self.state["batches"]) + 1
+        with open(os.path.join(self.state_dir, f"round-{round_no}.jsonl"), "wb") as fh:
+            fh.write(data)
+        uploaded = self.client.files.create(file=(f"round-{round_no}.jsonl", data), purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id, endpoint=CHAT_COMPLETIONS_URL, completion_window="24h"
+        )
+        inflight = {
+            "id": batch.id,
+            "round": round_no,
+            "requests": len(pending),
+            "custom_ids": list(pending),
+            "submitted": time.time(),
+        }
+        self.state["inflight"] = inflight
+        self._save()
+        return inflight
+
+    def _collect(self, inflight: Dict[str, Any]) -> None:
+        while True:
+            batch = self.client.batches.retrieve(inflight["id"])
+            if batch.status in ("completed", "failed", "expired", "cancelled"):
+                break
+            time.sleep(self.poll_interval)
+        # 失败/过期/取消的批次同样结束本轮：已有的结果照常取回，其余请求计一次失败，下一轮重提
+        missing = "missing from the batch output" if batch.status == "completed" else f"batch {batch.status}"
+        answered = set()
+        for file_id in (getattr(batch, "output_file_id", None), getattr(batch, "error_file_id", None)):
+            if file_id is None:
+                continue
+            for raw in filter(None, self.client.files.content(file_id).text.splitlines()):
+                custom_id, result = parse_output_line(json.loads(raw))
+                answered.add(custom_id)
+                if "error" in result:
+                    self._failed_attempt(custom_id, result["error"])
+                else:
+                    self.state["results"][custom_id] = result
+                    self.state["attempts"].pop(custom_id, None)
+        for custom_id in inflight.get("custom_ids", []):
+            if custom_id not in answered:
+                self._failed_attempt(custom_id, missing)
+        record = {key: value for key, value in inflight.items() if key != "custom_ids"}
+        self.state["batches"].append(dict(record, status=batch.status, completed=time.time()))
+        self.state["inflight"] = None
+        self._save()
+
+    def _failed_attempt(self, custom_id: str, error: Any) -> None:
+        """Count a failed request; after ``max_attempts`` failures its error becomes the stored result."""
+
+        attempt = self.state["attempts"].setdefault(custom_id, {"count": 0, "error": None})
+        attempt["count"] += 1
+        attempt["error"] = error
+        if attempt["count"] >= self.max_attempts:
+            # 不再重提：运行回放到该请求时以错误结束（见 BatchSession.resolve）
+            self.state["results"][custom_id] = {"error": error, "attempts": attempt["count"]}
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "runs": len(self._runs),
+            "done": sum(1 for run_id, *_ in self._runs if run_id in self.state["done"]),
+            "failed": dict(self.state["failed"]),
+            "batches": len(self.state["batches"]),
+            "requests": sum(batch["requests"] for batch in self.state["batches"]),
+            "retrying": sum(1 for attempt in self.state["attempts"].values() if attempt["count"] < self.max_attempts),
+            "gave_up": sum(1 for attempt in self.state["attempts"].values() if attempt["count"] >= self.max_attempts),
+        }
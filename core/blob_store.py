@@ -0,0 +1,186 @@
+"""File-backed blob store with lightweight handles for large bus payloads.
+
+The final HTML and large specs used to exist as several full copies at once
+(the bus message, every ``chat_history()`` rendering, the ``dump()`` output).
+``BlobStore`` spools payloads above a size threshold into append-only segment
+files and hands out ``BlobHandle`` objects that only carry the location; the
+bytes are read back (and decoded) only where a prompt or a file write actually
+needs them. Identical payloads share one blob. A segment file is deleted (or,
+for the segment being written, truncated) once no live handle points into it,
+so a long-running process that handles many runs keeps a bounded footprint.
+
+The threshold defaults to 16 KiB and can be set with ``WEBGEN_BLOB_THRESHOLD``
+(``0`` disables spooling).
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import weakref
+from collections import deque
+from dataclasses import is_dataclass
+from typing import Any, Deque, Dict
+
+
+class BlobHandle:
+    """Reference to a spooled payload; ``materialize()`` returns the original value."""
+
+    __slots__ = ("store", "digest", "segment", "offset", "length", "kind", "__weakref__")
+
+    def __init__(self, store: "BlobStore", digest: str, segment: int, offset: int, length: int, kind: str):
+        self.store = store
+        self.digest = digest
+        self.segment = segment
+        self.offset = offset
+        self.length = length
+        self.kind = kind
+
+    def materialize(self) -> Any:
+        data = self.store.read(self)
+        return data.decode("utf-8") if self.kind == "text" else pickle.loads(data)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __repr__(self) -> str:
+        return f"BlobHandle({self.kind}, {self.digest[:12]}, {self.length} bytes)"
+
+
+def materialize(value: Any) -> Any:
+    """Return the payload behind a handle (other values are returned unchanged)."""
+    return value.materialize() if isinstance(value, BlobHandle) else value
+
+
+class BlobStore:
+    def __init__(self, root: str | None = None, threshold: int = 16 * 1024, segment_bytes: int = 64 * 1024 * 1024):
+        self.root = root
+        self.threshold = threshold
+        self.segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+        self._segments: Dict[int, Dict[str, Any]] = {}
+        self._active = None
+        self._next_segment = 0
+        self._released: Deque[int] = deque()
+        self._by_digest: "weakref.WeakValueDictionary[str, BlobHandle]" = weakref.WeakValueDictionary()
+        self._stored = 0
+        self._deduplicated = 0
+        self._bytes_written = 0
+
+    def spool(self, value: Any) -> Any:
+        """Return a handle for payloads at or above the threshold, otherwise ``value`` itself."""
+
+        if not self.threshold or isinstance(value, BlobHandle):
+            return value
+        if isinstance(value, str):
+            if len(value) * 4 < self.threshold:
+                return value  # UTF-8 每字符至多 4 字节，短文本无需编码即可判定
+            data, kind = value.encode("utf-8"), "text"
+        elif is_dataclass(value) or isinstance(value, (dict, list)):
+            data, kind = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), "pickle"
+        else:
+            return value
+        return self._put(data, kind) if len(data) >= self.threshold else value
+
+    def put(self, value: Any) -> BlobHandle:
+        """Spool ``value`` (``str`` as UTF-8, anything else pickled) regardless of its size."""
+
+        if isinstance(value, BlobHandle):
+            return value
+        if isinstance(value, str):
+            return self._put(value.encode("utf-8"), "text")
+        return self._put(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), "pickle")
+
+    def _put(self, data: bytes, kind: str) -> BlobHandle:
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self._reclaim()
+            existing = self._by_digest.get(digest)
+            if existing is not None and existing.kind == kind:
+                self._deduplicated += 1
+                return existing
+            segment = self._segment_for(len(data))
+            offset = segment["size"]
+            segment["file"].seek(offset)
+            segment["file"].write(data)
+            segment["file"].flush()
+            segment["size"] += len(data)
+            segment["live"] += 1
+            handle = BlobHandle(self, digest, segment["id"], offset, len(data), kind)
+            weakref.finalize(handle, self._released.append, segment["id"])
+            self._by_digest[digest] = handle
+            self._stored += 1
+            self._bytes_written += len(data)
+            return handle
+
+    def read(self, handle: BlobHandle) -> bytes:
+        with self._lock:
+            segment = self._segments[handle.segment]
+            segment["file"].seek(handle.offset)
+            return segment["file"].read(handle.length)
+
+    def _segment_for(self, size: int) -> Dict[str, Any]:
+        active = self._segments.get(self._active) if self._active is not None else None
+        if active is None or (active["size"] and active["size"] + size > self.segment_bytes):
+            if active is not None:
+                self._active = None
+                self._maybe_drop(active)
+            if self.root:
+                os.makedirs(self.root, exist_ok=True)
+            fd, path = tempfile.mkstemp(prefix=f"blobs-{self._next_segment}-", suffix=".bin", dir=self.root)
+            active = {"id": self._next_segment, "path": path, "file": os.fdopen(fd, "w+b"), "size": 0, "live": 0}
+            self._segments[active["id"]] = active
+            self._active = active["id"]
+            self._next_segment += 1
+        return active
+
+    def _reclaim(self) -> None:
+        # 句柄回收回调可能在任意位置（含持锁时）由 GC 触发，只入队，这里持锁批量处理
+        while self._released:
+            segment = self._segments.get(self._released.popleft())
+            if segment is not None:
+                segment["live"] -= 1
+                self._maybe_drop(segment)
+        active = self._segments.get(self._active) if self._active is not None else None
+        if active is not None and active["live"] == 0 and active["size"]:
+            # 活动段已无存活句柄：截断后从头复用
+            active["file"].truncate(0)
+            active["size"] = 0
+
+    def _maybe_drop(self, segment: Dict[str, Any]) -> None:
+        # 只回收已封存（不再写入）且没有存活句柄的段文件
+        if segment["live"] > 0 or segment["id"] == self._active:
+            return
+        del self._segments[segment["id"]]
+        segment["file"].close()
+        try:
+            os.remove(segment["path"])
+        except OSError:
+            pass
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            self._reclaim()
+            return {
+                "blobs_stored": self._stored,
+                "deduplicated": self._deduplicated,
+                "bytes_written": self._bytes_written,
+                "segments": len(self._segments),
+                "live_handles": sum(segment["live"] for segment in self._segments.values()),
+                "disk_bytes": sum(segment["size"] for segment in self._segments.values()),
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            for segment in list(self._segments.values()):
+                segment["file"].close()
+                try:
+                    os.remove(segment["path"])
+                except OSError:
+                    pass
+            self._segments.clear()
+            self._active = None
+
+
+BLOBS = BlobStore(threshold=int(os.environ.get("WEBGEN_BLOB_THRESHOLD", 16 * 1024)))
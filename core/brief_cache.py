@@ -0,0 +1,250 @@
+"""Near-duplicate brief cache for planning artifacts.
+
+Many briefs differ only in the product name, a price or an image URL, yet each
+one used to pay for fresh TeamLeader / PM / Architect / Project calls.
+``PlanningCache`` keeps the planning messages of earlier runs in a MinHash
+index over normalized briefs (URLs and numbers masked). When a new brief is a near-duplicate, the
+differing fields are located with a token diff (old span → new span), the
+spans are substituted in every string of the cached artifacts, and only the
+Engineer (plus anything after it) has to run.
+
+Substitution only replaces whole fields: a number never matches inside a
+longer number ("10" in "100" or "0.10") and an ASCII word never matches
+inside a longer word. A cached entry is not reused (the planning chain runs
+for real) when a changed field is a single character, when its old value
+also appears inside a longer token of the cached artifacts, or when a number
+appears there with a different unit than in the brief (e.g. "10%" while the
+brief changed "10 件").
+"""
+
+import difflib
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields, is_dataclass, replace
+from typing import Any, Dict, List, Tuple
+
+from core.similarity import MinHashIndex, normalize_text
+
+
+# 字段切分：URL、数字（价格/规格）、英文单词，其余按标点/空白切成短语
+_TOKEN = re.compile(
+    r"https?://\S+?(?=[\s，。；;、,）)]|$)"
+    r"|\d+(?:\.\d+)?"
+    r"|[A-Za-z][\w\-]*"
+    r"|[^\s\dA-Za-z，。；;：:、,!！?？()（）\"'“”‘’]+"
+)
+
+
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+
+@dataclass
+class CacheLookup:
+    hit: bool
+    similarity: float = 0.0
+    source_brief: str = ""
+    substitutions: List[Tuple[str, str]] = field(default_factory=list)
+    messages: List[Tuple[str, str, Any]] = field(default_factory=list)
+    reason: str | None = None
+
+
+def skeleton(brief: str) -> str:
+    """Normalized brief used for similarity: URLs and numbers are masked out."""
+
+    text = re.sub(r"https?://\S+?(?=[\s，。；;、,）)]|$)", " url ", brief or "")
+    return normalize_text(re.sub(r"\d+(?:\.\d+)?", "0", text))
+
+
+def _tokens(text: str) -> List[Tuple[str, int, int]]:
+    return [(m.group(0), m.start(), m.end()) for m in _TOKEN.finditer(text)]
+
+
+def field_substitutions(old: str, new: str) -> List[Tuple[str, str]] | None:
+    """Changed fields between two briefs as (old, new) spans.
+
+    Returns ``None`` when the briefs differ structurally (inserted or deleted
+    fields), because such changes cannot be carried over by substitution.
+    """
+
+    old_tokens, new_tokens = _tokens(old), _tokens(new)
+    matcher = difflib.SequenceMatcher(
+        a=[t[0] for t in old_tokens], b=[t[0] for t in new_tokens], autojunk=False
+    )
+    substitutions = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        if tag != "replace":
+            return None
+        if i2 - i1 == j2 - j1:
+            pairs = zip(old_tokens[i1:i2], new_tokens[j1:j2])
+            substitutions.extend((a[0], b[0]) for a, b in pairs)
+        else:
+            substitutions.append(
+                (old[old_tokens[i1][1]: old_tokens[i2 - 1][2]], new[new_tokens[j1][1]: new_tokens[j2 - 1][2]])
+            )
+    # 长的先替换，避免短字段（如价格 "9"）破坏包含它的长字段（如 "99.9"）
+    substitutions = list(dict.fromkeys(substitutions))
+    substitutions.sort(key=lambda pair: len(pair[0]), reverse=True)
+    return substitutions
+
+
+def _edge(char: str, lookbehind: bool) -> str:
+    """Boundary assertion for a field edge: digits and ASCII words must not continue."""
+
+    if char.isdigit():
+        return r"(?<![\d.])" if lookbehind else r"(?![\d]|\.\d)"
+    if char.isascii() and (char.isalnum() or char == "_"):
+        return r"(?<![A-Za-z0-9_])" if lookbehind else r"(?![A-Za-z0-9_])"
+    return ""
+
+
+def field_pattern(value: str) -> str:
+    """Regex matching ``value`` only as a whole field (see module docstring)."""
+    return _edge(value[0], True) + re.escape(value) + _edge(value[-1], False)
+
+
+def _strings(value: Any):
+    if isinstance(value, str):
+        yield value
+    elif is_dataclass(value) and not isinstance(value, type):
+        for f in fields(value):
+            yield from _strings(getattr(value, f.name))
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _strings(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _strings(item)
+
+
+def _units(text: str, value: str) -> set:
+    """Characters that directly follow whole-field occurrences of ``value`` (spaces skipped)."""
+    return {text[m.end():].lstrip()[:1] for m in re.finditer(field_pattern(value), text)}
+
+
+def unsafe_substitution(source: str, value: Any, substitutions: List[Tuple[str, str]]) -> str | None:
+    """Why substituting into ``value`` could corrupt it (None when every change is a clean field swap)."""
+
+    texts = list(_strings(value))
+    for old, _ in substitutions:
+        if len(old.strip()) < 2:
+            return f"field {old!r} is too short to substitute safely"
+        pattern = re.compile(field_pattern(old))
+        for text in texts:
+            if text.count(old) != len(pattern.findall(text)):
+                return f"{old!r} also appears inside a longer value"
+        if _NUMBER.fullmatch(old):
+            allowed = _units(source, old)
+            for text in texts:
+                if not _units(text, old) <= allowed:
+                    return f"{old!r} appears with a different unit than in the brief"
+    return None
+
+
+def substitute(value: Any, substitutions: List[Tuple[str, str]]) -> Any:
+    """Apply the field substitutions to every string inside a payload (one pass, whole fields only)."""
+
+    if not substitutions:
+        return value
+    replacements = dict(substitutions)
+    pattern = re.compile("|".join(field_pattern(old) for old, _ in substitutions))
+    return _substitute(value, pattern, replacements)
+
+
+def _substitute(value: Any, pattern: re.Pattern, replacements: Dict[str, str]) -> Any:
+    if isinstance(value, str):
+        return pattern.sub(lambda match: replacements[match.group(0)], value)
+    if is_dataclass(value) and not isinstance(value, type):
+        return replace(
+            value, **{f.name: _substitute(getattr(value, f.name), pattern, replacements) for f in fields(value)}
+        )
+    if isinstance(value, dict):
+        return {k: _substitute(v, pattern, replacements) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_substitute(v, pattern, replacements) for v in value]
+    return value
+
+
+class PlanningCache:
+    def __init__(self, threshold: float = 0.6, max_entries: int = 256):
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError("threshold must be in (0, 1]")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[str, List[Tuple[str, str, Any]]]]" = OrderedDict()
+        self._index = MinHashIndex(k=3)
+        self._hits = 0
+        self._misses = 0
+        self._rejected = 0
+        self._unsafe = 0
+
+    @staticmethod
+    def _key(brief: str, namespace: str) -> str:
+        return f"{namespace}\x00{normalize_text(brief)}"
+
+    def lookup(self, brief: str, namespace: str = "") -> CacheLookup:
+        """Find a near-duplicate earlier brief and return its substituted planning messages."""
+
+        candidates = self._index.query(skeleton(brief), self.threshold, limit=10)
+        with self._lock:
+            entries = [(key, score, self._entries.get(key)) for key, score in candidates]
+        reason = "no similar brief"
+        for key, score, entry in entries:
+            if entry is None or not key.startswith(f"{namespace}\x00"):
+                continue
+            source, messages = entry
+            substitutions = field_substitutions(source, brief)
+            if substitutions is None:
+                reason = "similar brief differs structurally"
+                continue
+            unsafe = unsafe_substitution(source, [content for _, _, content in messages], substitutions)
+            if unsafe is not None:
+                reason = f"unsafe substitution: {unsafe}"
+                continue
+            with self._lock:
+                self._hits += 1
+                self._entries.move_to_end(key)
+            return CacheLookup(
+                hit=True,
+                similarity=round(score, 3),
+                source_brief=source,
+                substitutions=substitutions,
+                messages=[(topic, sender, substitute(content, substitutions)) for topic, sender, content in messages],
+            )
+        with self._lock:
+            self._misses += 1
+            if reason == "similar brief differs structurally":
+                self._rejected += 1
+            elif reason != "no similar brief":
+                self._unsafe += 1
+        return CacheLookup(hit=False, reason=reason)
+
+    def store(self, brief: str, messages: List[Tuple[str, str, Any]], namespace: str = "") -> None:
+        """Remember the planning messages (topic, sender, content) produced for a brief."""
+
+        key = self._key(brief, namespace)
+        with self._lock:
+            self._entries[key] = (brief, list(messages))
+            self._entries.move_to_end(key)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[0])
+        for old_key in evicted:
+            self._index.remove(old_key)
+        self._index.add(key, skeleton(brief))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "structural_rejects": self._rejected,
+                "unsafe_substitution_rejects": self._unsafe,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+                "threshold": self.threshold,
+            }
@@ -0,0 +1,89 @@
+"""Continuation of truncated document outputs.
+
+A page that hits the model's output limit used to come back cut off in the
+middle of a tag, and the only remedy was to rerun the pipeline. For roles that
+produce a document (``CONTINUABLE``) a completion that stopped with
+``finish_reason == "length"``, or whose HTML is structurally unclosed, is
+continued instead (a page that is already closed, possibly inside a markdown
+fence, is not). The request is re-sent with the tail of the text so far as
+the assistant's previous turn, plus an instruction to go on exactly where it
+stopped. Each continuation chunk is stitched on with overlap deduplication
+(models like to repeat the last line or two). This repeats until the document
+closes or ``max_continuations`` is reached.
+
+The report records the number of continuations, their token usage, and an
+estimate of what a full rerun would have cost. The rerun estimate is the
+original prompt plus the whole document regenerated.
+"""
+
+import re
+from typing import Dict, List, Tuple
+
+
+# 产出完整文档的角色：截断时续写而不是整体重跑
+CONTINUABLE = {"Engineer"}
+
+CONTINUE_PROMPT = (
+    "你上一条回复因长度限制在中途被截断（上面是其末尾部分）。"
+    "请从截断处紧接着继续输出剩余内容，直到文档完整结束（以 </html> 结尾）；"
+    "不要重复已输出的内容，不要从头开始，不要添加任何解释或代码块标记。"
+)
+
+_FENCE = re.compile(r"^\s*```[\w-]*\s*\n?|\n?```\s*$")
+
+
+def html_closed(text: str) -> bool:
+    """Whether an HTML document ends properly (``</html>``, no unclosed script/style)."""
+
+    lower = (text or "").lower().rstrip()
+    if not lower.endswith("</html>"):
+        return False
+    return all(lower.count(f"<{tag}") <= lower.count(f"</{tag}>") for tag in ("script", "style"))
+
+
+def strip_fences(text: str) -> str:
+    """Remove a markdown code fence around (or at either end of) a completion."""
+    return _FENCE.sub("", text or "")
+
+
+def needs_continuation(text: str, finish_reason: str | None) -> bool:
+    if finish_reason == "cancelled":
+        return False  # 调用方主动断开的流（如 best-of-N 中被取消的候选）
+    # 包在代码块标记中的完整页面同样算已闭合（未启用 OUTPUT_BUDGET 时标记不会被去掉）
+    text = strip_fences(text)
+    if html_closed(text):
+        return False  # 恰好在 </html> 处达到上限的页面已经完整
+    if finish_reason == "length":
+        return True
+    # 未标记截断但文档明显未闭合（如网关吞掉了 finish_reason）
+    return "<html" in text.lower()
+
+
+def continuation_messages(messages: List[Dict], text: str, tail_chars: int = 4000) -> List[Dict]:
+    """Original messages + the tail of the truncated output + the continue instruction."""
+
+    tail = text[-tail_chars:]
+    return [
+        *messages,
+        {"role": "assistant", "content": [{"type": "text", "text": tail}]},
+        {"role": "user", "content": [{"type": "text", "text": CONTINUE_PROMPT}]},
+    ]
+
+
+def stitch(previous: str, chunk: str, max_overlap: int = 2000, min_overlap: int = 12) -> Tuple[str, int]:
+    """Append ``chunk`` to ``previous``, dropping a repeated overlap; returns (text, overlap chars)."""
+
+    chunk = strip_fences(chunk)
+    if chunk.lstrip().lower().startswith(("<!doctype", "<html")) and "<html" in previous.lower():
+        # 模型没有续写而是从头重写：以新文档为准
+        return chunk, 0
+    window = previous[-max_overlap:]
+    for size in range(min(len(window), len(chunk)), min_overlap - 1, -1):
+        if window.endswith(chunk[:size]):
+            return previous + chunk[size:], size
+    # 续写常从截断行的行首重新开始：用新行替换被截断的半行
+    last_line = previous.rsplit("\n", 1)[-1]
+    partial = last_line.strip()
+    if len(partial) >= 4 and chunk.lstrip().startswith(partial):
+        return previous[: len(previous) - len(last_line)] + chunk.lstrip("\n"), len(last_line)
+    return previous + chunk, 0
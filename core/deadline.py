@@ -0,0 +1,98 @@
+"""Time budgets for Manager runs.
+
+``Manager.run(brief, deadline=...)`` opens a ``budget`` scope; every LLM call
+made inside it reads ``remaining()`` and sends it as the request timeout, so
+the budget propagates to each step without threading it through every
+agent's ``process`` signature. ``StepLatencyHistory`` keeps rolling step
+durations so the Manager can tell, before starting the planning chain,
+whether it can still afford it.
+"""
+
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, Iterator
+
+
+# 冷启动（某步骤尚无历史耗时）时为其预留的剩余预算比例
+DEFAULT_RESERVE_SHARE = float(os.getenv("WEBGEN_DEFAULT_RESERVE_SHARE") or 0.5)
+
+_EXPIRES_AT: ContextVar[float | None] = ContextVar("deadline_expires_at", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a step cannot start or finish within the remaining budget."""
+
+
+@contextmanager
+def budget(seconds: float | None) -> Iterator[None]:
+    """Limit the enclosed block to ``seconds`` (nested scopes keep the tighter one)."""
+
+    if seconds is None:
+        yield
+        return
+    expires_at = time.monotonic() + seconds
+    outer = _EXPIRES_AT.get()
+    if outer is not None:
+        expires_at = min(expires_at, outer)
+    token = _EXPIRES_AT.set(expires_at)
+    try:
+        yield
+    finally:
+        _EXPIRES_AT.reset(token)
+
+
+def remaining() -> float | None:
+    """Seconds left in the active budget, or None when no budget is set."""
+    expires_at = _EXPIRES_AT.get()
+    return None if expires_at is None else expires_at - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+class StepLatencyHistory:
+    def __init__(self, window: int = 50, quantile: float = 0.75):
+        self.window = window
+        self.quantile = quantile
+        self._lock = threading.Lock()
+        self._durations: Dict[str, Deque[float]] = {}
+
+    def record(self, step: str, seconds: float) -> None:
+        with self._lock:
+            self._durations.setdefault(step, deque(maxlen=self.window)).append(seconds)
+
+    def estimate(self, step: str) -> float | None:
+        """Pessimistic (upper-quantile) duration estimate, None without history."""
+        with self._lock:
+            samples = sorted(self._durations.get(step, ()))
+        if not samples:
+            return None
+        if len(samples) == 1:
+            return samples[0]
+        return statistics.quantiles(samples, n=100, method="inclusive")[int(self.quantile * 100) - 1]
+
+    def reserve(self, step: str, left: float, share: float | None = None) -> float:
+        """Seconds to hold back for ``step``: its estimate, or a share of ``left`` without history."""
+        estimate = self.estimate(step)
+        if estimate is not None:
+            return estimate
+        return max(0.0, left) * (DEFAULT_RESERVE_SHARE if share is None else share)
+
+    def stats(self) -> Dict[str, Dict[str, float | int]]:
+        with self._lock:
+            keys = list(self._durations)
+        return {
+            key: {"samples": len(self._durations[key]), "estimate": round(self.estimate(key), 3)}
+            for key in keys
+        }
+
+
+# 进程级历史：run.py 每次实验都会新建 Manager，历史耗时需要跨实例保留
+STEP_LATENCIES = StepLatencyHistory()
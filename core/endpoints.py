@@ -0,0 +1,270 @@
+"""Pool of OpenAI-compatible endpoints with health checks and load balancing.
+
+Every agent used to talk to one hard-coded gateway, so a single slow or
+failing gateway stalled all roles. ``EndpointPool`` holds one client per
+configured ``base_url`` and picks an endpoint for each request:
+
+* ``least_outstanding`` – fewest requests in flight (ties: lower EWMA latency);
+* ``ewma`` – lowest EWMA latency weighted by the requests in flight
+  ("peak EWMA"), so a fast endpoint is preferred until it queues up.
+
+Every endpoint has a circuit breaker. ``failure_threshold`` consecutive
+endpoint failures (connection errors, timeouts, 408/429/5xx) open it. An open
+endpoint gets no traffic for ``cooldown`` seconds. After that it is half-open
+and admits a single trial request: success closes the breaker again, failure
+re-opens it. These are passive checks. Active checks run in the background
+when ``probe_interval`` is set: every endpoint gets a cheap ``models.list()``
+request, and the result feeds the same breaker, so a recovered gateway comes
+back without user traffic having to find out.
+
+A failed request moves on to the next endpoint (``AgentBase._send``) only when
+the endpoint is at fault: a transport error (connection failure or timeout) or
+a retryable/5xx status. Client errors such as 400 are not retried, since
+another gateway would reject them the same way. Any other exception, such as
+a bug in the caller or its ``on_delta`` callback, is re-raised without touching
+the breaker.
+
+Configuration: ``WEBGEN_ENDPOINTS`` (comma-separated base URLs),
+``WEBGEN_LB_STRATEGY`` and ``WEBGEN_HEALTH_INTERVAL`` (seconds, 0 = off).
+"""
+
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List
+
+from core.deadline import DeadlineExceeded
+
+
+DEFAULT_BASE_URL = "http://98.81.169.220:3000/v1"
+
+# 这些状态码说明是端点（网关）的问题，换一个端点重试有意义
+RETRYABLE_STATUS = {408, 409, 429}
+
+# 传输层异常（openai / httpx 的连接与超时错误），按类名识别以免在此导入 openai
+TRANSPORT_ERRORS = {"APIConnectionError", "APITimeoutError", "TransportError", "TimeoutException"}
+
+
+def is_endpoint_failure(exc: BaseException) -> bool:
+    """Whether an exception is the endpoint's fault (worth failing over)."""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    if isinstance(exc, DeadlineExceeded):
+        return False  # 本地时间预算耗尽，与端点无关
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    return any(cls.__name__ in TRANSPORT_ERRORS for cls in type(exc).__mro__)
+
+
+class Endpoint:
+    def __init__(self, base_url: str, client, window: int = 200):
+        self.base_url = base_url
+        self.client = client
+        self.outstanding = 0
+        self.ewma: float | None = None
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial = False
+        self.requests = 0
+        self.errors = 0
+        self.failovers = 0
+        self.probes = {"ok": 0, "failed": 0}
+        self.latencies: Deque[float] = deque(maxlen=window)
+
+
+class EndpointPool:
+    def __init__(
+        self,
+        base_urls: List[str],
+        api_key: str | None = None,
+        strategy: str = "least_outstanding",
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        probe_interval: float | None = None,
+        alpha: float = 0.3,
+        client_factory: Callable[[str], object] | None = None,
+        probe: Callable[[object], object] | None = None,
+    ):
+        if not base_urls:
+            raise ValueError("EndpointPool needs at least one base_url")
+        if strategy not in ("least_outstanding", "ewma"):
+            raise ValueError(f"Unknown load balancing strategy: {strategy}")
+        if client_factory is None:
+            from openai import OpenAI  # 仅默认客户端需要 openai；注入 client_factory 时不依赖它
+
+            def client_factory(url):
+                return OpenAI(api_key=api_key, base_url=url)
+
+        self.endpoints = [Endpoint(url, client_factory(url)) for url in dict.fromkeys(base_urls)]
+        self.strategy = strategy
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self.probe = probe or (lambda client: client.models.list())
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._prober: threading.Thread | None = None
+        if probe_interval:
+            self.start_health_checks(probe_interval)
+
+    @property
+    def primary(self) -> Endpoint:
+        return self.endpoints[0]
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    def _available(self, endpoint: Endpoint, now: float) -> bool:
+        if endpoint.state == "closed":
+            return True
+        if endpoint.state == "open" and now - endpoint.opened_at >= self.cooldown:
+            endpoint.state = "half_open"
+            endpoint.trial = False
+        # 半开状态同一时间只放行一个试探请求
+        return endpoint.state == "half_open" and not endpoint.trial
+
+    def _load(self, endpoint: Endpoint, optimistic: float):
+        latency = optimistic if endpoint.ewma is None else endpoint.ewma
+        if self.strategy == "ewma":
+            return (latency * (endpoint.outstanding + 1), endpoint.outstanding)
+        return (endpoint.outstanding, latency)
+
+    def acquire(self, exclude=()) -> Endpoint:
+        """Pick an endpoint for one request (endpoints in ``exclude`` were already tried)."""
+
+        with self._lock:
+            now = time.monotonic()
+            remaining = [endpoint for endpoint in self.endpoints if endpoint not in exclude] or list(self.endpoints)
+            candidates = [endpoint for endpoint in remaining if self._available(endpoint, now)]
+            if candidates:
+                known = [endpoint.ewma for endpoint in candidates if endpoint.ewma is not None]
+                # 尚无延迟样本的端点按已知最快者乐观估计，保证会被探索
+                optimistic = min(known) if known else 0.0
+                chosen = min(candidates, key=lambda endpoint: self._load(endpoint, optimistic))
+            else:
+                # 全部熔断：仍尝试最早熔断（最可能已恢复）的端点，而不是直接失败
+                chosen = min(remaining, key=lambda endpoint: endpoint.opened_at)
+            if chosen.state == "half_open":
+                chosen.trial = True
+            chosen.outstanding += 1
+            chosen.requests += 1
+            return chosen
+
+    def release(self, endpoint: Endpoint, latency: float, error: BaseException | None = None) -> bool:
+        """Record the outcome of a request; returns True when it should fail over."""
+
+        failed = error is not None and is_endpoint_failure(error)
+        with self._lock:
+            endpoint.outstanding = max(0, endpoint.outstanding - 1)
+            endpoint.trial = False
+            if error is not None and not failed:
+                return False
+            self._observe(endpoint, latency, ok=not failed)
+        return failed
+
+    def abandon(self, endpoint: Endpoint) -> None:
+        """Release a request that ended for reasons unrelated to the endpoint (e.g. our time budget)."""
+        with self._lock:
+            endpoint.outstanding = max(0, endpoint.outstanding - 1)
+            endpoint.trial = False
+
+    def _observe(self, endpoint: Endpoint, latency: float | None, ok: bool, probe: bool = False) -> None:
+        if ok:
+            endpoint.failures = 0
+            endpoint.state = "closed"
+            if latency is not None:
+                endpoint.latencies.append(latency)
+                endpoint.ewma = latency if endpoint.ewma is None else (
+                    self.alpha * latency + (1 - self.alpha) * endpoint.ewma
+                )
+            return
+        if not probe:
+            endpoint.errors += 1
+        endpoint.failures += 1
+        if endpoint.state == "half_open" or endpoint.failures >= self.failure_threshold:
+            endpoint.state = "open"
+            endpoint.opened_at = time.monotonic()
+
+    def note_failover(self, endpoint: Endpoint) -> None:
+        with self._lock:
+            endpoint.failovers += 1
+
+    def check(self) -> None:
+        """Run one active health check against every endpoint."""
+
+        for endpoint in self.endpoints:
+            try:
+                self.probe(endpoint.client)
+                ok = True
+            except Exception:
+                ok = False
+            with self._lock:
+                endpoint.probes["ok" if ok else "failed"] += 1
+                if ok and endpoint.state != "closed":
+                    # 探活成功：熔断端点进入半开，由下一个真实请求确认
+                    endpoint.state = "half_open"
+                    endpoint.trial = False
+                elif not ok:
+                    self._observe(endpoint, None, ok=False, probe=True)
+
+    def start_health_checks(self, interval: float) -> None:
+        if self._prober is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                self.check()
+
+        self._prober = threading.Thread(target=loop, name="endpoint-health", daemon=True)
+        self._prober.start()
+
+    def close(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Dict]:
+        """Per-endpoint breaker state, load, latency percentiles and error counts."""
+
+        with self._lock:
+            report = {}
+            for endpoint in self.endpoints:
+                ordered = sorted(endpoint.latencies)
+                report[endpoint.base_url] = {
+                    "state": endpoint.state,
+                    "outstanding": endpoint.outstanding,
+                    "requests": endpoint.requests,
+                    "errors": endpoint.errors,
+                    "error_rate": round(endpoint.errors / endpoint.requests, 3) if endpoint.requests else 0.0,
+                    "failovers": endpoint.failovers,
+                    "ewma_latency": round(endpoint.ewma, 3) if endpoint.ewma is not None else None,
+                    "p50_latency": round(statistics.median(ordered), 3) if ordered else None,
+                    "p95_latency": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 3) if ordered else None,
+                    "probes": dict(endpoint.probes),
+                }
+            return report
+
+
+_POOLS: Dict[str, EndpointPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def shared_pool(api_key: str | None) -> EndpointPool:
+    """Process-wide pool for ``api_key`` built from the environment (health state is shared by all agents)."""
+
+    with _POOLS_LOCK:
+        pool = _POOLS.get(api_key or "")
+        if pool is None:
+            urls = [url.strip() for url in os.getenv("WEBGEN_ENDPOINTS", DEFAULT_BASE_URL).split(",") if url.strip()]
+            pool = EndpointPool(
+                urls,
+                api_key=api_key,
+                strategy=os.getenv("WEBGEN_LB_STRATEGY", "least_outstanding"),
+                probe_interval=float(os.getenv("WEBGEN_HEALTH_INTERVAL") or 0) or None,
+            )
+            _POOLS[api_key or ""] = pool
+        return pool
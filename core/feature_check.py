@@ -0,0 +1,132 @@
+"""Fast offline checker for required page features.
+
+Some Engineer outputs miss features the brief asks for (cart sidebar,
+countdown, coupon center, ...). ``FeatureChecker`` is built from the
+``PageSpec.components`` ids and from the feature modules the brief mentions,
+and scores a generated page with plain regular expressions — cheap enough to
+run on every best-of-N candidate as soon as it completes.
+
+A feature only counts when the page really implements it. Its markup patterns
+must match the page's elements, usually an id/class naming the widget, with
+script, style and comment text removed. Its script patterns must match the
+inline scripts plus the start tags that carry ``on*=`` handlers. Typically that
+means a click handler, the state change it makes, and a reference to the
+widget. A word in the copy or a CSS selector alone does not count.
+"""
+
+import re
+from dataclasses import asdict, dataclass, field, is_dataclass
+from typing import Dict, List, Tuple
+
+
+def _element(names: str) -> str:
+    """An element whose id or class contains one of ``names``."""
+    return rf"<[a-z][^>]*\b(?:id|class)\s*=\s*[\"'][^\"']*(?:{names})"
+
+
+# 事件处理：脚本中注册的监听器或内联 on* 属性
+_HANDLER = r"addEventListener\s*\(\s*[\"'](?:click|input|change|submit)[\"']|\bon(?:click|input|change|submit)\s*="
+
+# 功能模块：(brief 中的触发关键词, 元素标记须命中的正则, 脚本须命中的正则)
+FEATURE_CATALOG: Dict[str, Tuple[List[str], List[str], List[str]]] = {
+    "cart_sidebar": (
+        ["购物车侧栏", "购物车"],
+        [_element("cart|购物车")],
+        [
+            _HANDLER,
+            r"classList\s*\.\s*(?:toggle|add)\s*\(|\.style\.(?:display|transform|right|left|visibility)\s*=",
+            r"cart|购物车",
+        ],
+    ),
+    "quantity_stepper": (
+        ["数量增减"],
+        [_element("qty|quantity|stepper|数量")],
+        [_HANDLER, r"\+\+|--|[+-]=\s*\d|[+-]\s*1\b|stepUp|stepDown", r"qty|quantity|stepper|数量"],
+    ),
+    "local_storage": (["localStorage"], [], [r"localStorage\s*\.\s*(?:setItem|getItem)\s*\("]),
+    "buy_now": (
+        ["立即购买"],
+        [r"<(?:button|a)\b[^>]*>\s*(?:<[^>]+>\s*)*(?:立即购买|buy\s*now)|" + _element("buy-?now")],
+        [],
+    ),
+    "countdown": (
+        ["倒计时"],
+        [_element("countdown|timer|倒计时")],
+        [r"\b(?:setInterval|setTimeout|requestAnimationFrame)\s*\("],
+    ),
+    "stock": (["库存"], [_element("stock|inventory") + r"|库存\s*[:：]?\s*\d|(?:仅剩|剩余)\s*\d"], []),
+    "coupon_center": (["领券", "优惠券"], [_element("coupon|领券|优惠券")], [_HANDLER, r"coupon|领券|优惠券"]),
+    "reviews": (["评价", "评论"], [_element("review|comment|rating|评价|评论")], []),
+    "collapsible_detail": (
+        ["折叠", "展开"],
+        [r"<details\b|" + _element("collaps|accordion|expand|fold|折叠")],
+        [],
+    ),
+}
+
+_SCRIPT = re.compile(r"<script\b[^>]*>(.*?)</script>", re.IGNORECASE | re.DOTALL)
+_NON_MARKUP = re.compile(r"<(script|style)\b[^>]*>.*?</\1>|<!--.*?-->", re.IGNORECASE | re.DOTALL)
+# 带内联 on* 处理器的开始标签（整个标签，以便按元素的 id/class 关联处理器）
+_INLINE_HANDLER = re.compile(r"<[a-z][^>]*\bon[a-z]+\s*=[^>]*>", re.IGNORECASE)
+
+
+@dataclass
+class FeatureCheckResult:
+    passed: bool
+    score: float
+    missing_features: List[str] = field(default_factory=list)
+    missing_components: List[str] = field(default_factory=list)
+
+
+class FeatureChecker:
+    def __init__(
+        self,
+        features: List[str],
+        component_ids: List[str],
+        component_coverage: float = 0.8,
+    ):
+        self.features = features
+        self.component_ids = component_ids
+        self.component_coverage = component_coverage
+        self._patterns = {
+            name: tuple([re.compile(p, re.IGNORECASE) for p in patterns] for patterns in FEATURE_CATALOG[name][1:])
+            for name in features
+        }
+
+    @classmethod
+    def from_inputs(cls, page_spec=None, brief: str | None = None, **kwargs) -> "FeatureChecker":
+        """Required features come from the brief's keywords, components from the PageSpec."""
+
+        if is_dataclass(page_spec):
+            page_spec = asdict(page_spec)
+        components = (page_spec or {}).get("components", []) if isinstance(page_spec, dict) else []
+        component_ids = [c.get("id", "") for c in components if isinstance(c, dict) and c.get("id")]
+        brief = brief or ""
+        features = [
+            name for name, (keywords, *_) in FEATURE_CATALOG.items() if any(k in brief for k in keywords)
+        ]
+        return cls(features, component_ids, **kwargs)
+
+    def check(self, html: str) -> FeatureCheckResult:
+        html = html or ""
+        lowered = html.lower()
+        markup = _NON_MARKUP.sub("", html)
+        script = "\n".join(_SCRIPT.findall(html) + _INLINE_HANDLER.findall(markup))
+        missing_features = [
+            name
+            for name, (markup_patterns, script_patterns) in self._patterns.items()
+            if not (all(p.search(markup) for p in markup_patterns) and all(p.search(script) for p in script_patterns))
+        ]
+        missing_components = [cid for cid in self.component_ids if cid.lower() not in lowered]
+
+        feature_score = 1 - len(missing_features) / len(self.features) if self.features else 1.0
+        coverage = 1 - len(missing_components) / len(self.component_ids) if self.component_ids else 1.0
+        closed = "</html>" in lowered
+        passed = closed and not missing_features and coverage >= self.component_coverage
+        score = round((feature_score + coverage) / 2 * (1.0 if closed else 0.5), 3)
+        return FeatureCheckResult(
+            passed=passed,
+            score=score,
+            missing_features=missing_features,
+            missing_components=missing_components,
+        )
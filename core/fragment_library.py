@@ -0,0 +1,409 @@
+"""Reusable component fragment library.
+
+Briefs keep asking for the same marketing widgets (quantity stepper,
+localStorage cart, countdown, coupon center, review list) and the Engineer
+regenerated them from scratch every time. ``FragmentLibrary`` stores
+validated HTML/CSS/JS under the component's similarity text (id, root tag and
+content hints, see ``component_text``) and finds matching fragments for a new
+PageSpec through a MinHash index over that same text, so the Engineer
+can adapt a cached implementation or have it spliced in verbatim (it then
+only emits a ``<!-- fragment:<id> -->`` marker instead of the code).
+
+A fragment's CSS is every rule whose selectors only target the component's
+ids/classes, including those inside ``@media``/``@supports`` blocks (kept in
+their block), plus the ``@keyframes`` its animations use.
+
+A fragment's JS is every top-level script statement that targets the
+component's ids/classes (function declarations, listener registrations,
+timers), plus the declarations those statements use and the statements that
+use the component's variables. When that code also targets elements outside
+the component, the fragment is not ``self_contained`` and is only ever
+offered for adaptation, never spliced verbatim. The library keeps at most
+``max_fragments`` entries and evicts the least recently matched.
+
+In streaming mode the Manager subscribes ``prefetch`` to ``page_spec.partial``,
+so each component is looked up while the Architect is still generating the
+rest of the PageSpec and ``match`` only collects the results.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, is_dataclass
+from html.parser import HTMLParser
+from typing import Dict, List, Set, Tuple
+
+from core.html_audit import VOID_TAGS, block_after
+from core.similarity import MinHashIndex
+
+
+MARKER = "<!-- fragment:{id} -->"
+_MARKER_RE = re.compile(r"<!--\s*fragment:([\w\-]+)\s*-->")
+_DECLARATION = re.compile(r"^\s*(?:async\s+)?(?:function\s*\*?\s*([\w$]+)|(const|let|var)\s+([\w$]+))")
+_IDENTIFIER = re.compile(r"(?<![\w$.])[A-Za-z_$][\w$]*")
+_STRING = re.compile(r"'((?:[^'\\\n]|\\.)*)'|\"((?:[^\"\\\n]|\\.)*)\"|`((?:[^`\\]|\\.)*)`")
+_CONTINUATION = re.compile(r"[.)\]?:+\-*/%&|^=,;(\[]|(?:else|catch|finally|while)\b")
+_DOM_LOOKUP = re.compile(r"getElementById\(\s*['\"`]([\w-]+)|getElementsByClassName\(\s*['\"`]([\w-]+)")
+_ANIMATION = re.compile(r"animation(?:-name)?\s*:\s*([^;}]+)", re.I)
+# 内含普通规则的条件分组 at-rule：保留块内针对组件的规则
+_GROUPING_RULES = ("@media", "@supports", "@container", "@layer")
+
+
+@dataclass
+class ComponentFragment:
+    component_id: str
+    content_hint: str
+    html: str
+    css: str = ""
+    js: str = ""
+    uses: int = 0
+    created: float = 0.0
+    self_contained: bool = True
+
+    @property
+    def key(self) -> str:
+        digest = hashlib.sha1((self.html + self.css + self.js).encode("utf-8")).hexdigest()[:10]
+        return f"{self.component_id}#{digest}"
+
+
+def component_text(component) -> str:
+    """Similarity text of a PageSpec component: id, root tag and content hints."""
+
+    if is_dataclass(component):
+        component = asdict(component)
+    hints = " ".join(child.get("content_hint", "") for child in component.get("children", []))
+    return f"{component.get('id', '').replace('-', ' ')} {component.get('html', '')} {hints}"
+
+
+class _ElementLocator(HTMLParser):
+    """Find the source span of the element whose id (or class) is ``target``."""
+
+    def __init__(self, source: str, target: str):
+        super().__init__(convert_charrefs=True)
+        self.source = source
+        self.target = target
+        self.line_offsets = [0]
+        for line in source.splitlines(keepends=True):
+            self.line_offsets.append(self.line_offsets[-1] + len(line))
+        self.depth = 0
+        self.start = None
+        self.start_depth = None
+        self.span = None
+        self.classes = set()
+        self.ids = set()
+
+    def _offset(self) -> int:
+        line, col = self.getpos()
+        return self.line_offsets[line - 1] + col
+
+    def handle_starttag(self, tag, attrs):
+        attributes = {name: (value or "") for name, value in attrs}
+        if self.span is None and self.start is None:
+            if attributes.get("id") == self.target or self.target in attributes.get("class", "").split():
+                self.start = self._offset()
+                self.start_depth = self.depth
+        if self.start is not None and self.span is None:
+            self.classes.update(attributes.get("class", "").split())
+            if attributes.get("id"):
+                self.ids.add(attributes["id"])
+        if tag not in VOID_TAGS:
+            self.depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS:
+            return
+        self.depth -= 1
+        if self.start is not None and self.span is None and self.depth == self.start_depth:
+            end = self.source.find(">", self._offset()) + 1
+            self.span = (self.start, end)
+
+
+def extract_fragment(html: str, component_id: str, content_hint: str = "") -> ComponentFragment | None:
+    """Cut a component's element plus the CSS rules and JS statements that target it."""
+
+    locator = _ElementLocator(html, component_id)
+    locator.feed(html)
+    locator.close()
+    if locator.span is None:
+        return None
+    element = html[locator.span[0]: locator.span[1]]
+
+    names = {f".{c}" for c in locator.classes} | {f"#{i}" for i in locator.ids}
+    styles = "\n".join(re.findall(r"<style[^>]*>(.*?)</style>", html, flags=re.S | re.I))
+    scripts = "\n".join(re.findall(r"<script(?![^>]*\bsrc=)[^>]*>(.*?)</script>", html, flags=re.S | re.I))
+
+    css_rules = _component_css(re.sub(r"/\*.*?\*/", "", styles, flags=re.S), names)
+    js, self_contained = _component_script(scripts, names)
+    return ComponentFragment(
+        component_id=component_id,
+        content_hint=content_hint,
+        html=element,
+        css="\n".join(css_rules),
+        js=js,
+        self_contained=self_contained,
+    )
+
+
+def _statements(script: str) -> List[str]:
+    """Split a script into top-level statements (strings, comments and brackets respected)."""
+
+    statements = []
+    start = depth = index = 0
+    while index < len(script):
+        char = script[index]
+        if char in "'\"`":
+            end = index + 1
+            while end < len(script) and script[end] != char and (char == "`" or script[end] != "\n"):
+                end += 2 if script[end] == "\\" else 1
+            index = end
+        elif script.startswith(("//", "/*"), index):
+            end = script.find("\n", index) if script[index + 1] == "/" else script.find("*/", index + 2) + 2
+            end = len(script) if end < 2 else end
+            if depth == 0 and not script[start:index].strip():
+                start = end  # 语句之间的注释不归属任何语句
+            index = end - 1
+        elif char == "\n" and depth == 0:
+            pending = script[start:index].strip()
+            following = script[index:].lstrip()
+            # 自动分号插入：上一行已是完整表达式（或块）、下一行不是续行（运算符、else/catch 等）时，换行即语句结束
+            if pending and pending[-1] not in "=+-*/%&|^!~<>?:,.([{" and not _CONTINUATION.match(following):
+                statements.append(script[start:index])
+                start = index + 1
+        elif char in "([{":
+            depth += 1
+        elif char in ")]}":
+            depth = max(0, depth - 1)
+        elif char == ";" and depth == 0:
+            statements.append(script[start: index + 1])
+            start = index + 1
+        index += 1
+    statements.append(script[start:])
+    return [statement.strip() for statement in statements if statement.strip()]
+
+
+def _selector_names(statement: str) -> Set[str]:
+    """``#id`` / ``.class`` names a statement targets through selector strings or DOM lookups."""
+
+    names = set()
+    for match in _STRING.finditer(statement):
+        literal = next(group for group in match.groups() if group is not None)
+        names.update(re.findall(r"(?<![\w-])([#.][A-Za-z_][\w-]*)", literal))
+    for by_id, by_class in _DOM_LOOKUP.findall(statement):
+        names.add(f"#{by_id}" if by_id else f".{by_class}")
+    return names
+
+
+def _component_script(scripts: str, names: Set[str]) -> Tuple[str, bool]:
+    """JS statements belonging to a component; returns (code, self_contained)."""
+
+    statements = _statements(scripts)
+    targets = [_selector_names(statement) for statement in statements]
+    identifiers = [set(_IDENTIFIER.findall(_STRING.sub('""', statement))) for statement in statements]
+    functions, variables = {}, {}
+    for index, statement in enumerate(statements):
+        declared = _DECLARATION.match(statement)
+        if declared and declared.group(1):
+            functions.setdefault(declared.group(1), index)
+        elif declared:
+            variables.setdefault(declared.group(3), index)
+
+    included = {index for index, found in enumerate(targets) if found & names}
+    changed = bool(included)
+    while changed:
+        changed = False
+        used = set().union(*(identifiers[index] for index in included))
+        owned = {name for name, index in variables.items() if index in included}
+        for index in range(len(statements)):
+            if index in included:
+                continue
+            declared = _DECLARATION.match(statements[index])
+            declares = declared and (declared.group(1) or declared.group(3))
+            # 被组件代码使用的声明，以及使用组件变量（元素句柄、状态）的语句
+            if (declares and declares in used) or identifiers[index] & owned:
+                included.add(index)
+                changed = True
+    chosen = sorted(included)
+    foreign = set().union(*(targets[index] for index in chosen)) - names if chosen else set()
+    return "\n\n".join(statements[index] for index in chosen), not foreign
+
+
+def _css_rules(css: str, names: Set[str], keyframes: Dict[str, str]) -> List[str]:
+    """Rules of ``css`` targeting only ``names`` (grouping at-rules recursed into); collects ``@keyframes``."""
+
+    rules = []
+    index = 0
+    while True:
+        open_at = css.find("{", index)
+        if open_at < 0:
+            return rules
+        # 块前可能还有 @import/@charset 等以分号结束的语句
+        prelude = css[index:open_at].rsplit(";", 1)[-1].strip()
+        block = block_after(css, open_at)
+        index = open_at + len(block)
+        body = block[1:-1]
+        if prelude.startswith("@"):
+            keyword, _, rest = prelude.partition(" ")
+            if keyword.lower().endswith("keyframes") and rest.strip():
+                keyframes[rest.strip()] = f"{prelude} {{{body.strip()}}}"
+            elif keyword.lower() in _GROUPING_RULES:
+                inner = _css_rules(body, names, keyframes)
+                if inner:
+                    rules.append(f"{prelude} {{\n" + "\n".join(inner) + "\n}")
+            continue  # @font-face 等其余 at-rule 不属于任何组件
+        tokens = set(re.findall(r"[.#][\w-]+", prelude))
+        if tokens and tokens <= names:
+            rules.append(f"{prelude} {{{body.strip()}}}")
+
+
+def _component_css(css: str, names: Set[str]) -> List[str]:
+    """CSS of a component: its rules (inside their @media/@supports blocks) and the @keyframes they animate."""
+
+    keyframes: Dict[str, str] = {}
+    rules = _css_rules(css, names, keyframes)
+    animated = set()
+    for value in _ANIMATION.findall("\n".join(rules)):
+        animated.update(re.findall(r"[\w-]+", value))
+    return rules + [rule for name, rule in keyframes.items() if name in animated]
+
+
+def splice_fragments(html: str, fragments: Dict[str, ComponentFragment]) -> str:
+    """Replace ``<!-- fragment:<id> -->`` markers with cached fragments and inject their CSS/JS."""
+
+    used = []
+
+    def _replace(match):
+        fragment = fragments.get(match.group(1))
+        if fragment is None:
+            return match.group(0)
+        used.append(fragment)
+        return fragment.html
+
+    html = _MARKER_RE.sub(_replace, html)
+    css = "\n".join(f.css for f in used if f.css)
+    js = "\n\n".join(f.js for f in used if f.js)
+    if css:
+        style = f"<style data-fragments>\n{css}\n</style>"
+        html = html.replace("</head>", style + "\n</head>", 1) if "</head>" in html else style + html
+    if js:
+        script = f"<script data-fragments>\n{js}\n</script>"
+        html = html.replace("</body>", script + "\n</body>", 1) if "</body>" in html else html + script
+    return html
+
+
+class FragmentLibrary:
+    def __init__(self, path: str = "output/fragments/library.json", threshold: float = 0.6, max_fragments: int = 512):
+        if max_fragments < 1:
+            raise ValueError("max_fragments must be a positive integer")
+        self.path = path
+        self.threshold = threshold
+        self.max_fragments = max_fragments
+        self._lock = threading.Lock()
+        self._fragments: "OrderedDict[str, ComponentFragment]" = OrderedDict()  # 最近命中的在末尾（LRU）
+        self._index = MinHashIndex()
+        self._hits = 0
+        self._misses = 0
+        self._evicted = 0
+        self._prefetched: Dict[str, str | None] = {}  # 组件相似度文本 -> 命中的片段键（None 为未命中）
+        self._prefetch_used = 0
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as fh:
+                for record in json.load(fh):
+                    self._add(ComponentFragment(**record))
+
+    def _add(self, fragment: ComponentFragment) -> None:
+        self._fragments[fragment.key] = fragment
+        self._fragments.move_to_end(fragment.key)
+        # 与 match/prefetch 的查询文本一致（harvest 存入的 content_hint 即 component_text），相同组件相似度为 1
+        self._index.add(fragment.key, fragment.content_hint or component_text({"id": fragment.component_id}))
+        while len(self._fragments) > self.max_fragments:
+            self._index.remove(self._fragments.popitem(last=False)[0])
+            self._evicted += 1
+        self._prefetched.clear()  # 新片段可能改变已预查组件的结果
+
+    def _lookup(self, text: str) -> str | None:
+        hits = self._index.query(text, self.threshold, limit=1)
+        return hits[0][0] if hits else None
+
+    def prefetch(self, component) -> None:
+        """Look up one component ahead of ``match`` (e.g. as soon as it streams in)."""
+
+        text = component_text(component)
+        with self._lock:
+            if text in self._prefetched:
+                return
+        key = self._lookup(text)
+        with self._lock:
+            if len(self._prefetched) >= 1024:
+                self._prefetched.pop(next(iter(self._prefetched)))  # 丢弃最早且从未被 match 取走的预查结果
+            self._prefetched[text] = key
+
+    def match(self, page_spec) -> Dict[str, ComponentFragment]:
+        """Best cached fragment per PageSpec component id (only above the threshold)."""
+
+        if is_dataclass(page_spec):
+            page_spec = asdict(page_spec)
+        matches = {}
+        for component in (page_spec or {}).get("components", []):
+            text = component_text(component)
+            with self._lock:
+                prefetched = text in self._prefetched
+                key = self._prefetched.pop(text, None)
+                self._prefetch_used += prefetched
+            if not prefetched:
+                key = self._lookup(text)
+            with self._lock:
+                if key is not None and key in self._fragments:
+                    fragment = self._fragments[key]
+                    fragment.uses += 1
+                    self._fragments.move_to_end(key)
+                    matches[component.get("id", "")] = fragment
+                    self._hits += 1
+                else:
+                    self._misses += 1
+        return matches
+
+    def harvest(self, html: str, page_spec) -> List[str]:
+        """Store fragments for every PageSpec component found in a validated page."""
+
+        if is_dataclass(page_spec):
+            page_spec = asdict(page_spec)
+        added = []
+        for component in (page_spec or {}).get("components", []):
+            component_id = component.get("id", "")
+            if not component_id:
+                continue
+            fragment = extract_fragment(html, component_id, component_text(component))
+            if fragment is None or not fragment.html.strip():
+                continue
+            fragment.created = time.time()
+            with self._lock:
+                if fragment.key in self._fragments:
+                    continue
+                self._add(fragment)
+            added.append(fragment.key)
+        if added:
+            self.save()
+        return added
+
+    def save(self) -> None:
+        with self._lock:
+            records = [asdict(f) for f in self._fragments.values()]
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(records, fh, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "fragments": len(self._fragments),
+                "hits": self._hits,
+                "misses": self._misses,
+                "prefetched": self._prefetch_used,
+                "evicted": self._evicted,
+            }
@@ -0,0 +1,331 @@
+"""Offline static performance audit for generated HTML pages.
+
+The Engineer is asked to "保证高加载速度", but nothing used to check the page it
+publishes on the ``html`` topic. ``audit_html`` parses the document with the
+standard-library HTML parser (no network, no browser) and reports the usual
+page-weight signals; ``PerfAuditStage`` wraps it as a workflow stage so the
+audit is published to the bus like any other agent output.
+"""
+
+import re
+from html.parser import HTMLParser
+from typing import Dict, List
+
+from core.schemas import AuditViolation, PerfAudit
+
+
+# 与 Lighthouse 的默认阈值保持一致（DOM 规模），其余为经验值
+THRESHOLDS = {
+    "dom_nodes": 1500,
+    "dom_depth": 32,
+    "inline_css_bytes": 50_000,
+    "inline_js_bytes": 100_000,
+}
+
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+}
+
+_LOOP_HEADER = re.compile(r"\b(for|while)\s*\(|\.(forEach|map|filter|reduce)\s*\(")
+_STORAGE_ACCESS = re.compile(r"localStorage\s*(\.\s*(getItem|setItem|removeItem)|\[)")
+_SIMPLE_TOKEN = re.compile(r"([.#]?)(-?[_a-zA-Z][\w-]*)")
+
+
+class _PageParser(HTMLParser):
+    """Collect DOM shape, inline assets and referenced classes/ids in one pass."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.nodes = 0
+        self.max_depth = 0
+        self.stack: List[str] = []
+        self.tags = set()
+        self.classes = set()
+        self.ids = set()
+        self.styles: List[str] = []
+        self.scripts: List[str] = []
+        self.inline_attr_css = 0
+        self.inline_attr_js = 0
+        self.render_blocking: List[str] = []
+        self.images: List[Dict[str, str]] = []
+        self._capture: str | None = None
+        self._buffer: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        attributes = {name: (value or "") for name, value in attrs}
+        self.nodes += 1
+        self.tags.add(tag)
+        self.classes.update(attributes.get("class", "").split())
+        if attributes.get("id"):
+            self.ids.add(attributes["id"])
+        self.inline_attr_css += len(attributes.get("style", "").encode("utf-8"))
+        self.inline_attr_js += sum(
+            len(value.encode("utf-8")) for name, value in attributes.items() if name.startswith("on")
+        )
+
+        in_head = "head" in self.stack and "body" not in self.stack
+        if tag == "script":
+            src = attributes.get("src")
+            if src:
+                blocking = not ({"async", "defer"} & attributes.keys()) and attributes.get("type") != "module"
+                if blocking:
+                    self.render_blocking.append(f"script:{src}")
+            else:
+                self._capture = "script"
+        elif tag == "style":
+            self._capture = "style"
+        elif tag == "link" and in_head and "stylesheet" in attributes.get("rel", "").lower():
+            if attributes.get("media", "all") in ("", "all", "screen"):
+                self.render_blocking.append(f"stylesheet:{attributes.get('href', '')}")
+        elif tag == "img":
+            self.images.append(attributes)
+
+        if tag not in VOID_TAGS:
+            self.stack.append(tag)
+            self.max_depth = max(self.max_depth, len(self.stack))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and self.stack and self.stack[-1] == tag:
+            self.stack.pop()
+
+    def handle_endtag(self, tag):
+        if self._capture == tag:
+            text = "".join(self._buffer)
+            (self.scripts if tag == "script" else self.styles).append(text)
+            self._capture = None
+            self._buffer = []
+        if tag in self.stack:
+            # 容忍未闭合标签：弹出到最近的同名标签
+            while self.stack:
+                if self.stack.pop() == tag:
+                    break
+
+    def handle_data(self, data):
+        if self._capture:
+            self._buffer.append(data)
+
+
+def _css_rules(css: str) -> List[str]:
+    """Return the selector lists of every style rule, descending into @media/@supports."""
+
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    selectors: List[str] = []
+    depth_stack: List[bool] = []  # True 表示该层是可下钻的 at-rule（@media 等）
+    token = []
+    for char in css:
+        if char == "{":
+            prelude = "".join(token).strip()
+            token = []
+            inside_skipped = depth_stack and not depth_stack[-1]
+            if prelude.startswith("@"):
+                depth_stack.append(prelude.startswith(("@media", "@supports", "@layer")) and not inside_skipped)
+            else:
+                if not inside_skipped and prelude:
+                    selectors.append(prelude)
+                depth_stack.append(False)
+        elif char == "}":
+            token = []
+            if depth_stack:
+                depth_stack.pop()
+        elif char == ";" and not (depth_stack and not depth_stack[-1]):
+            token = []  # 丢弃顶层 @import/@charset 等语句
+        else:
+            token.append(char)
+    return selectors
+
+
+def _unused_selectors(parser: _PageParser, script_text: str) -> List[str]:
+    unused = []
+    for selector_list in sum((_css_rules(css) for css in parser.styles), []):
+        for selector in selector_list.split(","):
+            selector = selector.strip()
+            if not selector or selector.startswith(":"):
+                continue
+            # 去掉伪类/伪元素与属性选择器，只检查类名、id 和标签是否存在
+            bare = re.sub(r"::?[\w-]+(\([^)]*\))?|\[[^\]]*\]", " ", selector)
+            for prefix, name in _SIMPLE_TOKEN.findall(bare):
+                if prefix == ".":
+                    present = name in parser.classes or name in script_text
+                elif prefix == "#":
+                    present = name in parser.ids or name in script_text
+                else:
+                    present = name.lower() in parser.tags or name in ("html", "body", "*")
+                if not present:
+                    unused.append(selector)
+                    break
+    return unused
+
+
+def block_after(source: str, start: int) -> str:
+    """Return the brace-delimited block starting at or after ``start``."""
+
+    open_at = source.find("{", start)
+    if open_at < 0:
+        return ""
+    depth = 0
+    for index in range(open_at, len(source)):
+        if source[index] == "{":
+            depth += 1
+        elif source[index] == "}":
+            depth -= 1
+            if depth == 0:
+                return source[open_at: index + 1]
+    return source[open_at:]
+
+
+def _closing(source: str, open_at: int) -> int:
+    """Index of the bracket closing the one at ``open_at`` (string literals skipped); -1 if unclosed."""
+
+    pairs = {"(": ")", "[": "]", "{": "}"}
+    stack = []
+    index = open_at
+    while index < len(source):
+        char = source[index]
+        if char in "'\"`":
+            end = index + 1
+            while end < len(source) and source[end] != char:
+                end += 2 if source[end] == "\\" else 1
+            index = end
+        elif char in pairs:
+            stack.append(pairs[char])
+        elif stack and char == stack[-1]:
+            stack.pop()
+            if not stack:
+                return index
+        index += 1
+    return -1
+
+
+def _loop_body(source: str, header: re.Match) -> str:
+    """Body of the loop whose header ends at ``header.end()``.
+
+    Callback loops (``.forEach(...)``) span their argument list. ``for`` /
+    ``while`` loops span the block or the single statement right after the
+    closing paren; a ``while (...);`` tail of ``do … while`` has no body here.
+    """
+
+    open_at = header.end() - 1
+    close = _closing(source, open_at)
+    if close < 0:
+        return ""
+    if header.group(1) is None:
+        return source[open_at + 1: close]
+    start = close + 1
+    while start < len(source) and source[start].isspace():
+        start += 1
+    if start >= len(source) or source[start] == ";":
+        return ""
+    if source[start] == "{":
+        end = _closing(source, start)
+        return source[start:] if end < 0 else source[start: end + 1]
+    end = start
+    while end < len(source) and source[end] not in ";\n}":
+        if source[end] in "([{":
+            inner = _closing(source, end)
+            if inner < 0:
+                return source[start:]
+            end = inner
+        end += 1
+    return source[start:end]
+
+
+def _storage_loops(script_text: str) -> List[str]:
+    """Find loop bodies that touch localStorage (each access re-serializes/parses)."""
+
+    findings = []
+    for match in _LOOP_HEADER.finditer(script_text):
+        body = _loop_body(script_text, match)
+        hits = len(_STORAGE_ACCESS.findall(body))
+        if hits:
+            line = script_text.count("\n", 0, match.start()) + 1
+            findings.append(f"line {line}: {match.group(0).strip()} … localStorage x{hits}")
+    return findings
+
+
+def minify_html(html: str) -> str:
+    """Conservative minifier used only for size reporting."""
+
+    def _css(match):
+        body = re.sub(r"/\*.*?\*/", "", match.group(2), flags=re.S)
+        body = re.sub(r"\s*([{};:,>])\s*", r"\1", body)
+        return match.group(1) + re.sub(r"\s+", " ", body).strip() + match.group(3)
+
+    def _js(match):
+        lines = (line.strip() for line in match.group(2).splitlines())
+        return match.group(1) + "\n".join(line for line in lines if line) + match.group(3)
+
+    html = re.sub(r"<!--(?!\[if).*?-->", "", html, flags=re.S)
+    html = re.sub(r"(<style[^>]*>)(.*?)(</style>)", _css, html, flags=re.S | re.I)
+    html = re.sub(r"(<script[^>]*>)(.*?)(</script>)", _js, html, flags=re.S | re.I)
+    html = re.sub(r">\s+<", "><", html)
+    return html.strip()
+
+
+def audit_html(html: str) -> PerfAudit:
+    """Statically audit an HTML document and collect threshold violations."""
+
+    html = html or ""
+    parser = _PageParser()
+    parser.feed(html)
+    parser.close()
+
+    script_text = "\n".join(parser.scripts)
+    inline_css = sum(len(css.encode("utf-8")) for css in parser.styles) + parser.inline_attr_css
+    inline_js = len(script_text.encode("utf-8")) + parser.inline_attr_js
+
+    missing_dimensions = [
+        img.get("src", "") for img in parser.images if not (img.get("width") and img.get("height"))
+    ]
+    # 首图通常位于首屏，不要求懒加载
+    missing_lazy = [img.get("src", "") for img in parser.images[1:] if img.get("loading") != "lazy"]
+
+    audit = PerfAudit(
+        dom_nodes=parser.nodes,
+        dom_depth=parser.max_depth,
+        inline_css_bytes=inline_css,
+        inline_js_bytes=inline_js,
+        html_bytes=len(html.encode("utf-8")),
+        minified_bytes=len(minify_html(html).encode("utf-8")),
+        render_blocking=parser.render_blocking,
+        images_missing_dimensions=missing_dimensions,
+        images_missing_lazy=missing_lazy,
+        unused_selectors=_unused_selectors(parser, script_text),
+        storage_loops=_storage_loops(script_text),
+    )
+    audit.violations = _violations(audit)
+    return audit
+
+
+def _violations(audit: PerfAudit) -> List[AuditViolation]:
+    violations = []
+    for metric, limit in THRESHOLDS.items():
+        value = getattr(audit, metric)
+        if value > limit:
+            violations.append(AuditViolation(rule=metric, detail=f"{value} > {limit}"))
+    listed = {
+        "render_blocking": "阻塞渲染的外部资源，添加 defer/async 或内联关键部分",
+        "images_missing_dimensions": "图片缺少 width/height，会引起布局偏移",
+        "images_missing_lazy": "非首屏图片缺少 loading=\"lazy\"",
+        "unused_selectors": "未使用的 CSS 选择器，可删除",
+        "storage_loops": "循环内频繁读写 localStorage，应在循环外读写一次",
+    }
+    for field_name, hint in listed.items():
+        items = getattr(audit, field_name)
+        if items:
+            violations.append(
+                AuditViolation(rule=field_name, detail=f"{hint}: " + "; ".join(items[:10]))
+            )
+    return violations
+
+
+class PerfAuditStage:
+    """Workflow stage that audits the Engineer's HTML without calling an LLM."""
+
+    def __init__(self, name: str = "Auditor"):
+        self.name = name
+        self.model = None
+
+    def process(self, html, context=None, **kwargs) -> PerfAudit:
+        return audit_html(html if isinstance(html, str) else "")
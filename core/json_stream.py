@@ -0,0 +1,146 @@
+"""Incremental JSON parsing for streamed completions.
+
+``IncrementalJSONParser`` is fed text chunks as they arrive from a streaming
+completion. It tracks the container nesting of the first top-level JSON
+object (leading prose or code fences are skipped) and
+
+* calls ``on_item(path, value)`` each time an element of a watched array
+  closes, e.g. every ``PRD.page_sections`` entry or ``PageSpec.components``
+  entry, so it can be published while the model is still generating;
+* reports ``done`` once the root object closes, at which point the rest of
+  the stream can be dropped.
+
+Each closed element is decoded with ``json.loads`` on its exact source span,
+so the parser never has to build values itself.
+"""
+
+import json
+from typing import Any, Callable, Iterable, List, Tuple
+
+
+Path = Tuple[str, ...]
+
+
+class _Frame:
+    __slots__ = ("kind", "path", "key", "expect_key", "item_start")
+
+    def __init__(self, kind: str, path: Path):
+        self.kind = kind  # "object" | "array"
+        self.path = path
+        self.key: str | None = None
+        self.expect_key = kind == "object"
+        self.item_start: int | None = None
+
+
+class IncrementalJSONParser:
+    def __init__(self, watch: Iterable[Path] = (), on_item: Callable[[Path, Any], None] | None = None):
+        self.watch = {tuple(path) for path in watch}
+        self.on_item = on_item
+        self.text = ""
+        self.done = False
+        self.items: List[Tuple[Path, Any]] = []
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._root_start: int | None = None
+        self._root_end = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+
+    def feed(self, chunk: str) -> bool:
+        """Consume a chunk; return True once the root object has closed."""
+
+        if self.done or not chunk:
+            return self.done
+        self.text += chunk
+        text = self.text
+        while self._pos < len(text) and not self.done:
+            char = text[self._pos]
+            if self._in_string:
+                self._string_char(char)
+            elif self._root_start is None:
+                if char == "{":
+                    self._root_start = self._pos
+                    self._stack.append(_Frame("object", ()))
+            else:
+                self._structural_char(char)
+            self._pos += 1
+        return self.done
+
+    def root_text(self) -> str | None:
+        """Source text of the root object once it has closed (fences/prose stripped)."""
+        return self.text[self._root_start: self._root_end] if self.done else None
+
+    def root(self) -> Any:
+        """Decode the complete root object (None until it has closed)."""
+        if not self.done:
+            return None
+        return json.loads(self.text[self._root_start: self._root_end])
+
+    # ------------------------------------------------------------------ 内部状态机
+    def _string_char(self, char: str) -> None:
+        if self._escape:
+            self._escape = False
+        elif char == "\\":
+            self._escape = True
+        elif char == '"':
+            self._in_string = False
+            frame = self._stack[-1]
+            if frame.kind == "object" and frame.expect_key:
+                frame.key = json.loads(self.text[self._string_start: self._pos + 1])
+                frame.expect_key = False
+
+    def _structural_char(self, char: str) -> None:
+        frame = self._stack[-1]
+        if char in " \t\r\n:":
+            return
+        if char == ",":
+            self._close_scalar_item(frame)
+            if frame.kind == "object":
+                frame.expect_key = True
+            return
+        if char in "}]":
+            self._close_scalar_item(frame)
+            self._stack.pop()
+            if not self._stack:
+                self.done = True
+                self._root_end = self._pos + 1
+                return
+            self._close_container_item(self._stack[-1])
+            return
+
+        # 一个值（或对象键）的开始
+        if frame.kind == "array" and frame.item_start is None:
+            frame.item_start = self._pos
+        if char == '"':
+            self._in_string = True
+            self._string_start = self._pos
+        elif char in "{[":
+            child_path = frame.path + ((frame.key or "",) if frame.kind == "object" else ())
+            self._stack.append(_Frame("object" if char == "{" else "array", child_path))
+
+    def _watched(self, frame: _Frame) -> bool:
+        return frame.kind == "array" and frame.path in self.watch
+
+    def _close_container_item(self, frame: _Frame) -> None:
+        # 嵌套容器闭合：若父级是被监听的数组，则该元素已完整
+        if self._watched(frame) and frame.item_start is not None:
+            self._emit(frame, self._pos + 1)
+
+    def _close_scalar_item(self, frame: _Frame) -> None:
+        if self._watched(frame) and frame.item_start is not None:
+            if self.text[frame.item_start] not in "{[":
+                self._emit(frame, self._pos)
+            else:
+                frame.item_start = None
+
+    def _emit(self, frame: _Frame, end: int) -> None:
+        raw = self.text[frame.item_start: end].strip()
+        frame.item_start = None
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            return
+        self.items.append((frame.path, value))
+        if self.on_item is not None:
+            self.on_item(frame.path, value)
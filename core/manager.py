@@ -1,4 +1,20 @@
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core.agent_base import AgentBase
+from core.blob_store import materialize
+from core.deadline import STEP_LATENCIES, DeadlineExceeded, budget, remaining
+from core.html_audit import PerfAuditStage
 from core.message_bus import MessageBus
+from core.metrics import collect_calls, note, record_call
+from core.output_budget import OUTPUT_BUDGET
+from core.rate_limiter import GOVERNOR
+from core.scheduler import SCHEDULER
+from core.singleflight import MANAGER_RUNS, coalescing_stats, request_key
+from core.tracing import span
+from core.work_queue import WorkItem, decode, raise_remote
+from core.workflow_graph import check_produced, default_context_topics, is_consumed, required_steps, step_inputs, upstream_topics
 from agents.pm_agent import PMAgent
 from agents.architect_agent import ArchitectAgent
 from agents.engineer_agent import EngineerAgent
@@ -7,20 +23,68 @@ from agents.project_agent import ProjectAgent
 
 # Multi-Agent 协作管理器：负责调度、消息流转与工作流组织
 class Manager:
-    def __init__(self, cp: bool = True, sp: bool = True):
+    def __init__(
+        self,
+        cp: bool = True,
+        sp: bool = True,
+        audit: bool = False,
+        audit_fixup: bool = False,
+        router=None,
+        stream: bool = False,
+        engineer_candidates: int = 1,
+        fragment_library=None,
+        fragment_mode: str = "adapt",
+        brief_cache=None,
+        tenant: str = "default",
+        priority: str = "standard",
+        work_queue=None,
+    ):
         """多智能体电商网页制作流程的中央协调者
 
         Args:
             cp: 是否启用共享上下文（Communication Protocol）
-                True：所有 Agent 共享完整对话历史
+                True：Agent 共享本次运行中与其输入相关的上游话题历史
+                      （步骤的 context_topics，默认由 input_topic/fetch_topics 依赖推导）
                 False：仅按当前任务输入，不共享对话
             sp: 是否启用完整工作流（Structure Procedure）
                 True：包括 TeamLeader → PM → Architect → Engineer
                 False：跳过 PM & Architect，由 Engineer 直接开发
+            audit: 是否在 Engineer 之后追加静态性能审计（输出到 perf_audit 话题）
+            audit_fixup: 审计发现违规时，是否把问题反馈给 Engineer 做一次修订
+            router: 可选的 ModelRouter，按角色路由模型（默认所有角色使用固定模型）
+            stream: 是否对 PM / Architect / Project 使用流式输出 + 增量 JSON 解析：
+                每个闭合的列表元素即时发布到 <topic>.partial（配置了片段库时，page_spec.partial
+                中的组件立即预查片段库），根对象闭合即结束读取，无人消费的步骤（TeamLeader）在后台与规划链并行
+            engineer_candidates: Engineer 并发候选数（best-of-N）；> 1 时按 PageSpec 组件与
+                brief 中的功能模块离线打分，首个通过的候选被采纳，其余取消
+            fragment_library: 可选的 FragmentLibrary；按 PageSpec 组件相似度复用历史组件实现，
+                通过离线检查的页面会把组件收录进库
+            fragment_mode: "adapt"（片段作为参考交给 Engineer 改写）或
+                "verbatim"（Engineer 只输出占位注释，生成后原样拼接片段；
+                脚本依赖组件外元素的片段仍按 adapt 提供）
+            brief_cache: 可选的 PlanningCache；与历史 brief 近似重复时复用其规划产物
+                （替换变化的字段），只运行 Engineer 及其后的步骤
+            tenant: 本 Manager 的运行所属租户；多租户共用进程时，步骤调度器在租户间公平分配执行槽位
+            priority: 默认优先级类别（"interactive" / "standard" / "bulk"），决定步骤的排队顺序
+            work_queue: 可选的 WorkQueue（如 SQLiteWorkQueue）；设置后本进程只做协调，
+                各 LLM 步骤序列化后放入共享队列，由任意节点上的 worker 进程执行
         """
 
         self.cp = cp
         self.sp = sp
+        self.audit = audit or audit_fixup
+        self.audit_fixup = audit_fixup
+        self.stream = stream
+        self.engineer_candidates = engineer_candidates
+        if fragment_mode not in ("adapt", "verbatim"):
+            raise ValueError(f"Unknown fragment_mode: {fragment_mode}")
+        self.fragment_library = fragment_library
+        self.brief_cache = brief_cache
+        if priority not in SCHEDULER.classes:
+            raise ValueError(f"Unknown priority class: {priority}")
+        self.tenant = tenant
+        self.priority = priority
+        self.work_queue = work_queue
         self.bus = MessageBus()
 
         # 初始化四个角色 Agent（团队角色固定，不新增）
@@ -29,6 +93,14 @@ class Manager:
         self.arch = ArchitectAgent()  # Architect：营销组件架构设计
         self.project = ProjectAgent()  # Project：任务拆解与依赖梳理
         self.eng = EngineerAgent()  # Engineer：前端开发交付页面
+        self.eng.fragment_library = fragment_library
+        self.eng.fragment_mode = fragment_mode
+        self.auditor = PerfAuditStage()  # Auditor：离线静态性能审计（不调用模型）
+
+        self.router = router
+        if router is not None:
+            for agent in (self.team_leader, self.pm, self.arch, self.project, self.eng):
+                agent.router = router
 
         # 构建执行工作流
         self.workflow = self._build_workflow()
@@ -62,6 +134,7 @@ class Manager:
                     "output_topic": "prd",
                     "agent": self.pm,
                     "description": "Convert user brief into structured PRD",
+                    "streams": True,
                 }
             )
 
@@ -72,6 +145,7 @@ class Manager:
                     "output_topic": "page_spec",
                     "agent": self.arch,
                     "description": "Transform PRD into page architecture",
+                    "streams": True,
                 }
             )
 
@@ -82,6 +156,7 @@ class Manager:
                     "output_topic": "task_plan",
                     "agent": self.project,
                     "description": "Break down PRD & design into task list",
+                    "streams": True,
                     "fetch_topics": ["prd"],
                 }
             )
@@ -92,15 +167,50 @@ class Manager:
             engineer_input = "brief"
 
         # 4️⃣ Engineer 步骤：最终生成 HTML
-        steps.append(
-            {
-                "input_topic": engineer_input,
-                "output_topic": "html",
-                "agent": self.eng,
-                "description": "Render final HTML",
-                "fetch_topics": ["page_spec"] if self.sp else [],
+        engineer_step = {
+            "input_topic": engineer_input,
+            "output_topic": "html",
+            "agent": self.eng,
+            "description": "Render final HTML",
+            "fetch_topics": ["page_spec"] if self.sp else [],
+        }
+        if self.engineer_candidates > 1:
+            # best-of-N 需要 brief 来确定必须实现的功能模块
+            engineer_step["kwargs"] = {"candidates": self.engineer_candidates}
+        if self.sp and (self.engineer_candidates > 1 or self.fragment_library is not None):
+            # 片段收录前的离线检查同样依赖 brief
+            engineer_step["fetch_topics"] = ["page_spec", "brief"]
+        steps.append(engineer_step)
+
+        # 5️⃣ 性能审计：离线解析 HTML，发布结构化审计结果
+        if self.audit:
+            audit_step = {
+                "input_topic": "html",
+                "output_topic": "perf_audit",
+                "agent": self.auditor,
+                "description": "Statically audit page performance",
+                "context_topics": [],
             }
-        )
+            steps.append(audit_step)
+
+            # 6️⃣ 可选：把违规项反馈给 Engineer 修订一次，再复审
+            if self.audit_fixup:
+                steps.append(
+                    {
+                        "input_topic": "html",
+                        "output_topic": "html",
+                        "agent": self.eng,
+                        "method": "revise",
+                        "description": "Fix audit violations in one pass",
+                        "fetch_topics": ["perf_audit"],
+                        "context_topics": [],
+                    }
+                )
+                steps.append(dict(audit_step))
+
+        # 未显式声明 context_topics 的步骤，按 input_topic/fetch_topics 的上游依赖推导
+        for index, step in enumerate(steps):
+            step.setdefault("context_topics", default_context_topics(steps, index))
 
         return steps
 
@@ -172,13 +282,36 @@ class Manager:
         # 返回当前团队成员的职责（确保无新增角色）
         return {role: responsibilities.get(role, "职责未提供") for role in self._available_roles()}
 
-    def run(self, brief, cp: bool | None = None, sp: bool | None = None):
+    def run(
+        self,
+        brief,
+        cp: bool | None = None,
+        sp: bool | None = None,
+        deadline: float | None = None,
+        needed=None,
+        keep_skipped: bool = False,
+        session: MessageBus | None = None,
+        tenant: str | None = None,
+        priority: str | None = None,
+    ):
         """执行整个网页开发流程
 
         Args:
             brief: 客户业务需求描述（如“新疆瓜子电商销售页面”）
             cp: 临时覆盖共享上下文设置
             sp: 临时覆盖工作流结构设置
+            deadline: 本次运行的时间预算（秒）。预算会传递给每个步骤的模型请求；
+                当剩余时间按历史耗时不足以完成规划链时，降级为 brief → Engineer
+            needed: 调用方真正需要的话题集合（默认 html；开启审计时另含 perf_audit）。
+                从这些话题反向推导必需步骤，其余步骤（如无人读取的 TeamLeader tasks）跳过
+            keep_skipped: 为审计运行保留无人消费的步骤（仍在 metrics["demand"] 中列出）
+            session: 在指定的会话 bus 上继续运行（通常是上一次运行的 ``manager.bus.fork()``）。
+                会话中由完全相同的配置（cp/sp、上下文话题、模型、输入）产出、且上游也被复用的步骤
+                直接复用，不重新计算；不传时每次运行使用全新的 bus
+            tenant / priority: 临时覆盖本次运行的租户与优先级类别（步骤级调度）
+
+        Returns:
+            (html, metrics)：最终 HTML 与本次运行的指标（各步骤耗时、调用记录、合并计数）
         """
 
         cp_enabled = self.cp if cp is None else cp
@@ -189,34 +322,471 @@ class Manager:
             self.sp = sp_enabled
             self.workflow = self._build_workflow()
 
-        # 初始化输入消息：用户需求
-        self.bus.publish("brief", "User", brief)
+        needed = sorted(self._default_needed() if needed is None else set(needed))
+        check_produced(self.workflow, needed)  # 拼错的话题（如 plan 而非 task_plan）在发布任何消息前报错
+        schedule = {"tenant": tenant or self.tenant, "priority": priority or self.priority}
+        if schedule["priority"] not in SCHEDULER.classes:
+            raise ValueError(f"Unknown priority class: {schedule['priority']}")
+
+        if session is not None:
+            # 会话运行依赖会话中已有的消息，不能与其他运行合并
+            with span("Manager.run", cp=cp_enabled, sp=sp_enabled, deadline=deadline, session=True):
+                html, metrics, _, bus = self._run_once(brief, cp_enabled, deadline, needed, keep_skipped, session, schedule)
+            self.bus = bus
+            return html, metrics
+
+        # 相同 brief + 配置 + 时间预算的并发运行合并为一次执行，跟随者直接复用领导者的结果
+        # （预算在键中：未设预算的调用方不会拿到降级运行的结果）
+        key = request_key("Manager", brief, deadline, self._run_config(cp_enabled, needed, keep_skipped, schedule))
+        with span("Manager.run", cp=cp_enabled, sp=sp_enabled, deadline=deadline) as run_span:
+            (html, metrics, _, leader_bus), shared = MANAGER_RUNS.do(
+                key, lambda: self._run_once(brief, cp_enabled, deadline, needed, keep_skipped, schedule=schedule)
+            )
+            if run_span:
+                run_span.set(coalesced=shared, html_bytes=len(html.encode("utf-8")))
+        if not shared:
+            self.bus = leader_bus
+            return html, metrics
+
+        # 跟随者：分叉领导者的 bus（共享消息而不复制），便于后续 dump/审计或继续分支
+        self.bus = leader_bus.fork()
+        metrics = dict(metrics, coalesced=True, coalescing=coalescing_stats())
+        return html, metrics
+
+    def _run_config(self, cp_enabled: bool, needed, keep_skipped: bool, schedule):
+        """影响输出内容或调度方式的全部运行参数（单飞合并键的组成部分）。
+
+        库、缓存、路由器与队列等有状态对象按实例区分：不同实例的运行不能互相复用结果。
+        """
+        return {
+            "cp": cp_enabled,
+            "sp": self.sp,
+            "needed": needed,
+            "keep_skipped": keep_skipped,
+            "audit": self.audit,
+            "audit_fixup": self.audit_fixup,
+            "stream": self.stream,
+            "engineer_candidates": self.engineer_candidates,
+            "fragment_library": id(self.fragment_library) if self.fragment_library is not None else None,
+            "fragment_mode": self.eng.fragment_mode,
+            "brief_cache": id(self.brief_cache) if self.brief_cache is not None else None,
+            "router": id(self.router) if self.router is not None else None,
+            "work_queue": id(self.work_queue) if self.work_queue is not None else None,
+            "schedule": schedule,
+            "workflow": [(self._step_key(step), step["agent"].model) for step in self.workflow],
+        }
+
+    def _default_needed(self):
+        """默认需要的话题：最终 HTML，以及开启审计时的审计结果。"""
+        return {"html", "perf_audit"} if self.audit else {"html"}
+
+    def _demand_steps(self, needed, cp_enabled: bool, keep_skipped: bool, metrics):
+        """按需求话题反向推导必需步骤；返回本次要执行的步骤列表。"""
+
+        required = set(required_steps(self.workflow, needed, with_context=cp_enabled))
+        skipped = [self._step_key(step) for i, step in enumerate(self.workflow) if i not in required]
+        metrics["demand"] = {"needed": list(needed), "skipped": [] if keep_skipped else skipped, "kept": []}
+        if keep_skipped:
+            metrics["demand"]["kept"] = skipped
+            return list(self.workflow)
+        return [step for i, step in enumerate(self.workflow) if i in required]
+
+    @staticmethod
+    def _step_key(step) -> str:
+        """历史耗时的统计键：角色名（非 process 方法时附加方法名）。"""
+        method = step.get("method")
+        return step["agent"].name if method is None else f"{step['agent'].name}.{method}"
+
+    @staticmethod
+    def _engineer_index(pending):
+        """剩余步骤中 Engineer 渲染步骤的位置；不存在时返回 None。"""
+        for index, step in enumerate(pending):
+            if step["output_topic"] == "html" and "method" not in step:
+                return index
+        return None
+
+    def _planning_pending(self, pending) -> bool:
+        """Engineer 之前是否仍有规划步骤（或 Engineer 仍依赖规划产物）。"""
+        eng_index = self._engineer_index(pending)
+        if eng_index is None or eng_index > 0:
+            return eng_index is not None
+        return pending[0]["input_topic"] != "brief" and not pending[0].get("cached_inputs")
+
+    def _degrade_reason(self, pending, left: float) -> str | None:
+        """按历史耗时判断剩余预算能否覆盖规划链 + Engineer；不能时返回原因。"""
+
+        if not self._planning_pending(pending):
+            return None
+        if left <= 0:
+            return "time budget exhausted before the planning chain finished"
+        chain = pending[: self._engineer_index(pending) + 1]
+        estimates = [STEP_LATENCIES.estimate(self._step_key(step)) for step in chain]
+        if any(estimate is None for estimate in estimates):
+            return None  # 缺少历史耗时时不做预测性降级
+        needed = sum(estimates)
+        if left < needed:
+            names = " → ".join(self._step_key(step) for step in chain)
+            return f"remaining {left:.1f}s < estimated {needed:.1f}s for {names}"
+        return None
+
+    def _degrade(self, pending, report, reason: str):
+        """把剩余步骤改写为 brief → Engineer，取消不再需要的规划步骤。"""
+
+        eng_index = self._engineer_index(pending)
+        engineer = dict(
+            pending[eng_index],
+            input_topic="brief",
+            fetch_topics=[],
+            context_topics=["brief"],
+        )
+        report["degraded"] = True
+        report["reason"] = reason
+        report["cancelled"].extend(self._step_key(step) for step in pending[:eng_index])
+        return [engineer, *pending[eng_index + 1:]]
+
+    def _planning_namespace(self) -> str:
+        """规划缓存的命名空间：Engineer 之前的步骤（角色与模型），不同配置互不复用。"""
+        planning = self.workflow[: self._engineer_index(self.workflow)]
+        return "|".join(f"{self._step_key(step)}:{step['agent'].model}" for step in planning)
+
+    def _mark_critical(self, steps):
+        """标记关键路径：Engineer 及其（传递）读取的规划步骤，调度时优先放行。"""
+
+        eng_index = self._engineer_index(steps)
+        if eng_index is None:
+            return steps
+        unblocks = upstream_topics(steps, step_inputs(steps[eng_index]), before=eng_index)
+        return [
+            dict(step, critical=index == eng_index or (index < eng_index and step["output_topic"] in unblocks))
+            for index, step in enumerate(steps)
+        ]
+
+    def _step_config(self, step, cp_enabled: bool):
+        """产出步骤输出的配置；随输出一起发布，会话复用时要求完全一致。"""
+        return {
+            "step": self._step_key(step),
+            "model": step["agent"].model,
+            "cp": cp_enabled,
+            "sp": self.sp,
+            "input_topic": step["input_topic"],
+            "fetch_topics": list(step.get("fetch_topics", [])),
+            "context_topics": list(step["context_topics"]) if cp_enabled else [],
+            "kwargs": request_key(step.get("kwargs", {})),
+        }
+
+    def _reuse_session(self, bus: MessageBus, steps, cp_enabled: bool, metrics):
+        """会话中由相同配置产出的步骤直接复用（如分叉自同一前缀的多个配置），只执行其余步骤。
+
+        配置不同（如 cp=True 会话上的 cp=False 分支）或上游需要重新产出的步骤都重新执行。
+        """
+
+        reused, fresh = [], set()
+        for step in steps:
+            message = bus.latest(step["output_topic"])
+            upstream = set(step_inputs(step)) | set(step["context_topics"] if cp_enabled else [])
+            if message is not None and message.get("meta") == self._step_config(step, cp_enabled) and not upstream & fresh:
+                reused.append(step)
+            else:
+                fresh.add(step["output_topic"])
+        metrics["session"] = {
+            "prefix_messages": bus.size(),
+            "reused": [self._step_key(step) for step in reused],
+        }
+        if not reused:
+            return steps
+        remaining = [step for step in steps if step not in reused]
+        eng_index = self._engineer_index(remaining)
+        if eng_index == 0:
+            remaining[0] = dict(remaining[0], cached_inputs=True)
+        return remaining
+
+    def _reuse_planning(self, bus: MessageBus, brief, steps, metrics):
+        """命中近似 brief 时发布替换后的规划产物，并只保留 Engineer 及其后的步骤。"""
+
+        eng_index = self._engineer_index(steps)
+        if eng_index is None or not isinstance(brief, str):
+            metrics["brief_cache"] = {"hit": False, "reason": "not applicable"}
+            return False, steps
+        with span("PlanningCache.lookup") as lookup_span:
+            lookup = self.brief_cache.lookup(brief, self._planning_namespace())
+            if lookup_span:
+                lookup_span.set(hit=lookup.hit, similarity=lookup.similarity)
+        metrics["brief_cache"] = {
+            "hit": lookup.hit,
+            "similarity": lookup.similarity,
+            "reason": lookup.reason,
+            "substitutions": len(lookup.substitutions),
+            "skipped": [],
+        }
+        if not lookup.hit:
+            return False, steps
+        for topic, sender, content in lookup.messages:
+            bus.publish(topic, sender, content)
+        # 缓存条目未覆盖的规划步骤（如当时被按需跳过的步骤）照常执行
+        cached = {topic for topic, _, _ in lookup.messages}
+        remaining = [step for step in steps[:eng_index] if step["output_topic"] not in cached]
+        metrics["brief_cache"]["skipped"] = [
+            self._step_key(step) for step in steps[:eng_index] if step["output_topic"] in cached
+        ]
+        engineer = dict(steps[eng_index], cached_inputs=not remaining)
+        return True, [*remaining, engineer, *steps[eng_index + 1:]]
+
+    def _store_planning(self, bus: MessageBus, brief, steps):
+        """把本次运行中 Engineer 之前各步骤的输出存入规划缓存。"""
 
-        # 顺序执行 workflow
-        for step in self.workflow:
-            incoming = self.bus.latest(step["input_topic"])
-            content = incoming["content"] if incoming else None
+        eng_index = self._engineer_index(steps)
+        if not isinstance(brief, str) or not eng_index:
+            return
+        topics = {step["output_topic"] for step in steps[:eng_index]}
+        messages = [
+            (message["topic"], message["sender"], materialize(message["content"]))
+            for message in bus.history()
+            if message["topic"] in topics
+        ]
+        if len({topic for topic, _, _ in messages}) == len(topics):
+            self.brief_cache.store(brief, messages, self._planning_namespace())
 
-            # cpEnabled=True 时，所有历史消息共享给 Agent #todo
+    def _runs_remotely(self, step) -> bool:
+        """是否把步骤交给队列：只有调用模型的 Agent；带本地片段库的 Engineer 仍在本进程执行。"""
+        if self.work_queue is None or not isinstance(step["agent"], AgentBase):
+            return False
+        return not (step["agent"] is self.eng and self.fragment_library is not None)
 
-            context = self.bus.chat_history() if cp_enabled else []
+    def _execute_remote(self, step, content, context, kwargs):
+        """把步骤序列化为 WorkItem 放入共享队列，等待 worker 的结果并回放其调用记录。"""
+
+        # 流式回调无法跨进程传递，远程步骤不发布 .partial 消息
+        kwargs = {key: value for key, value in kwargs.items() if key != "on_partial"}
+        left = remaining()
+        item = WorkItem(
+            role=step["agent"].name,
+            method=step.get("method", "process"),
+            content=content,
+            context=context,
+            kwargs=kwargs,
+            model=step["agent"].model,
+            expires_at=None if left is None else time.time() + left,
+            step=self._step_key(step),
+        )
+        with span("WorkQueue.wait", step=item.step) as wait_span:
+            self.work_queue.submit(item)
+            outcome = self.work_queue.wait(item.id)
+            if wait_span:
+                wait_span.set(ok="error" not in outcome)
+        if "error" in outcome:
+            # 保留远程异常类型：worker 上超出步骤预算的 DeadlineExceeded 同样触发本地降级
+            raise_remote(outcome, item.step)
+        for call in outcome.get("calls", []):
+            record_call(**dict(call, remote=True))
+        note(**decode(outcome.get("notes") or {}), work_item=item.id)
+        return decode(outcome["result"])
+
+    def _execute_step(self, bus: MessageBus, step, cp_enabled: bool, step_budget, metrics):
+        """执行单个步骤：组装上下文与输入，调用 Agent，记录指标并发布输出。"""
+
+        with span(f"step:{self._step_key(step)}", output_topic=step["output_topic"]) as step_span:
+            content = bus.latest_content(step["input_topic"])
+
+            # cpEnabled=True 时，仅共享本次运行中该步骤声明的上游话题
+            context = []
+            if cp_enabled:
+                context = bus.chat_history(topics=step["context_topics"])
+                # 按发布时记录的载荷大小统计，不为一个指标渲染（物化）整段历史
+                context_bytes = {
+                    "full": bus.payload_bytes(),
+                    "scoped": bus.payload_bytes(step["context_topics"]),
+                }
+            else:
+                context_bytes = {"full": 0, "scoped": 0}
+            step_span.set(context_bytes=context_bytes["scoped"])
 
             # # response_format={"type":"json_object"} if json_mode else None,
             # messages = [{"role": "system", "content": [{"type": "text", "text": content}]}]
             # resp = self.client.chat.completions.create(model=self.model, messages=messages)
-            resp = " "
 
             kwargs = dict(step.get("kwargs", {}))
             for topic in step.get("fetch_topics", []):
-                extra = self.bus.latest(topic)
+                extra = bus.latest(topic)
                 if extra is not None:
-                    kwargs[topic] = extra.get("content")
+                    kwargs[topic] = materialize(extra.get("content"))
 
-            result = step["agent"].process(content, context=context, **kwargs)
+            # 流式模式：上游 JSON 的每个列表元素一闭合就发布到 <topic>.partial
+            partial_topic = f"{step['output_topic']}.partial"
+            if self.stream and step.get("streams"):
+                kwargs["on_partial"] = lambda item: bus.publish(partial_topic, step["agent"].name, item)
+
+            # 按优先级类别、租户公平性与关键路径排队领取执行槽位（等待计入步骤预算，不计入步骤耗时）
+            with budget(step_budget), SCHEDULER.slot(
+                metrics["scheduler"]["tenant"],
+                metrics["scheduler"]["priority"],
+                critical=step.get("critical", False),
+                step=self._step_key(step),
+            ) as scheduling:
+                step_started = time.perf_counter()
+                with collect_calls() as calls:
+                    if self._runs_remotely(step):
+                        result = self._execute_remote(step, content, context, kwargs)
+                    else:
+                        handler = getattr(step["agent"], step.get("method", "process"))
+                        result = handler(content, context=context, **kwargs)
+                duration = time.perf_counter() - step_started
+            STEP_LATENCIES.record(self._step_key(step), duration)
+            metrics["steps"].append(
+                {
+                    "role": step["agent"].name,
+                    "output_topic": step["output_topic"],
+                    "duration": round(duration, 3),
+                    "calls": calls,
+                    "coalesced_calls": sum(1 for call in calls if call.get("coalesced")),
+                    "routes": [call["route"] for call in calls if call.get("route")],
+                    "governor_wait": round(sum(call.get("governor_wait", 0.0) for call in calls), 3),
+                    "context_topics": step["context_topics"] if cp_enabled else [],
+                    "context_bytes": context_bytes,
+                    "partials": len(bus.history(partial_topic)) if self.stream and step.get("streams") else 0,
+                    "queue_wait": scheduling["queue_wait"],
+                    "critical": scheduling["critical"],
+                    **calls.notes,
+                }
+            )
 
             # 每个节点发布输出，供下游 Agent 使用
-            self.bus.publish(step["output_topic"], step["agent"].name, result)
+            bus.publish(step["output_topic"], step["agent"].name, result, meta=self._step_config(step, cp_enabled))
+            return result
+
+    def _run_once(
+        self,
+        brief,
+        cp_enabled: bool,
+        deadline: float | None = None,
+        needed=("html",),
+        keep_skipped: bool = False,
+        session: MessageBus | None = None,
+        schedule=None,
+    ):
+        """顺序执行一次 workflow，返回 (html, metrics, 本次消息, bus)。
+
+        每次运行使用独立的 bus（或调用方传入的会话 bus），同一 Manager 上的多次运行互不干扰。
+        """
+
+        run_started = time.perf_counter()
+        bus = MessageBus() if session is None else session
+        metrics = {"cp": cp_enabled, "sp": self.sp, "coalesced": False, "steps": []}
+        metrics["scheduler"] = dict(schedule or {"tenant": self.tenant, "priority": self.priority})
+        expires_at = None
+        if deadline is not None:
+            expires_at = time.monotonic() + deadline
+            metrics["deadline"] = {"budget": deadline, "degraded": False, "reason": None, "cancelled": []}
+
+        # 初始化输入消息：用户需求（会话中已有同一 brief 时不重复发布）
+        existing = bus.latest_content("brief") if session is not None else None
+        if existing is not None and existing != brief:
+            raise ValueError("session was started for a different brief")
+        if existing is None:
+            bus.publish("brief", "User", brief)
+
+        # 流式模式下 PageSpec 组件一闭合就预查片段库，与 Architect 余下的生成重叠
+        if self.stream and self.fragment_library is not None:
+            bus.subscribe(
+                "page_spec.partial", lambda message: self.fragment_library.prefetch(materialize(message["content"]))
+            )
+
+        # 流式模式下，输出无人消费的步骤（如 TeamLeader 的 tasks）放到后台与规划链并行
+        executor = ThreadPoolExecutor(max_workers=2) if self.stream else None
+        background = []
+
+        # 顺序执行 workflow（只保留产出所需话题的步骤；降级时会改写剩余步骤）
+        steps = self._demand_steps(needed, cp_enabled, keep_skipped, metrics)
+        if session is not None:
+            steps = self._reuse_session(bus, steps, cp_enabled, metrics)
+        steps = self._mark_critical(steps)
+        planned = list(steps)
+        cache_hit = False
+        if self.brief_cache is not None:
+            cache_hit, steps = self._reuse_planning(bus, brief, steps, metrics)
+        index = 0
+        try:
+            while index < len(steps):
+                step = steps[index]
+
+                step_budget = None
+                if expires_at is not None:
+                    left = expires_at - time.monotonic()
+                    reason = self._degrade_reason(steps[index:], left)
+                    if reason:
+                        steps = steps[:index] + self._degrade(steps[index:], metrics["deadline"], reason)
+                        continue
+                    step_budget = left
+                    if self._planning_pending(steps[index:]):
+                        # 规划步骤只能使用扣除 Engineer 预留后的预算（无历史耗时时按比例预留）
+                        eng_step = steps[index + self._engineer_index(steps[index:])]
+                        step_budget -= STEP_LATENCIES.reserve(self._step_key(eng_step), left)
+
+                args = (bus, step, cp_enabled, step_budget, metrics)
+                if executor is not None and step["output_topic"] != "html" and not is_consumed(steps, index):
+                    background.append(
+                        (step, executor.submit(contextvars.copy_context().run, self._execute_step, *args))
+                    )
+                    index += 1
+                    continue
+
+                try:
+                    self._execute_step(*args)
+                except DeadlineExceeded:
+                    if expires_at is None or not self._planning_pending(steps[index:]):
+                        raise
+                    reason = f"{self._step_key(step)} exceeded its step budget"
+                    steps = steps[:index] + self._degrade(steps[index:], metrics["deadline"], reason)
+                    continue
+                index += 1
+
+            for step, future in background:
+                try:
+                    future.result()
+                except DeadlineExceeded:
+                    if expires_at is None:
+                        raise
+                    metrics["deadline"]["cancelled"].append(self._step_key(step))
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+
+        if self.brief_cache is not None:
+            if not cache_hit and not metrics.get("deadline", {}).get("degraded"):
+                self._store_planning(bus, brief, planned)
+            metrics["brief_cache"]["stats"] = self.brief_cache.stats()
+
+        metrics["duration"] = round(time.perf_counter() - run_started, 3)
+        metrics["context_bytes"] = {
+            key: sum(step_metrics["context_bytes"][key] for step_metrics in metrics["steps"])
+            for key in ("full", "scoped")
+        }
+        assembled = [step_metrics["prompt_assembly"] for step_metrics in metrics["steps"] if "prompt_assembly" in step_metrics]
+        metrics["prompt_assembly"] = {
+            key: sum(report[key] for report in assembled) for key in ("bytes_saved", "tokens_saved")
+        }
+        continued = [
+            call["continuation"] for step_metrics in metrics["steps"] for call in step_metrics["calls"] if "continuation" in call
+        ]
+        metrics["continuation"] = {
+            "calls": len(continued),
+            "continuations": sum(report["continuations"] for report in continued),
+            "tokens_saved": sum(report["tokens_saved"] for report in continued),
+            "completion_tokens_saved": sum(report["completion_tokens_saved"] for report in continued),
+            "incomplete": sum(1 for report in continued if not report["complete"]),
+        }
+        metrics["coalescing"] = coalescing_stats()
+        if expires_at is not None:
+            metrics["deadline"]["remaining"] = round(expires_at - time.monotonic(), 3)
+        if self.router is not None:
+            metrics["model_stats"] = self.router.stats()
+        if GOVERNOR.enabled:
+            metrics["rate_limiter"] = GOVERNOR.stats()
+        if OUTPUT_BUDGET.enabled:
+            metrics["output_budget"] = OUTPUT_BUDGET.stats()
+        metrics["endpoints"] = self.eng.endpoints.stats()
+        metrics["scheduler"]["queue_wait"] = round(sum(step_metrics["queue_wait"] for step_metrics in metrics["steps"]), 3)
+        metrics["scheduler"]["stats"] = SCHEDULER.stats()
 
         # 返回最终 HTML 页面输出
-        final = self.bus.latest("html")
-        return final["content"] , resp if final else ""
+        html = (bus.latest_content("html") or "") if "html" in needed else ""
+        return html, metrics, bus.history(), bus
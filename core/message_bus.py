@@ -12,74 +12,171 @@ dictionaries with the following shape::
     }
 
 This keeps agent interactions explicit and machine-readable, mirroring the
-publish–subscribe workflow described in the project goals.
+publish–subscribe workflow described in the project goals. A publisher may
+attach ``meta`` (e.g. the configuration that produced the content), stored
+under the message's ``"meta"`` key.
+
+Large contents (the final HTML, big specs) are spooled to a ``BlobStore`` on
+publish and kept on the bus as ``BlobHandle`` objects; ``latest_content``,
+``chat_history`` and ``dump`` materialize them only when the bytes are needed.
+
+``fork()`` branches a bus copy-on-write: the fork sees the parent's messages
+up to the fork point without copying them, and each side's later messages
+stay private to it.
 """
 
+from bisect import bisect_left
 from collections import defaultdict
 from dataclasses import asdict, is_dataclass
-from typing import Any, Callable, Dict, List
+from typing import Any, Callable, Dict, Iterable, List
+
+from core.blob_store import BLOBS, BlobHandle, BlobStore, materialize
+from core.tracing import span
 
 
 Message = Dict[str, Any]
 
 
 class MessageBus:
-    def __init__(self):
+    def __init__(self, blobs: BlobStore | None = None, parent: "MessageBus | None" = None):
+        self._blobs = (BLOBS if parent is None else parent._blobs) if blobs is None else blobs
+        # 分叉：共享父 bus 前 _parent_len 条消息（不复制），之后的消息各自独立（写时复制）
+        self._parent = parent
+        self._parent_len = parent.size() if parent is not None else 0
         self._storage: Dict[str, List[Message]] = defaultdict(list)
+        self._positions: Dict[str, List[int]] = defaultdict(list)
         self._subscribers: Dict[str, List[Callable[[Message], None]]] = defaultdict(list)
         self._timeline: List[Message] = []
+        self._sizes: List[int] = []  # 与 _timeline 对齐的载荷字节数（发布时计算，不物化 blob）
+
+    def fork(self) -> "MessageBus":
+        """Return a copy-on-write branch that sees this bus's messages so far.
 
-    def publish(self, topic: str, sender: str, content: Any) -> Message:
+        Messages published on the fork (or on this bus after forking) are not
+        visible to the other side; the shared prefix is never copied.
+        """
+        return MessageBus(parent=self)
+
+    def size(self) -> int:
+        """Number of messages visible on this bus (including a fork's prefix)."""
+        return self._parent_len + len(self._timeline)
+
+    def publish(self, topic: str, sender: str, content: Any, meta: Dict[str, Any] | None = None) -> Message:
         """Publish a structured message to a topic and notify subscribers."""
-        message: Message = {"topic": topic, "sender": sender, "content": content}
-        self._storage[topic].append(message)
-        self._timeline.append(message)
-        for handler in self._subscribers.get(topic, []):
-            handler(message)
-        return message
+        with span("MessageBus.publish", topic=topic, sender=sender) as publish_span:
+            # 按进入提示词的 JSON 形式计量（pickle 后的 blob 长度与提示词大小无关），在落盘前计算一次
+            payload_bytes = len(self._json_dump(content).encode("utf-8"))
+            content = self._blobs.spool(content)
+            if publish_span:
+                publish_span.set(payload_bytes=payload_bytes, spooled=isinstance(content, BlobHandle))
+            message: Message = {"topic": topic, "sender": sender, "content": content}
+            if meta is not None:
+                message["meta"] = meta
+            self._positions[topic].append(self._parent_len + len(self._timeline))
+            self._storage[topic].append(message)
+            self._timeline.append(message)
+            self._sizes.append(payload_bytes)
+            for handler in self._subscribers.get(topic, []):
+                handler(message)
+            return message
 
     def subscribe(self, topic: str, handler: Callable[[Message], None]):
         """Register a handler for a topic. Handlers receive past messages too."""
         self._subscribers[topic].append(handler)
-        for message in self._storage.get(topic, []):
+        for message in self.history(topic):
             handler(message)
 
     def latest(self, topic: str) -> Message | None:
         """Return the most recent message for a topic, if any."""
-        return self._storage.get(topic, [])[-1] if self._storage.get(topic) else None
+        return self._latest_before(topic, self.size())
+
+    def _latest_before(self, topic: str, limit: int) -> Message | None:
+        positions = self._positions.get(topic)
+        if positions:
+            index = bisect_left(positions, limit)
+            if index:
+                return self._storage[topic][index - 1]
+        if self._parent is None:
+            return None
+        return self._parent._latest_before(topic, min(limit, self._parent_len))
+
+    def latest_content(self, topic: str) -> Any:
+        """Return the materialized content of the latest message on a topic (None if absent)."""
+        message = self.latest(topic)
+        return materialize(message["content"]) if message else None
 
     def dump(self) -> Dict[str, List[Message]]:
         """Return the full message history for debugging or audits."""
-        return {
-            topic: [self._jsonable(message) for message in messages]
-            for topic, messages in self._storage.items()
-        }
+        grouped: Dict[str, List[Message]] = defaultdict(list)
+        for message in self.history():
+            grouped[message["topic"]].append(self._jsonable(message))
+        return dict(grouped)
 
     def history(self, topic: str | None = None) -> List[Message]:
         """Return chronological messages, optionally filtered by topic."""
+        timeline = self._history_before(self.size())
         if topic is None:
-            return list(self._timeline)
-        return [msg for msg in self._timeline if msg.get("topic") == topic]
-
-    def chat_history(self) -> List[Dict[str, Any]]:
-        """Return timeline encoded as chat messages for agent context."""
-
-        chat_messages: List[Dict[str, Any]] = []
-        for msg in self._timeline:
-            sender = msg.get("sender", "Agent")
-            topic = msg.get("topic", "")
-            role = "user" if sender.lower() == "user" else "assistant"
-            content_text = (
-                f"Topic: {topic}\nSender: {sender}\nContent:\n"
-                f"{self._json_dump(msg.get('content'))}"
-            )
-            chat_messages.append(
-                {"role": role, "content": [{"type": "text", "text": content_text}]}
-            )
-        return chat_messages
+            return timeline
+        return [msg for msg in timeline if msg.get("topic") == topic]
+
+    def _history_before(self, limit: int) -> List[Message]:
+        prefix = [] if self._parent is None else self._parent._history_before(min(limit, self._parent_len))
+        return prefix + self._timeline[: max(0, limit - self._parent_len)]
+
+    def _sizes_before(self, limit: int) -> List[int]:
+        prefix = [] if self._parent is None else self._parent._sizes_before(min(limit, self._parent_len))
+        return prefix + self._sizes[: max(0, limit - self._parent_len)]
+
+    def payload_bytes(self, topics: Iterable[str] | None = None) -> int:
+        """Total stored payload bytes, optionally for the given topics only.
+
+        Sizes are those of the JSON form ``chat_history`` renders into a
+        prompt, measured once on publish, so nothing is rendered or read back
+        from the blob store.
+        """
+        limit = self.size()
+        if topics is None:
+            return sum(self._sizes_before(limit))
+        allowed = set(topics)
+        return sum(
+            size
+            for message, size in zip(self._history_before(limit), self._sizes_before(limit))
+            if message.get("topic") in allowed
+        )
+
+    def chat_history(self, topics: Iterable[str] | None = None) -> List[Dict[str, Any]]:
+        """Return timeline encoded as chat messages for agent context.
+
+        ``topics`` restricts the history to the given topics.
+        """
+
+        with span("MessageBus.chat_history") as history_span:
+            allowed = None if topics is None else set(topics)
+            chat_messages: List[Dict[str, Any]] = []
+            for msg in self.history():
+                if allowed is not None and msg.get("topic") not in allowed:
+                    continue
+                sender = msg.get("sender", "Agent")
+                topic = msg.get("topic", "")
+                role = "user" if sender.lower() == "user" else "assistant"
+                content_text = (
+                    f"Topic: {topic}\nSender: {sender}\nContent:\n"
+                    f"{self._json_dump(msg.get('content'))}"
+                )
+                chat_messages.append(
+                    {"role": role, "content": [{"type": "text", "text": content_text}]}
+                )
+            if history_span:
+                history_span.set(
+                    messages=len(chat_messages),
+                    payload_bytes=sum(len(m["content"][0]["text"].encode("utf-8")) for m in chat_messages),
+                )
+            return chat_messages
 
     @staticmethod
     def _jsonable(value: Any) -> Any:
+        if isinstance(value, BlobHandle):
+            value = value.materialize()
         if is_dataclass(value):
             return asdict(value)
         if isinstance(value, dict):
@@ -0,0 +1,48 @@
+"""Per-step call records for run metrics.
+
+``Manager.run`` opens a collection scope around each workflow step; every
+``AgentBase.run`` executed inside that scope appends a record describing the
+LLM call (model, latency, coalescing, ...). Agents can also attach step-level
+notes (e.g. best-of-N outcome) with ``note``. Scopes live in a ``ContextVar``
+so concurrent runs in different threads never see each other's records.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator
+
+
+class StepRecords(list):
+    """Call records of one step, plus free-form ``notes`` about the step."""
+
+    def __init__(self):
+        super().__init__()
+        self.notes: Dict[str, Any] = {}
+
+
+_CURRENT: ContextVar[StepRecords | None] = ContextVar("step_calls", default=None)
+
+
+@contextmanager
+def collect_calls() -> Iterator[StepRecords]:
+    """Collect call records produced while the block executes."""
+    records = StepRecords()
+    token = _CURRENT.set(records)
+    try:
+        yield records
+    finally:
+        _CURRENT.reset(token)
+
+
+def record_call(**info: Any) -> None:
+    """Append a call record to the active scope (no-op outside a scope)."""
+    records = _CURRENT.get()
+    if records is not None:
+        records.append(info)
+
+
+def note(**info: Any) -> None:
+    """Attach step-level information to the active scope (no-op outside a scope)."""
+    records = _CURRENT.get()
+    if records is not None:
+        records.notes.update(info)
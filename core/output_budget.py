@@ -0,0 +1,217 @@
+"""Adaptive per-role output budgets.
+
+Completions used to run without ``max_tokens`` or stop sequences, so planning
+roles sometimes wrote very long JSON and the Engineer padded its page after
+the document was complete. ``OutputBudget`` learns each role's completion-token
+distribution from the ``usage`` of past calls and caps new requests at a high
+quantile of it (times a headroom factor); roles that produce a document get
+stop sequences (the Engineer stops at ``</html>``, which is re-appended since
+the API strips it).
+
+A capped request that still hits the limit (``finish_reason == "length"``) is
+re-sent once with twice the cap and widens that role's headroom, so a cap that
+was learned too tight rarely costs a truncated page while runaway generations
+stay bounded. Document roles (``core.continuation.CONTINUABLE``) are continued
+from the truncation point instead of being re-sent.
+
+Only calls that report ``usage`` are learned from: streams the caller
+cancelled (``finish_reason == "cancelled"``, e.g. losing best-of-N candidates)
+and responses without usage are counted but never sampled. Time saved is only
+credited when a stop sequence actually cut the output, and only from measured
+padding. Calls of a stop-sequence role that were sent without the stop (e.g.
+with budgets disabled, or stop sequences not yet configured) show how many
+tokens the role emits after the document closed. A cut call is credited the
+mean of those trailing tokens times the observed seconds per output token.
+Without such samples no saving is claimed. A call truncated by the cap saves
+nothing, since it is re-sent or continued.
+
+Budgets are on by default; ``WEBGEN_OUTPUT_BUDGET=0`` disables them and
+``WEBGEN_MAX_TOKENS_PARAM`` renames the parameter (e.g.
+``max_completion_tokens``) for endpoints that require it.
+"""
+
+import math
+import os
+import statistics
+import threading
+from collections import defaultdict, deque
+from typing import Deque, Dict, List
+
+
+# 产出完整文档的角色在文档闭合处停止（API 会去掉 stop 字符串，返回后补回）
+STOP_SEQUENCES: Dict[str, List[str]] = {
+    "Engineer": ["</html>"],
+}
+
+
+class OutputBudget:
+    def __init__(
+        self,
+        enabled: bool = True,
+        quantile: float = 0.99,
+        headroom: float = 1.25,
+        min_samples: int = 5,
+        min_tokens: int = 256,
+        window: int = 200,
+        token_param: str = "max_tokens",
+    ):
+        self.enabled = enabled
+        self.quantile = quantile
+        self.headroom = headroom
+        self.min_samples = min_samples
+        self.min_tokens = min_tokens
+        self.token_param = token_param
+        self._lock = threading.Lock()
+        self._tokens: Dict[str, Deque[int]] = defaultdict(lambda: deque(maxlen=window))
+        self._trailing: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+        self._seconds_per_token: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+        self._headroom: Dict[str, float] = {}
+        self._counters: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: {
+                "calls": 0,
+                "capped": 0,
+                "stopped": 0,
+                "truncated": 0,
+                "cancelled": 0,
+                "unsampled": 0,
+                "trailing_samples": 0,
+                "saved_seconds": 0.0,
+            }
+        )
+
+    def limit(self, role: str) -> int | None:
+        """Current ``max_tokens`` for ``role`` (None until enough history exists)."""
+
+        with self._lock:
+            samples = sorted(self._tokens.get(role, ()))
+            if not self.enabled or len(samples) < self.min_samples:
+                return None
+            index = min(len(samples) - 1, math.ceil(self.quantile * len(samples)) - 1)
+            headroom = self._headroom.get(role, self.headroom)
+            return max(self.min_tokens, math.ceil(samples[index] * headroom))
+
+    def request_options(self, role: str, adaptive: bool = True) -> Dict:
+        """Extra request parameters for the next completion of ``role``.
+
+        ``adaptive=False`` leaves out the learned cap and keeps only the static
+        stop sequences (e.g. for replayed batch requests, which must not change
+        between rounds).
+        """
+
+        if not self.enabled:
+            return {}
+        options = {}
+        cap = self.limit(role) if adaptive else None
+        if cap is not None:
+            options[self.token_param] = cap
+        if role in STOP_SEQUENCES:
+            options["stop"] = list(STOP_SEQUENCES[role])
+        return options
+
+    @staticmethod
+    def stop_hit(text: str | None, options: Dict, finish_reason: str | None) -> bool:
+        """Whether a stop sequence ended the completion (the API stripped it from ``text``)."""
+
+        stops = options.get("stop") or []
+        if not stops or finish_reason != "stop" or text is None or text.rstrip().endswith(stops[0]):
+            return False
+        # 没有 <html 的输出以 </html> 收尾不合理：模型是自然结束的
+        return not (stops[0] == "</html>" and "<html" not in text.lower())
+
+    @staticmethod
+    def trailing_tokens(role: str, text: str | None, tokens: int) -> float | None:
+        """Tokens emitted after the document closed, for a call of ``role`` sent without its stop sequence."""
+
+        stops = STOP_SEQUENCES.get(role)
+        if not stops or not text:
+            return None
+        end = text.lower().rfind(stops[0].lower())
+        if end < 0:
+            return None
+        tail = text[end + len(stops[0]):].strip()
+        # 按字符占比折算 token（usage 只给出整段的 token 数）
+        return tokens * len(tail) / len(text)
+
+    def finish(self, role: str, text: str, options: Dict, finish_reason: str | None) -> str:
+        """Re-append a stripped stop sequence to ``text``."""
+
+        if self.stop_hit(text, options, finish_reason):
+            return text.rstrip() + "\n" + options["stop"][0]
+        return text
+
+    def record(
+        self,
+        role: str,
+        options: Dict,
+        usage: Dict,
+        latency: float,
+        finish_reason: str | None,
+        text: str | None = None,
+    ) -> Dict:
+        """Learn from a finished call; returns the per-call report stored in the call record.
+
+        ``usage`` must be what the endpoint reported (no estimates); ``text``
+        is the returned output, used to tell whether the stop sequence cut it.
+        """
+
+        tokens = usage.get("completion_tokens")
+        cap = options.get(self.token_param)
+        cut = self.stop_hit(text, options, finish_reason)
+        report = {"max_tokens": cap, "stop": bool(options.get("stop")), "finish_reason": finish_reason}
+        with self._lock:
+            counters = self._counters[role]
+            counters["calls"] += 1
+            counters["capped"] += 1 if cap is not None else 0
+            if finish_reason == "cancelled":
+                # 调用方主动断开的流（如落选的 best-of-N 候选）：长度不代表该角色的输出
+                counters["cancelled"] += 1
+                return report
+            if finish_reason == "length" and cap is not None:
+                # 触顶说明分位数低估了该角色的输出长度：放宽余量，本次样本不入库
+                counters["truncated"] += 1
+                self._headroom[role] = self._headroom.get(role, self.headroom) * 1.5
+                report["truncated"] = True
+                return report
+            if cut:
+                counters["stopped"] += 1
+            if not isinstance(tokens, int) or tokens <= 0:
+                counters["unsampled"] += 1  # 端点未返回 usage：不用字符数粗估污染分布
+                return report
+            self._tokens[role].append(tokens)
+            if latency > 0:
+                self._seconds_per_token[role].append(latency / tokens)
+            if not options.get("stop"):
+                # 未带 stop 的文档类调用：实测文档闭合后多生成的 token
+                trailing = self.trailing_tokens(role, text, tokens)
+                if trailing is not None:
+                    self._trailing[role].append(trailing)
+                    counters["trailing_samples"] += 1
+            padding = self._trailing.get(role)
+            per_token = self._seconds_per_token.get(role)
+            if cut and padding and per_token:
+                saved = statistics.fmean(padding) * statistics.median(per_token)
+                counters["saved_seconds"] += saved
+                report["est_saved_seconds"] = round(saved, 3)
+        return report
+
+    def stats(self) -> Dict[str, Dict]:
+        roles = {}
+        for role in list(self._counters):
+            cap = self.limit(role)
+            with self._lock:
+                samples = sorted(self._tokens.get(role, ()))
+                counters = dict(self._counters[role])
+            counters["saved_seconds"] = round(counters["saved_seconds"], 3)
+            roles[role] = {
+                **counters,
+                "max_tokens": cap,
+                "p50_tokens": samples[len(samples) // 2] if samples else None,
+                "p95_tokens": samples[min(len(samples) - 1, math.ceil(0.95 * len(samples)) - 1)] if samples else None,
+            }
+        return roles
+
+
+OUTPUT_BUDGET = OutputBudget(
+    enabled=os.getenv("WEBGEN_OUTPUT_BUDGET", "1") != "0",
+    token_param=os.getenv("WEBGEN_MAX_TOKENS_PARAM", "max_tokens"),
+)
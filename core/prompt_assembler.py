@@ -0,0 +1,121 @@
+"""Prompt assembly without duplicated artifacts.
+
+With shared context on, agents used to send their inputs (the brief, PRD,
+PageSpec, TaskPlan) as the user payload while the very same artifacts were
+already in the context from ``MessageBus.chat_history()`` — rendered as
+``indent=2`` JSON. ``assemble_prompt`` canonicalizes both sides, replaces the
+payload (or payload fields) already present in the context with a short
+reference to their topic, and re-renders context payloads as compact canonical
+JSON. Strings are deduplicated like structured artifacts, but only where the
+reference is shorter than the text it replaces. The report (bytes/tokens
+before and after) is attached to the step metrics.
+"""
+
+import json
+from dataclasses import asdict, dataclass, field, is_dataclass
+from typing import Any, Dict, List
+
+from core.rate_limiter import CHARS_PER_TOKEN
+
+
+_CONTENT_MARKER = "\nContent:\n"
+REFERENCE = "见上文 Topic: {topic}（内容相同，不再重复）"
+
+
+@dataclass
+class AssembledPrompt:
+    user_prompt: str
+    context: List[Dict[str, Any]]
+    report: Dict[str, Any] = field(default_factory=dict)
+
+
+def canonical_json(value: Any) -> str:
+    """Compact, key-sorted JSON (dataclasses are converted first)."""
+    if is_dataclass(value) and not isinstance(value, type):
+        value = asdict(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+
+
+def _split_message(text: str):
+    """Split a ``chat_history`` message into (header, parsed content) or None."""
+
+    head, marker, body = text.partition(_CONTENT_MARKER)
+    if not marker or not head.startswith("Topic: "):
+        return None
+    try:
+        return head, json.loads(body)
+    except ValueError:
+        return None
+
+
+def _reference(value: Any, present: Dict[str, str]) -> str | None:
+    """Topic of the context message carrying ``value``, when referring to it is shorter than repeating it."""
+
+    canonical = canonical_json(value)
+    topic = present.get(canonical)
+    if topic is None or len(REFERENCE.format(topic=topic)) >= len(canonical):
+        return None
+    return topic
+
+
+def _size(user_prompt: str, context):
+    """(bytes, characters) of the user prompt plus all context texts."""
+    texts = [user_prompt] + [part.get("text", "") for message in context for part in message.get("content", [])]
+    return sum(len(text.encode("utf-8")) for text in texts), sum(len(text) for text in texts)
+
+
+def assemble_prompt(payload: Any, context=None, verbose_prompt: str | None = None) -> AssembledPrompt:
+    """Build the user prompt for ``payload`` against ``context``.
+
+    ``payload`` is the structured input (usually a dict of artifacts);
+    ``verbose_prompt`` is the prompt the agent would have sent otherwise and
+    only serves as the baseline of the report.
+    """
+
+    context = list(context or [])
+    if verbose_prompt is None:
+        verbose_prompt = json.dumps(payload, ensure_ascii=False)
+    before = _size(verbose_prompt, context)
+
+    # 上下文中的结构化产物：规范化后建立 内容 -> 话题 的索引，并改写为紧凑 JSON
+    present: Dict[str, str] = {}
+    compacted = []
+    for message in context:
+        parts = message.get("content", [])
+        parsed = _split_message(parts[0].get("text", "")) if len(parts) == 1 else None
+        if parsed is None:
+            compacted.append(message)
+            continue
+        head, content = parsed
+        canonical = canonical_json(content)
+        present.setdefault(canonical, head.splitlines()[0][len("Topic: "):])
+        text = f"{head}{_CONTENT_MARKER}{canonical}"
+        compacted.append(dict(message, content=[dict(parts[0], text=text)]))
+
+    referenced = []
+    whole = _reference(payload, present)
+    if whole is not None:
+        referenced.append(whole)
+        user_prompt = REFERENCE.format(topic=whole)
+    elif isinstance(payload, dict):
+        slim = {}
+        for key, value in payload.items():
+            topic = _reference(value, present)
+            if topic is not None:
+                referenced.append(topic)
+                slim[key] = REFERENCE.format(topic=topic)
+            else:
+                slim[key] = value
+        user_prompt = canonical_json(slim)
+    else:
+        user_prompt = payload if isinstance(payload, str) else canonical_json(payload)
+
+    after = _size(user_prompt, compacted)
+    report = {
+        "referenced": referenced,
+        "bytes_before": before[0],
+        "bytes_after": after[0],
+        "bytes_saved": before[0] - after[0],
+        "tokens_saved": int((before[1] - after[1]) / CHARS_PER_TOKEN),
+    }
+    return AssembledPrompt(user_prompt=user_prompt, context=compacted, report=report)
@@ -0,0 +1,257 @@
+"""Process-wide client-side rate limiter and concurrency governor.
+
+Once pipelines run in parallel, all roles from many Managers hit the same
+endpoint. ``RequestGovernor`` admits LLM requests through two token buckets
+(requests/min and tokens/min) plus an optional concurrency cap. Waiting
+requests form a priority queue — only the head may take capacity — so
+Engineer calls are not starved by a flood of small planning calls.
+
+Priorities age. Each priority level is worth ``aging`` seconds of waiting, so
+a request is overtaken only by higher-priority requests that arrived less than
+``(its level - their level) * aging`` seconds after it. Continuous Engineer
+load therefore delays a TeamLeader call by at most ``2 * aging`` seconds (plus
+the capacity needed for what was already queued) instead of starving it.
+
+Token cost is estimated before sending (prompt characters + an expected
+completion size per role) and corrected from the response ``usage`` once it
+is known; a 429 from the server drains the buckets so everyone backs off.
+Limits default to "unlimited" and can be set with ``configure`` or the
+``WEBGEN_RPM`` / ``WEBGEN_TPM`` / ``WEBGEN_MAX_CONCURRENCY`` environment
+variables.
+"""
+
+import heapq
+import itertools
+import json
+import os
+import statistics
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Deque, Dict, List
+
+from core import deadline
+
+
+# 数值越小越优先：Engineer 产出最终页面，处于关键路径末端
+ROLE_PRIORITY: Dict[str, int] = {
+    "Engineer": 0,
+    "PM": 1,
+    "Architect": 1,
+    "Project": 1,
+    "TeamLeader": 2,
+}
+
+# 预估的输出 token 数（用于发送前的 TPM 预扣）
+EXPECTED_COMPLETION_TOKENS: Dict[str, int] = {
+    "Engineer": 8000,
+    "PM": 1200,
+    "Architect": 1500,
+    "Project": 1500,
+    "TeamLeader": 800,
+}
+
+CHARS_PER_TOKEN = 2.5  # 中英混合提示词的粗略换算
+
+
+def estimate_tokens(messages, role: str, max_completion: int | None = None) -> int:
+    """Rough prompt + completion token estimate for admission control.
+
+    ``max_completion`` (the request's ``max_tokens``, when capped) replaces the
+    per-role expected completion size if it is smaller.
+    """
+    prompt_chars = len(json.dumps(messages, ensure_ascii=False))
+    completion = EXPECTED_COMPLETION_TOKENS.get(role, 1000)
+    if max_completion is not None:
+        completion = min(completion, max_completion)
+    return int(prompt_chars / CHARS_PER_TOKEN) + completion
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float | None):
+        self.capacity = per_minute
+        self.rate = None if per_minute is None else per_minute / 60.0
+        self.level = per_minute or 0.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if self.rate is None:
+            return
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until ``amount`` is available (0 when it is available now)."""
+        if self.rate is None:
+            return 0.0
+        self._refill(now)
+        # 单次请求超过桶容量时，按装满即放行，避免永久阻塞
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        if self.rate is not None:
+            self.level -= amount
+
+    def credit(self, amount: float) -> None:
+        """Return (positive) or charge (negative) tokens after the real cost is known."""
+        if self.rate is not None:
+            self.level = min(self.capacity, self.level + amount)
+
+    def drain(self) -> None:
+        if self.rate is not None:
+            self.level = min(self.level, 0.0)
+
+
+class Permit:
+    def __init__(self, governor: "RequestGovernor", role: str, estimate: int, waited: float):
+        self.governor = governor
+        self.role = role
+        self.estimate = estimate
+        self.waited = waited
+        self.actual: int | None = None
+
+    def settle(self, actual_tokens: int | None) -> None:
+        """Correct the token bucket with the response's real usage."""
+        if actual_tokens is None or self.actual is not None:
+            return
+        self.actual = actual_tokens
+        self.governor._settle(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.governor._release(self, exc)
+        return False
+
+
+class RequestGovernor:
+    def __init__(
+        self,
+        rpm: float | None = None,
+        tpm: float | None = None,
+        max_concurrency: int | None = None,
+        priorities: Dict[str, int] | None = None,
+        aging: float = 30.0,
+    ):
+        if aging <= 0:
+            raise ValueError("aging must be positive")
+        self.priorities = dict(ROLE_PRIORITY if priorities is None else priorities)
+        self.aging = aging
+        self._cond = threading.Condition()
+        self._queue: List = []
+        self._seq = itertools.count()
+        self._waits: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=500))
+        self._throttled = 0
+        self._server_429 = 0
+        self.configure(rpm=rpm, tpm=tpm, max_concurrency=max_concurrency)
+
+    def configure(self, rpm: float | None = None, tpm: float | None = None, max_concurrency: int | None = None):
+        with self._cond:
+            self.requests = TokenBucket(rpm)
+            self.tokens = TokenBucket(tpm)
+            self.max_concurrency = max_concurrency
+            self.in_flight = 0
+            self._cond.notify_all()
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests.rate is not None or self.tokens.rate is not None or self.max_concurrency is not None
+
+    def acquire(self, role: str, estimate: int) -> Permit:
+        """Block until the request may be sent; returns a permit to use as a context manager."""
+
+        if not self.enabled:
+            return Permit(self, role, estimate, 0.0)
+
+        started = time.monotonic()
+        # 排序键 = 入队时刻 + 优先级 × aging：低优先级请求等待足够久后不会再被插队
+        entry = (started + self.priorities.get(role, 1) * self.aging, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    delay = 0.0
+                    if self._queue[0] == entry:
+                        delay = max(self.requests.wait_time(1, now), self.tokens.wait_time(estimate, now))
+                        slot_free = self.max_concurrency is None or self.in_flight < self.max_concurrency
+                        if delay == 0.0 and slot_free:
+                            break
+                    left = deadline.remaining()
+                    if left is not None and left <= max(delay, 0.0):
+                        raise deadline.DeadlineExceeded(f"{role}: rate limit wait exceeds the time budget")
+                    timeout = delay if delay > 0 else None
+                    if left is not None:
+                        timeout = left if timeout is None else min(timeout, left)
+                    self._cond.wait(timeout)
+            except BaseException:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+                raise
+
+            heapq.heappop(self._queue)
+            self.requests.take(1)
+            self.tokens.take(estimate)
+            self.in_flight += 1
+            waited = time.monotonic() - started
+            self._waits[role].append(waited)
+            if waited > 0.001:
+                self._throttled += 1
+            self._cond.notify_all()
+        return Permit(self, role, estimate, waited)
+
+    def _settle(self, permit: Permit) -> None:
+        with self._cond:
+            self.tokens.credit(permit.estimate - permit.actual)
+            self._cond.notify_all()
+
+    def _release(self, permit: Permit, exc: BaseException | None) -> None:
+        if not self.enabled:
+            return
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            if exc is not None and getattr(exc, "status_code", None) == 429:
+                # 服务端限流：清空令牌桶，所有等待者按补充速率自然退避
+                self._server_429 += 1
+                self.requests.drain()
+                self.tokens.drain()
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, object]:
+        """Wait-time percentiles per role plus throttling counters."""
+
+        with self._cond:
+            waits = {role: list(samples) for role, samples in self._waits.items()}
+            queued = len(self._queue)
+            in_flight = self.in_flight
+        per_role = {}
+        for role, samples in waits.items():
+            ordered = sorted(samples)
+            per_role[role] = {
+                "requests": len(ordered),
+                "p50_wait": round(statistics.median(ordered), 3),
+                "p95_wait": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 3),
+                "max_wait": round(ordered[-1], 3),
+            }
+        return {
+            "queued": queued,
+            "in_flight": in_flight,
+            "throttled": self._throttled,
+            "server_429": self._server_429,
+            "roles": per_role,
+        }
+
+
+def _env_number(name: str):
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+GOVERNOR = RequestGovernor(
+    rpm=_env_number("WEBGEN_RPM"),
+    tpm=_env_number("WEBGEN_TPM"),
+    max_concurrency=int(_env_number("WEBGEN_MAX_CONCURRENCY") or 0) or None,
+)
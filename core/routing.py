@@ -0,0 +1,112 @@
+"""Per-role model routing with latency-aware selection.
+
+Every agent used to be pinned to ``gpt-5-chat-latest``. A ``ModelRouter``
+maps each role to a preferred model plus fallbacks and a quality floor, keeps
+rolling latency / error statistics per model, and ranks the candidates for a
+call: models below the role's floor are never used, models with a high
+recent error rate are tried last, and the rest are ordered by observed
+median latency for that role (ties keep the table order, so the preferred
+model wins until there is evidence against it). Latency and error rate are
+both kept per (model, role): an Engineer completion is much longer than a
+TeamLeader one, and long Engineer calls that time out must not mark a model
+unhealthy for the small JSON roles.
+"""
+
+import statistics
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Tuple
+
+
+@dataclass
+class RoleRoute:
+    preferred: str
+    fallbacks: List[str] = field(default_factory=list)
+    quality_floor: float = 0.0
+
+
+# 相对质量评分（0~1），用于与角色的质量下限比较
+DEFAULT_MODEL_QUALITY: Dict[str, float] = {
+    "gpt-5-chat-latest": 1.0,
+    "gpt-4.1": 0.85,
+    "gpt-4.1-mini": 0.7,
+}
+
+# JSON 规划类小角色（TeamLeader / Project）优先走小模型，Engineer 保持大模型
+DEFAULT_ROUTES: Dict[str, RoleRoute] = {
+    "TeamLeader": RoleRoute("gpt-4.1-mini", ["gpt-4.1", "gpt-5-chat-latest"], 0.6),
+    "Project": RoleRoute("gpt-4.1-mini", ["gpt-4.1", "gpt-5-chat-latest"], 0.6),
+    "PM": RoleRoute("gpt-5-chat-latest", ["gpt-4.1"], 0.8),
+    "Architect": RoleRoute("gpt-5-chat-latest", ["gpt-4.1"], 0.8),
+    "Engineer": RoleRoute("gpt-5-chat-latest", ["gpt-4.1"], 0.85),
+}
+
+
+class ModelRouter:
+    def __init__(
+        self,
+        routes: Dict[str, RoleRoute] | None = None,
+        model_quality: Dict[str, float] | None = None,
+        window: int = 50,
+        min_samples: int = 3,
+        max_error_rate: float = 0.3,
+    ):
+        self.routes = dict(DEFAULT_ROUTES if routes is None else routes)
+        self.model_quality = dict(DEFAULT_MODEL_QUALITY if model_quality is None else model_quality)
+        self.window = window
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self._lock = threading.Lock()
+        self._samples: Dict[Tuple[str, str], Deque[Tuple[float, bool]]] = {}
+
+    def candidates(self, role: str, default_model: str) -> List[str]:
+        """Return the ranked models to try for ``role`` (first = chosen route)."""
+
+        route = self.routes.get(role) or RoleRoute(default_model)
+        ordered = []
+        for model in [route.preferred, *route.fallbacks]:
+            if model not in ordered and self.model_quality.get(model, 1.0) >= route.quality_floor:
+                ordered.append(model)
+        if not ordered:
+            ordered = [default_model]
+
+        with self._lock:
+            stats = {model: self._summary(model, role) for model in ordered}
+        known = [s["p50_latency"] for s in stats.values() if s["p50_latency"] is not None]
+        # 样本不足的模型按当前最快已知延迟乐观估计，保证偶尔被探索
+        optimistic = min(known) if known else 0.0
+
+        def rank(item):
+            position, model = item
+            summary = stats[model]
+            unhealthy = summary["samples"] >= self.min_samples and summary["error_rate"] > self.max_error_rate
+            latency = summary["p50_latency"]
+            return (unhealthy, optimistic if latency is None else latency, position)
+
+        return [model for _, model in sorted(enumerate(ordered), key=rank)]
+
+    def record(self, model: str, latency: float, ok: bool, role: str = "") -> None:
+        """Feed one call outcome back into the rolling statistics."""
+        with self._lock:
+            samples = self._samples.setdefault((model, role), deque(maxlen=self.window))
+            samples.append((latency, ok))
+
+    def stats(self) -> Dict[str, Dict[str, float | int | None]]:
+        """Per-model rolling latency and error rate (all roles combined)."""
+        with self._lock:
+            return {model: self._summary(model) for model in dict.fromkeys(model for model, _ in self._samples)}
+
+    def _summary(self, model: str, role: str | None = None) -> Dict[str, float | int | None]:
+        if role is None:
+            samples = [sample for (m, _), window in self._samples.items() if m == model for sample in window]
+        else:
+            samples = self._samples.get((model, role), ())
+        latencies = [latency for latency, ok in samples if ok]
+        errors = sum(1 for _, ok in samples if not ok)
+        has_enough = len(latencies) >= self.min_samples
+        return {
+            "samples": len(samples),
+            "error_rate": round(errors / len(samples), 3) if samples else 0.0,
+            "p50_latency": round(statistics.median(latencies), 3) if has_enough else None,
+        }
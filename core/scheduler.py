@@ -0,0 +1,196 @@
+"""Priority- and fairness-aware admission of workflow steps.
+
+When many pipelines share one process, every step used to start as soon as
+its run reached it, so a burst of bulk briefs could keep the interactive ones
+waiting behind them at the rate limiter. ``StageScheduler`` admits individual
+steps (not whole runs) into a bounded number of execution slots. When a slot
+frees up, the waiting step with the lowest score is admitted:
+
+    score = class offset + tenant lag - seconds waited - critical-path bonus
+
+* priority classes (``interactive`` < ``standard`` < ``bulk``) are offsets in
+  seconds, so a step of a lower class overtakes a higher class only after it
+  has waited that much longer (aging, which rules out starvation);
+* within the same class, tenants share the slots fairly: every tenant has a
+  virtual time that grows with the slot-seconds its steps used divided by its
+  weight, and the lag behind the least-served waiting tenant is added. A
+  tenant that joins or returns after idling starts no earlier than the least
+  served active (waiting or running) tenant, so idle time earns no credit;
+* steps on the critical path (the Engineer and the planning steps it waits
+  for) get a bonus, since they unblock the final page.
+
+Queue wait and step latency percentiles are kept per class and per tenant.
+Scheduling is off by default (every step is admitted at once, statistics are
+still collected); ``WEBGEN_STAGE_CONCURRENCY`` or ``configure`` sets the number
+of slots.
+"""
+
+import itertools
+import math
+import os
+import statistics
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, List
+
+from core import deadline
+
+
+# 优先级类别 -> 分数偏移（秒）：低类别的步骤需多等待相应秒数才能超过高类别
+PRIORITY_CLASSES: Dict[str, float] = {
+    "interactive": 0.0,
+    "standard": 30.0,
+    "bulk": 120.0,
+}
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def _summary(samples) -> Dict[str, float | int]:
+    ordered = sorted(samples)
+    if not ordered:
+        return {"count": 0}
+    return {
+        "count": len(ordered),
+        "p50": round(statistics.median(ordered), 3),
+        "p95": round(_percentile(ordered, 0.95), 3),
+        "p99": round(_percentile(ordered, 0.99), 3),
+        "max": round(ordered[-1], 3),
+    }
+
+
+class _Ticket:
+    __slots__ = ("seq", "tenant", "priority", "critical", "step", "enqueued")
+
+    def __init__(self, seq: int, tenant: str, priority: str, critical: bool, step: str):
+        self.seq = seq
+        self.tenant = tenant
+        self.priority = priority
+        self.critical = critical
+        self.step = step
+        self.enqueued = time.monotonic()
+
+
+class StageScheduler:
+    def __init__(
+        self,
+        slots: int | None = None,
+        classes: Dict[str, float] | None = None,
+        critical_bonus: float = 15.0,
+        tenant_weights: Dict[str, float] | None = None,
+        window: int = 1000,
+    ):
+        self.classes = dict(PRIORITY_CLASSES if classes is None else classes)
+        self.critical_bonus = critical_bonus
+        self.tenant_weights = dict(tenant_weights or {})
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._waiting: List[_Ticket] = []
+        self._vtime: Dict[str, float] = {}
+        self._vclock = 0.0  # 租户入队时的虚拟时间下限（活跃租户的最小虚拟时间）
+        self._running_tenants: Counter = Counter()
+        self._waits: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+        self._latencies: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+        self._tenant_waits: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+        self._overtaken = 0
+        self.configure(slots)
+
+    def configure(self, slots: int | None = None) -> None:
+        if slots is not None and slots < 1:
+            raise ValueError("slots must be a positive integer or None")
+        with self._cond:
+            self.slots = slots
+            self.running = 0
+            self._cond.notify_all()
+
+    @property
+    def enabled(self) -> bool:
+        return self.slots is not None
+
+    def _score(self, ticket: _Ticket, now: float, floor: float) -> float:
+        # 虚拟时间在释放槽位时已按租户权重缩放，这里不能再除一次
+        lag = self._vtime.get(ticket.tenant, floor) - floor
+        score = self.classes[ticket.priority] + lag - (now - ticket.enqueued)
+        return score - self.critical_bonus if ticket.critical else score
+
+    def _next(self) -> _Ticket:
+        now = time.monotonic()
+        floor = min(self._vtime.get(ticket.tenant, 0.0) for ticket in self._waiting)
+        return min(self._waiting, key=lambda ticket: (self._score(ticket, now, floor), ticket.seq))
+
+    @contextmanager
+    def slot(
+        self, tenant: str = "default", priority: str = "standard", critical: bool = False, step: str = ""
+    ) -> Iterator[Dict[str, float]]:
+        """Wait for an execution slot for one step; yields the step's scheduling record."""
+
+        if priority not in self.classes:
+            raise ValueError(f"Unknown priority class: {priority}")
+        ticket = _Ticket(next(self._seq), tenant, priority, critical, step)
+        with self._cond:
+            # 新出现或空闲后返回的租户从活跃租户的最小虚拟时间起步，不能靠空闲期攒下的额度插队
+            active = {other.tenant for other in self._waiting} | set(self._running_tenants)
+            # 空闲期过后任何租户都不保留额度：虚拟时钟推进到已服务最多的租户
+            vtimes = [self._vtime[name] for name in active] if active else list(self._vtime.values())
+            self._vclock = max(self._vclock, (min if active else max)(vtimes, default=0.0))
+            self._vtime[tenant] = max(self._vtime.get(tenant, 0.0), self._vclock)
+            self._waiting.append(ticket)
+            try:
+                while self.enabled and (self.running >= self.slots or self._next() is not ticket):
+                    left = deadline.remaining()
+                    if left is not None and left <= 0:
+                        raise deadline.DeadlineExceeded(f"{step or tenant}: no execution slot within the time budget")
+                    # 排队分数随等待时间变化（老化），定期重新评估
+                    self._cond.wait(1.0 if left is None else min(1.0, left))
+            except BaseException:
+                self._waiting.remove(ticket)
+                self._cond.notify_all()
+                raise
+            if any(other.seq < ticket.seq for other in self._waiting):
+                self._overtaken += 1
+            self._waiting.remove(ticket)
+            self.running += 1
+            self._running_tenants[tenant] += 1
+            waited = time.monotonic() - ticket.enqueued
+            self._waits[priority].append(waited)
+            self._tenant_waits[tenant].append(waited)
+        record = {"tenant": tenant, "priority": priority, "critical": critical, "queue_wait": round(waited, 3)}
+        started = time.monotonic()
+        try:
+            yield record
+        finally:
+            duration = time.monotonic() - started
+            with self._cond:
+                self.running = max(0, self.running - 1)
+                self._running_tenants[tenant] -= 1
+                if not self._running_tenants[tenant]:
+                    del self._running_tenants[tenant]
+                self._vtime[tenant] += duration / self.tenant_weights.get(tenant, 1.0)
+                self._latencies[priority].append(waited + duration)
+                self._cond.notify_all()
+
+    def stats(self) -> Dict[str, object]:
+        """Queue wait and latency (wait + execution) percentiles per class, waits per tenant."""
+
+        with self._cond:
+            classes = {
+                name: {"queue_wait": _summary(self._waits[name]), "latency": _summary(self._latencies[name])}
+                for name in self.classes
+                if self._waits.get(name) or self._latencies.get(name)
+            }
+            tenants = {tenant: _summary(samples) for tenant, samples in self._tenant_waits.items()}
+            return {
+                "slots": self.slots,
+                "running": self.running,
+                "queued": len(self._waiting),
+                "overtaken": self._overtaken,
+                "classes": classes,
+                "tenants": tenants,
+            }
+
+
+SCHEDULER = StageScheduler(slots=int(os.getenv("WEBGEN_STAGE_CONCURRENCY") or 0) or None)
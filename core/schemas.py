@@ -4,6 +4,18 @@ from dataclasses import dataclass, field
 from typing import List
 
 
+@dataclass
+class RoleTask:
+    role: str
+    tasks: List[str]
+
+
+@dataclass
+class TeamPlan:
+    available_roles: List[str]
+    tasks: List[RoleTask]
+
+
 @dataclass
 class PageSection:
     id: str
@@ -51,3 +63,25 @@ class TaskItem:
 class TaskPlan:
     summary: str
     prioritized_tasks: List[TaskItem]
+
+
+@dataclass
+class AuditViolation:
+    rule: str
+    detail: str
+
+
+@dataclass
+class PerfAudit:
+    dom_nodes: int
+    dom_depth: int
+    inline_css_bytes: int
+    inline_js_bytes: int
+    html_bytes: int
+    minified_bytes: int
+    render_blocking: List[str] = field(default_factory=list)
+    images_missing_dimensions: List[str] = field(default_factory=list)
+    images_missing_lazy: List[str] = field(default_factory=list)
+    unused_selectors: List[str] = field(default_factory=list)
+    storage_loops: List[str] = field(default_factory=list)
+    violations: List[AuditViolation] = field(default_factory=list)
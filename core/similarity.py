@@ -0,0 +1,107 @@
+"""Shingle / MinHash similarity index.
+
+Used to find previously seen items (component fragments, briefs) that are
+near-duplicates of a query text. Texts are turned into character shingles,
+summarised as MinHash signatures and bucketed with LSH banding so a query only
+compares against candidates that share at least one band; the Jaccard
+similarity is then estimated from the signatures.
+"""
+
+import hashlib
+import re
+import struct
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+_MERSENNE = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", (text or "").lower()).strip()
+
+
+def shingles(text: str, k: int = 4) -> Set[str]:
+    """Character k-shingles of the normalized text (works for CJK without tokenizing)."""
+    text = normalize_text(text)
+    if len(text) <= k:
+        return {text} if text else set()
+    return {text[i: i + k] for i in range(len(text) - k + 1)}
+
+
+def _hash32(value: str) -> int:
+    return struct.unpack("<I", hashlib.blake2b(value.encode("utf-8"), digest_size=4).digest())[0]
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = hashlib.sha256(str(seed).encode()).digest()
+        params = []
+        counter = 0
+        while len(params) < num_perm:
+            block = hashlib.sha256(rng + counter.to_bytes(4, "little")).digest()
+            counter += 1
+            a, b = struct.unpack("<QQ", block[:16])
+            params.append(((a % (_MERSENNE - 1)) + 1, b % _MERSENNE))
+        self.params = params
+
+    def signature(self, features: Iterable[str]) -> Tuple[int, ...]:
+        hashed = [_hash32(f) for f in features]
+        if not hashed:
+            return tuple([_MAX_HASH] * len(self.params))
+        return tuple(min(((a * h + b) % _MERSENNE) & _MAX_HASH for h in hashed) for a, b in self.params)
+
+
+def estimate_jaccard(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+class MinHashIndex:
+    def __init__(self, num_perm: int = 64, bands: int = 16, k: int = 4):
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.k = k
+        self._lock = threading.Lock()
+        self._signatures: Dict[str, Tuple[int, ...]] = {}
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[str]] = defaultdict(set)
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        return self.hasher.signature(shingles(text, self.k))
+
+    def add(self, key: str, text: str) -> None:
+        sig = self.signature(text)
+        with self._lock:
+            self._remove_locked(key)
+            self._signatures[key] = sig
+            for band in range(self.bands):
+                self._buckets[(band, sig[band * self.rows: (band + 1) * self.rows])].add(key)
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            self._remove_locked(key)
+
+    def _remove_locked(self, key: str) -> None:
+        sig = self._signatures.pop(key, None)
+        if sig is None:
+            return
+        for band in range(self.bands):
+            self._buckets[(band, sig[band * self.rows: (band + 1) * self.rows])].discard(key)
+
+    def query(self, text: str, threshold: float = 0.5, limit: int = 5) -> List[Tuple[str, float]]:
+        """Keys whose estimated Jaccard similarity to ``text`` is >= threshold, best first."""
+
+        sig = self.signature(text)
+        with self._lock:
+            candidates = set()
+            for band in range(self.bands):
+                candidates |= self._buckets.get((band, sig[band * self.rows: (band + 1) * self.rows]), set())
+            scored = [(key, estimate_jaccard(sig, self._signatures[key])) for key in candidates]
+        scored = [item for item in scored if item[1] >= threshold]
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored[:limit]
+
+    def __len__(self) -> int:
+        return len(self._signatures)
@@ -0,0 +1,99 @@
+"""In-flight request coalescing (single-flight).
+
+When several callers ask for the same work at the same time, only the first
+one (the *leader*) executes it; the others wait on the in-flight call and all
+receive the same result (or the same exception). Nothing is cached once the
+call finishes, so a later identical request triggers a fresh execution.
+
+Two process-wide groups are provided:
+
+* ``AGENT_CALLS`` – keyed on ``(agent, model, messages, options, streaming)``
+  for ``AgentBase.run``
+* ``MANAGER_RUNS`` – keyed on the brief and workflow configuration for
+  ``Manager.run``
+"""
+
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+
+def request_key(*parts: Any) -> str:
+    """Hash arbitrary JSON-like parts into a stable coalescing key."""
+
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._executed = 0
+        self._coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run ``fn`` once per in-flight ``key``.
+
+        Returns ``(result, shared)`` where ``shared`` is True when the caller
+        waited on another caller's execution instead of running ``fn`` itself.
+        """
+
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._executed += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+        return call.result, False
+
+    def stats(self) -> Dict[str, int]:
+        """Return executed / coalesced counters and the current in-flight count."""
+        with self._lock:
+            return {
+                "executed": self._executed,
+                "coalesced": self._coalesced,
+                "in_flight": len(self._calls),
+            }
+
+
+AGENT_CALLS = SingleFlight("agent_calls")
+MANAGER_RUNS = SingleFlight("manager_runs")
+
+
+def coalescing_stats() -> Dict[str, Dict[str, int]]:
+    """Snapshot of both process-wide single-flight groups."""
+    return {group.name: group.stats() for group in (AGENT_CALLS, MANAGER_RUNS)}
@@ -0,0 +1,165 @@
+"""Pluggable tracing with Chrome-trace / JSONL export.
+
+Spans nest through a ``ContextVar`` so each thread (and each Manager run)
+builds its own tree::
+
+    with span("Manager.run", cp=True) as s:
+        ...
+        s.set(tokens=123)
+
+Tracing is off by default. While disabled ``span`` returns a shared no-op
+object (falsy, so callers can skip computing expensive attributes with
+``if s:``), which keeps the overhead to one attribute check per call site.
+Enable it with ``enable()`` or ``WEBGEN_TRACE=1`` and export the collected
+spans with ``export_chrome_trace`` (open in chrome://tracing or Perfetto for a
+flame view) or ``export_jsonl``.
+"""
+
+import itertools
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List
+
+
+_CURRENT: ContextVar["Span | None"] = ContextVar("current_span", default=None)
+_IDS = itertools.count(1)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __bool__(self):
+        return False
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    __slots__ = ("tracer", "name", "attrs", "span_id", "parent_id", "start_ns", "end_ns", "tid", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, attrs: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.span_id = next(_IDS)
+        self.parent_id = None
+        self.start_ns = 0
+        self.end_ns = 0
+        self.tid = 0
+        self._token = None
+
+    def __enter__(self):
+        parent = _CURRENT.get()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.tid = threading.get_ident()
+        self._token = _CURRENT.set(self)
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.perf_counter_ns()
+        _CURRENT.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer._finish(self)
+        return False
+
+    def __bool__(self):
+        return True
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.span_id,
+            "parent": self.parent_id,
+            "name": self.name,
+            "start_us": (self.start_ns - self.tracer.origin_ns) / 1000,
+            "duration_us": (self.end_ns - self.start_ns) / 1000,
+            "tid": self.tid,
+            "attrs": self.attrs,
+        }
+
+
+class Tracer:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.origin_ns = time.perf_counter_ns()
+        self._lock = threading.Lock()
+        self._spans: List[Span] = []
+
+    def span(self, name: str, **attrs: Any):
+        if not self.enabled:
+            return _NOOP
+        return Span(self, name, attrs)
+
+    def _finish(self, span: Span) -> None:
+        with self._lock:
+            self._spans.append(span)
+
+    def spans(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            finished = list(self._spans)
+        return [s.to_dict() for s in sorted(finished, key=lambda s: s.start_ns)]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._spans.clear()
+        self.origin_ns = time.perf_counter_ns()
+
+    def export_jsonl(self, path: str) -> None:
+        """One span per line (parent ids preserved for offline analysis)."""
+        with open(path, "w", encoding="utf-8") as fh:
+            for record in self.spans():
+                fh.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+    def export_chrome_trace(self, path: str) -> None:
+        """Write complete ('X') events in the Chrome trace-event format."""
+        pid = os.getpid()
+        events = [
+            {
+                "name": record["name"],
+                "cat": record["name"].split(".", 1)[0].split(":", 1)[0],
+                "ph": "X",
+                "ts": record["start_us"],
+                "dur": record["duration_us"],
+                "pid": pid,
+                "tid": record["tid"],
+                "args": record["attrs"],
+            }
+            for record in self.spans()
+        ]
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, fh, ensure_ascii=False, default=str)
+
+
+TRACER = Tracer(enabled=os.getenv("WEBGEN_TRACE", "") not in ("", "0"))
+
+
+def span(name: str, **attrs: Any):
+    """Open a span on the process-wide tracer (no-op while tracing is disabled)."""
+    if not TRACER.enabled:
+        return _NOOP
+    return Span(TRACER, name, attrs)
+
+
+def enable() -> None:
+    TRACER.enabled = True
+
+
+def disable() -> None:
+    TRACER.enabled = False
@@ -0,0 +1,395 @@
+"""Shared work queue for running workflow steps on several nodes.
+
+One process is limited by its own connection and CPU budget. With a
+``work_queue`` the Manager becomes a coordinator: every LLM step of a run is
+serialized into a ``WorkItem`` (role, method, input, context, kwargs, model,
+wall-clock expiry of the time budget) and put on the queue. Worker processes
+on any node that can reach the queue claim items, run the matching agent and
+store the result, its call records and its step notes. The coordinator waits
+for the result, replays the call records into the step metrics and publishes
+the output on its own bus as before.
+
+The budget travels as an absolute ``expires_at`` (``time.time()``), so the
+time an item spent queued counts against it. A worker runs the step with
+whatever is left at claim time and fails an already expired item at once with
+``DeadlineExceeded``. Nodes therefore need synchronized clocks (NTP).
+
+Payloads are JSON. Dataclasses from ``core.schemas`` are tagged with their
+class name (``{"$schema": "PRD", ...}``), so PRDs, PageSpecs and TaskPlans come
+back as the same dataclasses on the other side.
+
+Claims are leases. A worker renews its lease with heartbeats while the agent
+runs. Items whose lease expired (the worker died or hung) are re-queued, by
+the waiting coordinator or by any worker, up to ``max_attempts`` claims. After
+that the item fails. A failed step keeps its exception type across the queue
+(``DeadlineExceeded``, ``TimeoutError``, ``ValueError``; anything else comes
+back as ``RuntimeError``). That way the coordinator's deadline handling, such
+as degrading to brief → Engineer, works the same for remote steps as for
+local ones.
+
+``WorkQueue`` is the interface; ``SQLiteWorkQueue`` implements it on one
+SQLite file (a local disk, or a shared volume for several nodes). Start a
+worker with::
+
+    python -m core.work_queue worker output/queue.db
+    python -m core.work_queue stats output/queue.db
+"""
+
+import abc
+import dataclasses
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List
+
+from core import deadline, schemas
+from core.blob_store import BlobHandle
+from core.metrics import collect_calls
+
+
+SCHEMA_KEY = "$schema"
+SCHEMAS: Dict[str, type] = {
+    name: value
+    for name, value in vars(schemas).items()
+    if isinstance(value, type) and dataclasses.is_dataclass(value)
+}
+
+
+def encode(value: Any) -> Any:
+    """Convert a step payload to JSON-compatible data (schema dataclasses are tagged)."""
+
+    if isinstance(value, BlobHandle):
+        value = value.materialize()
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        name = type(value).__name__
+        if SCHEMAS.get(name) is not type(value):
+            raise ValueError(f"{name} is not a core.schemas dataclass and cannot be queued")
+        return {SCHEMA_KEY: name, **{f.name: encode(getattr(value, f.name)) for f in dataclasses.fields(value)}}
+    if isinstance(value, dict):
+        return {str(key): encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode(item) for item in value]
+    return value
+
+
+# 跨队列保留的异常类型（按 MRO 取最近的一个）；其余异常在协调端表现为 RuntimeError
+REMOTE_ERRORS: Dict[str, type] = {
+    "DeadlineExceeded": deadline.DeadlineExceeded,
+    "TimeoutError": TimeoutError,
+    "ValueError": ValueError,
+}
+
+
+def error_outcome(exc: BaseException) -> Dict[str, str]:
+    """Result record of a failed item: the message plus the nearest exception type in ``REMOTE_ERRORS``."""
+
+    error_type = next((cls.__name__ for cls in type(exc).__mro__ if cls.__name__ in REMOTE_ERRORS), "RuntimeError")
+    return {"error": f"{type(exc).__name__}: {exc}", "error_type": error_type}
+
+
+def raise_remote(outcome: Dict[str, Any], step: str) -> None:
+    """Re-raise a failed item's error on the coordinator with its original exception type."""
+
+    cls = REMOTE_ERRORS.get(outcome.get("error_type"), RuntimeError)
+    raise cls(f"remote step {step} failed: {outcome['error']}")
+
+
+def decode(value: Any) -> Any:
+    """Inverse of ``encode``."""
+
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if SCHEMA_KEY in value:
+        cls = SCHEMAS.get(value[SCHEMA_KEY])
+        if cls is None:
+            raise ValueError(f"Unknown schema: {value[SCHEMA_KEY]}")
+        return cls(**{key: decode(item) for key, item in value.items() if key != SCHEMA_KEY})
+    return {key: decode(item) for key, item in value.items()}
+
+
+@dataclass
+class WorkItem:
+    role: str
+    method: str
+    content: Any
+    context: List[Dict[str, Any]] = field(default_factory=list)
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+    model: str | None = None
+    expires_at: float | None = None  # 墙钟时间（time.time()），跨节点比较
+    step: str = ""
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+
+    def to_json(self) -> str:
+        return json.dumps(encode({f.name: getattr(self, f.name) for f in dataclasses.fields(self)}), ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, raw: str) -> "WorkItem":
+        return cls(**decode(json.loads(raw)))
+
+
+class WorkQueue(abc.ABC):
+    """Interface of a shared step queue (see ``SQLiteWorkQueue``)."""
+
+    @abc.abstractmethod
+    def submit(self, item: WorkItem) -> str:
+        """Queue an item; returns its id."""
+
+    @abc.abstractmethod
+    def claim(self, worker: str, lease: float) -> WorkItem | None:
+        """Lease the oldest queued item to ``worker`` for ``lease`` seconds."""
+
+    @abc.abstractmethod
+    def heartbeat(self, item_id: str, worker: str, lease: float) -> bool:
+        """Extend a lease; False when the worker no longer holds it."""
+
+    @abc.abstractmethod
+    def complete(self, item_id: str, worker: str, result: Dict[str, Any]) -> bool:
+        """Store a result (``{"result": ...}`` or ``error_outcome``); the first one wins."""
+
+    @abc.abstractmethod
+    def requeue_expired(self) -> int:
+        """Return items with expired leases to the queue (or fail them); returns the count."""
+
+    @abc.abstractmethod
+    def result(self, item_id: str) -> Dict[str, Any] | None:
+        """The stored result of a finished, failed or cancelled item; None while it is pending."""
+
+    @abc.abstractmethod
+    def cancel(self, item_id: str) -> None:
+        """Stop a pending item (workers still holding it can no longer complete it)."""
+
+    @abc.abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        """Item counts per status, retried items and active workers."""
+
+    def wait(self, item_id: str, poll: float = 0.2) -> Dict[str, Any]:
+        """Block until the item has a result, honouring the active time budget."""
+
+        while True:
+            self.requeue_expired()
+            result = self.result(item_id)
+            if result is not None:
+                return result
+            left = deadline.remaining()
+            if left is not None and left <= 0:
+                self.cancel(item_id)
+                raise deadline.DeadlineExceeded(f"work item {item_id} did not finish within the time budget")
+            time.sleep(poll if left is None else min(poll, left))
+
+
+class SQLiteWorkQueue(WorkQueue):
+    def __init__(self, path: str = "output/queue.db", max_attempts: int = 3):
+        self.path = path
+        self.max_attempts = max_attempts
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS items ("
+                " id TEXT PRIMARY KEY, payload TEXT NOT NULL, status TEXT NOT NULL,"
+                " worker TEXT, lease_until REAL, attempts INTEGER NOT NULL DEFAULT 0,"
+                " result TEXT, created REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS items_status ON items (status, created)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # 每次操作单独连接：多线程、多进程（共享卷上的多节点）都只靠 SQLite 的文件锁协调
+        db = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+        try:
+            db.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            db.close()
+            raise
+        try:
+            yield db
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+
+    def submit(self, item: WorkItem) -> str:
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO items (id, payload, status, created, updated) VALUES (?, ?, 'queued', ?, ?)",
+                (item.id, item.to_json(), now, now),
+            )
+        return item.id
+
+    def claim(self, worker: str, lease: float) -> WorkItem | None:
+        now = time.time()
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT id, payload FROM items WHERE status = 'queued' ORDER BY created LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE items SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1,"
+                " updated = ? WHERE id = ?",
+                (worker, now + lease, now, row[0]),
+            )
+        return WorkItem.from_json(row[1])
+
+    def heartbeat(self, item_id: str, worker: str, lease: float) -> bool:
+        now = time.time()
+        with self._connect() as db:
+            cursor = db.execute(
+                "UPDATE items SET lease_until = ?, updated = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                (now + lease, now, item_id, worker),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, item_id: str, worker: str, result: Dict[str, Any]) -> bool:
+        # 租约过期后才返回的结果同样有效（步骤可重复执行），只要还没有别的结果
+        with self._connect() as db:
+            cursor = db.execute(
+                "UPDATE items SET status = ?, worker = ?, result = ?, updated = ?"
+                " WHERE id = ? AND status IN ('queued', 'leased')",
+                (
+                    "failed" if "error" in result else "done",
+                    worker,
+                    json.dumps(result, ensure_ascii=False, default=str),
+                    time.time(),
+                    item_id,
+                ),
+            )
+            return cursor.rowcount == 1
+
+    def requeue_expired(self) -> int:
+        now = time.time()
+        with self._connect() as db:
+            failed = db.execute(
+                "UPDATE items SET status = 'failed', result = ?, updated = ?"
+                " WHERE status = 'leased' AND lease_until < ? AND attempts >= ?",
+                (json.dumps(error_outcome(RuntimeError("lease expired too many times"))), now, now, self.max_attempts),
+            ).rowcount
+            requeued = db.execute(
+                "UPDATE items SET status = 'queued', worker = NULL, lease_until = NULL, updated = ?"
+                " WHERE status = 'leased' AND lease_until < ?",
+                (now, now),
+            ).rowcount
+        return failed + requeued
+
+    def result(self, item_id: str) -> Dict[str, Any] | None:
+        with self._connect() as db:
+            row = db.execute("SELECT status, result FROM items WHERE id = ?", (item_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"Unknown work item: {item_id}")
+        return json.loads(row[1]) if row[0] in ("done", "failed", "cancelled") else None
+
+    def cancel(self, item_id: str) -> None:
+        with self._connect() as db:
+            db.execute(
+                "UPDATE items SET status = 'cancelled', result = ?, updated = ?"
+                " WHERE id = ? AND status IN ('queued', 'leased')",
+                (json.dumps({"error": "cancelled"}), time.time(), item_id),
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as db:
+            counts = dict(db.execute("SELECT status, COUNT(*) FROM items GROUP BY status").fetchall())
+            retried = db.execute("SELECT COUNT(*) FROM items WHERE attempts > 1").fetchone()[0]
+            workers = [row[0] for row in db.execute("SELECT DISTINCT worker FROM items WHERE status = 'leased'")]
+        return {"items": counts, "retried": retried, "active_workers": workers}
+
+
+def default_agents() -> Dict[str, Any]:
+    """One instance of every role, keyed by agent name (what a worker can execute)."""
+
+    from agents.architect_agent import ArchitectAgent
+    from agents.engineer_agent import EngineerAgent
+    from agents.pm_agent import PMAgent
+    from agents.project_agent import ProjectAgent
+    from agents.teamleader_agent import TeamLeaderAgent
+
+    return {agent.name: agent for agent in (TeamLeaderAgent(), PMAgent(), ArchitectAgent(), ProjectAgent(), EngineerAgent())}
+
+
+class Worker:
+    def __init__(
+        self,
+        queue: WorkQueue,
+        agents: Dict[str, Any] | None = None,
+        worker_id: str | None = None,
+        lease: float = 30.0,
+        poll: float = 0.5,
+    ):
+        self.queue = queue
+        self.agents = default_agents() if agents is None else agents
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.lease = lease
+        self.poll = poll
+        self.processed = 0
+
+    def run(self, max_items: int | None = None, idle_timeout: float | None = None) -> int:
+        """Claim and execute items until ``max_items`` are done or the queue stays idle."""
+
+        idle_since = time.monotonic()
+        while max_items is None or self.processed < max_items:
+            self.queue.requeue_expired()
+            item = self.queue.claim(self.worker_id, self.lease)
+            if item is None:
+                if idle_timeout is not None and time.monotonic() - idle_since > idle_timeout:
+                    break
+                time.sleep(self.poll)
+                continue
+            self.execute(item)
+            idle_since = time.monotonic()
+        return self.processed
+
+    def execute(self, item: WorkItem) -> None:
+        stop = threading.Event()
+
+        def beat():
+            # 心跳续约；丢失租约（已被重新排队）时仍跑完，结果先到者生效
+            while not stop.wait(self.lease / 3):
+                if not self.queue.heartbeat(item.id, self.worker_id, self.lease):
+                    return
+
+        heartbeat = threading.Thread(target=beat, daemon=True)
+        heartbeat.start()
+        try:
+            left = None if item.expires_at is None else item.expires_at - time.time()
+            if left is not None and left <= 0:
+                # 排队期间预算已耗尽：协调端已放弃等待，不再执行
+                raise deadline.DeadlineExceeded(f"{item.step or item.role}: time budget expired while queued")
+            agent = self.agents.get(item.role)
+            if agent is None:
+                raise ValueError(f"Worker has no agent for role {item.role}")
+            if item.model is not None:
+                agent.model = item.model
+            with deadline.budget(left), collect_calls() as calls:
+                handler = getattr(agent, item.method)
+                result = handler(decode(item.content), context=item.context, **decode(item.kwargs))
+            outcome = {"result": encode(result), "calls": list(calls), "notes": encode(calls.notes)}
+        except Exception as exc:
+            outcome = error_outcome(exc)
+        finally:
+            stop.set()
+            heartbeat.join()
+        self.queue.complete(item.id, self.worker_id, outcome)
+        self.processed += 1
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("worker", "stats"):
+        print("usage: python -m core.work_queue worker|stats <queue.db>")
+        sys.exit(2)
+    queue = SQLiteWorkQueue(sys.argv[2])
+    if sys.argv[1] == "stats":
+        print(json.dumps(queue.stats(), ensure_ascii=False, indent=2))
+    else:
+        Worker(queue).run()
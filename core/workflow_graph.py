@@ -0,0 +1,76 @@
+"""Topic dependency helpers for Manager workflows.
+
+A workflow is a list of step dicts; each step reads ``input_topic`` plus any
+``fetch_topics`` and publishes ``output_topic``. Together they form a small
+DAG over topics, which these helpers walk backwards.
+"""
+
+from typing import Dict, Iterable, List, Set
+
+
+def step_inputs(step: Dict) -> List[str]:
+    """Topics a step reads directly."""
+    return [step["input_topic"], *step.get("fetch_topics", [])]
+
+
+def upstream_topics(workflow: List[Dict], topics: Iterable[str], before: int | None = None) -> Set[str]:
+    """Return ``topics`` plus every topic they transitively depend on.
+
+    Only steps before index ``before`` (default: all steps) are considered as
+    producers, so a step never depends on its own or a later output.
+    """
+
+    producers = workflow if before is None else workflow[:before]
+    result: Set[str] = set()
+    pending = list(topics)
+    while pending:
+        topic = pending.pop()
+        if topic in result:
+            continue
+        result.add(topic)
+        for step in producers:
+            if step["output_topic"] == topic:
+                pending.extend(t for t in step_inputs(step) if t != topic)
+    return result
+
+
+def default_context_topics(workflow: List[Dict], index: int) -> List[str]:
+    """Context topics for ``workflow[index]``: its inputs and their ancestry."""
+    return sorted(upstream_topics(workflow, step_inputs(workflow[index]), before=index))
+
+
+def is_consumed(workflow: List[Dict], index: int) -> bool:
+    """Whether any later step reads the output of ``workflow[index]``."""
+    topic = workflow[index]["output_topic"]
+    return any(topic in step_inputs(step) for step in workflow[index + 1:])
+
+
+def check_produced(workflow: List[Dict], topics: Iterable[str]) -> None:
+    """Raise ``ValueError`` for topics no step of ``workflow`` produces."""
+
+    produced = {step["output_topic"] for step in workflow}
+    unknown = sorted(set(topics) - produced)
+    if unknown:
+        raise ValueError(f"No workflow step produces {', '.join(unknown)}; known topics: {', '.join(sorted(produced))}")
+
+
+def required_steps(workflow: List[Dict], needed: Iterable[str], with_context: bool = False) -> List[int]:
+    """Indices of the steps needed to produce ``needed``, walking the workflow backwards.
+
+    With ``with_context`` a step's ``context_topics`` count as reads too (shared
+    context makes those outputs part of its prompt). A topic no step produces
+    raises ``ValueError`` instead of silently selecting nothing.
+    """
+
+    wanted = set(needed)
+    check_produced(workflow, wanted)
+    required = []
+    for index in range(len(workflow) - 1, -1, -1):
+        step = workflow[index]
+        if step["output_topic"] not in wanted:
+            continue
+        required.append(index)
+        wanted.update(step_inputs(step))
+        if with_context:
+            wanted.update(step.get("context_topics", []))
+    return sorted(required)
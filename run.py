@@ -1,6 +1,9 @@
+from core.artifact_store import ArtifactStore
+from core.batch import BatchSweep, LocalBatchEndpoint
 from core.manager import Manager
+from core.work_queue import SQLiteWorkQueue
+from core import tracing
 import os
-import json
 import time
 from datetime import datetime
 
@@ -65,46 +68,78 @@ model = "OPENAI"
 
 runtime_log_path = "output/runtime_log.txt"
 
-for tmp_i in range(1, 5):
-    print(tmp_i)
-    json_folder = "output/json"
-    resp_folder = "output/resp"
-    os.makedirs(json_folder, exist_ok=True)
+store = ArtifactStore("output/artifacts")
 
-    for op, cp in combinations:
-        start_time = time.time()  # ⏱ 开始计时
 
-        timestamp = datetime.now().strftime("%Y%m%d-%H%M")
-        op_value = 1 if op else 0
-        cp_value = 1 if cp else 0
-        suffix = f"{timestamp}__OP-{op_value}_CP-{cp_value}"
-        print(suffix)
+def save_html(path, html):
+    """HTML 仍按原路径直接写出一份，便于直接用浏览器打开（dump/resp 只进产物库）"""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(html)
+    return path
 
-        manager = Manager(cp=cp, sp=op)
-        html, resp = manager.run(prompt)
-        # 保存resp日志
-        resp_file_path = f"{resp_folder}/{model}_{tmp_i}##过程_{suffix}.json"
-        with open(resp_folder, "w", encoding="utf-8") as log_file:
-            json.dump(resp, log_file, ensure_ascii=False, indent=2)
 
+# 设置 WEBGEN_BATCH=1 时改用批量接口离线跑完整轮 OP/CP 实验（WEBGEN_BATCH=local 使用本地替身端点）；
+# 中断后再次运行会从 output/batch/sweep 中保存的状态继续
+batch_mode = os.getenv("WEBGEN_BATCH")
 
+# 设置 WEBGEN_WORK_QUEUE=<queue.db> 时本进程只做协调，各步骤由 `python -m core.work_queue worker <queue.db>` 执行
+work_queue = SQLiteWorkQueue(os.environ["WEBGEN_WORK_QUEUE"]) if os.getenv("WEBGEN_WORK_QUEUE") else None
 
-        # 保存JSON日志
-        json_file_path = f"{json_folder}/{model}_{tmp_i}##messages_{suffix}.json"
-        with open(json_file_path, "w", encoding="utf-8") as log_file:
-            json.dump(manager.bus.dump(), log_file, ensure_ascii=False, indent=2)
-
-        # 保存HTML输出
-        html_file_path = f"output/{model}_{tmp_i}##index_{suffix}.html"
-        with open(html_file_path, "w", encoding="utf-8") as f:
-            f.write(html)
-
-        end_time = time.time()  # ⏱ 结束计时
-        duration = end_time - start_time
-
-        # 记录运行时长到 txt 文件
-        with open(runtime_log_path, "a", encoding="utf-8") as rt:
-            rt.write(f"{suffix}, Iter: {tmp_i}, Duration: {duration:.2f} seconds\n")
+if batch_mode:
+    client = LocalBatchEndpoint() if batch_mode == "local" else Manager().eng.client
+    sweep = BatchSweep(client, "output/batch/sweep")
+    sweep_meta = {}
+    for tmp_i in range(1, 5):
+        for op, cp in combinations:
+            run_id = f"{model}_{tmp_i}__batch__OP-{int(op)}_CP-{int(cp)}"
+            sweep_meta[run_id] = {"iter": tmp_i, "op": op, "cp": cp, "batch": True}
+            sweep.add(run_id, lambda op=op, cp=cp: Manager(cp=cp, sp=op), prompt)
 
+    def save_batch_run(run_id, html, resp, manager):
+        store.save_run(run_id, meta=sweep_meta[run_id], html=html, dump=manager.bus.dump(), resp=resp)
+        suffix = run_id.split("__", 1)[1]
+        html_file_path = save_html(f"output/{model}_{sweep_meta[run_id]['iter']}##index_{suffix}.html", html)
         print(f"网页已生成：{html_file_path}")
-        print(f"运行时间记录：{duration:.2f} 秒\n")
+
+    print(sweep.run(on_done=save_batch_run))
+else:
+    for tmp_i in range(1, 5):
+        print(tmp_i)
+
+        for op, cp in combinations:
+            start_time = time.time()  # ⏱ 开始计时
+
+            timestamp = datetime.now().strftime("%Y%m%d-%H%M")
+            op_value = 1 if op else 0
+            cp_value = 1 if cp else 0
+            suffix = f"{timestamp}__OP-{op_value}_CP-{cp_value}"
+            print(suffix)
+
+            manager = Manager(cp=cp, sp=op, work_queue=work_queue)
+            html, resp = manager.run(prompt)
+            # 保存本次运行的产物：HTML、消息 dump、resp 日志按内容寻址压缩存储，跨运行去重；HTML 另写一份原文件
+            # 查看：python -m core.artifact_store show <run_id> html > index.html
+            run_id = f"{model}_{tmp_i}__{suffix}"
+            store.save_run(
+                run_id,
+                meta={"iter": tmp_i, "op": op, "cp": cp},
+                html=html,
+                dump=manager.bus.dump(),
+                resp=resp,
+            )
+            html_file_path = save_html(f"output/{model}_{tmp_i}##index_{suffix}.html", html)
+
+            end_time = time.time()  # ⏱ 结束计时
+            duration = end_time - start_time
+
+            # 记录运行时长到 txt 文件
+            with open(runtime_log_path, "a", encoding="utf-8") as rt:
+                rt.write(f"{suffix}, Iter: {tmp_i}, Duration: {duration:.2f} seconds\n")
+
+            print(f"网页已生成：{html_file_path}")
+            print(f"运行时间记录：{duration:.2f} 秒\n")
+
+# 设置 WEBGEN_TRACE=1 时导出整轮 OP/CP 实验的追踪数据（chrome://tracing / Perfetto 可视化）
+if tracing.TRACER.enabled:
+    tracing.TRACER.export_chrome_trace("output/trace.json")
+    tracing.TRACER.export_jsonl("output/trace.jsonl")
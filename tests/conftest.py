@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 测试直接以仓库根目录为导入根（core / agents 不是安装包）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
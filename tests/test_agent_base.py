@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+from core.output_budget import OUTPUT_BUDGET
+from core.singleflight import AGENT_CALLS
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    from core import agent_base
+    from core.endpoints import EndpointPool
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(agent_base, "shared_pool", lambda key: EndpointPool(["x"], client_factory=lambda url: object()))
+    return agent_base.AgentBase("Tester", "system")
+
+
+def _dispatch_until(agent, monkeypatch, ready):
+    """Fake model call that keeps every leader in flight until ``ready(calls)`` holds."""
+
+    calls = []
+
+    def dispatch(messages, candidates, on_delta=None, options=None):
+        calls.append(options)
+        deadline = time.monotonic() + 2
+        while not ready(calls) and time.monotonic() < deadline:
+            time.sleep(0.001)
+        if on_delta is not None:
+            on_delta("<html>")
+            on_delta("</html>")
+        return "<html></html>", {"model": candidates[0]}, {}
+
+    monkeypatch.setattr(agent, "_dispatch", dispatch)
+    return calls
+
+
+def _concurrently(*targets):
+    threads = [threading.Thread(target=target) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+
+def test_identical_calls_are_coalesced_and_streaming_followers_get_the_text(agent, monkeypatch):
+    coalesced = AGENT_CALLS.stats()["coalesced"]
+    calls = _dispatch_until(agent, monkeypatch, lambda calls: AGENT_CALLS.stats()["coalesced"] > coalesced)
+    deltas = {"a": [], "b": []}
+
+    def call(name):
+        return lambda: agent.run("做页面", on_delta=lambda piece: deltas[name].append(piece))
+
+    _concurrently(call("a"), call("b"))
+
+    assert len(calls) == 1
+    assert sorted("".join(pieces) for pieces in deltas.values()) == ["<html></html>", "<html></html>"]
+
+
+def test_streaming_and_plain_calls_are_not_coalesced(agent, monkeypatch):
+    calls = _dispatch_until(agent, monkeypatch, lambda calls: len(calls) == 2)
+    _concurrently(lambda: agent.run("做页面"), lambda: agent.run("做页面", on_delta=lambda piece: None))
+    assert len(calls) == 2
+
+
+def test_calls_with_different_output_caps_are_not_coalesced(agent, monkeypatch):
+    calls = _dispatch_until(agent, monkeypatch, lambda calls: len(calls) == 2)
+    caps = iter([1000, 4000])
+    lock = threading.Lock()
+
+    def request_options(role, adaptive=True):
+        with lock:
+            return {"max_tokens": next(caps), "stop": ["</html>"]}
+
+    monkeypatch.setattr(OUTPUT_BUDGET, "request_options", request_options)
+    _concurrently(lambda: agent.run("做页面"), lambda: agent.run("做页面"))
+
+    assert sorted(options["max_tokens"] for options in calls) == [1000, 4000]
@@ -0,0 +1,45 @@
+import os
+
+from core.artifact_store import ArtifactStore
+
+
+HTML = "<html><body>" + "瓜子" * 400 + "</body></html>"
+
+
+def _objects(store):
+    return sum(len(files) for _, _, files in os.walk(os.path.join(store.root, "objects")))
+
+
+def test_run_artifacts_round_trip(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    dump = [{"topic": "html", "content": HTML, "meta": {"step": 4, "tags": ["a", None, 1.5]}}]
+    resp = {"calls": [{"model": "m", "tokens": 12}], "coalesced": False}
+    store.save_run("r1", meta={"iter": 1}, html=HTML, dump=dump, resp=resp)
+
+    assert store.runs() == ["r1"]
+    assert store.index("r1")["meta"] == {"iter": 1}
+    assert store.materialize("r1", "html") == HTML
+    assert store.materialize("r1", "dump") == dump
+    assert store.materialize("r1", "resp") == resp
+
+
+def test_html_inside_the_dump_shares_the_html_blob(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    store.save_run("r1", html=HTML, dump=[{"content": HTML}])
+    before = _objects(store)
+    store.save_run("r2", html=HTML, dump=[{"content": HTML}])
+
+    assert _objects(store) == before
+    assert store.materialize("r2", "dump") == [{"content": HTML}]
+
+
+def test_user_dicts_that_look_like_blob_markers_round_trip(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    dump = [
+        {"$blob": "not-a-digest"},
+        {"$blob": HTML},
+        {"$$blob": "x", "$ref": {"$blob": "y"}, "price": "$16.9"},
+    ]
+    store.save_run("r1", dump=dump)
+
+    assert store.materialize("r1", "dump") == dump
@@ -0,0 +1,131 @@
+import json
+import types
+
+import pytest
+
+from core.batch import BatchPending, BatchSession, BatchSweep, LocalBatchEndpoint, current_session, session_scope
+
+
+class _Run:
+    """Stand-in for a Manager: one model call per run, resolved through the batch session."""
+
+    def __init__(self, prompt):
+        self.prompt = prompt
+
+    def run(self, brief):
+        text, usage, finish_reason = current_session().resolve("Engineer", {"messages": [self.prompt, brief]})
+        return text, {"usage": usage, "finish_reason": finish_reason}
+
+
+def _endpoint(tmp_path, failures):
+    calls = []
+
+    def complete(body):
+        prompt = body["messages"][0]
+        calls.append(prompt)
+        if failures.get(prompt, 0) > 0:
+            failures[prompt] -= 1
+            raise RuntimeError(f"{prompt} overloaded")
+        return {
+            "choices": [{"message": {"content": f"<html>{prompt}</html>"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 3, "completion_tokens": 5, "total_tokens": 8},
+        }
+
+    return LocalBatchEndpoint(str(tmp_path / "endpoint"), complete=complete), calls
+
+
+def _sweep(tmp_path, client, **kwargs):
+    sweep = BatchSweep(client, str(tmp_path / "state"), poll_interval=0, **kwargs)
+    for prompt in ("ok", "flaky", "broken"):
+        sweep.add(prompt, lambda prompt=prompt: _Run(prompt), "brief")
+    return sweep
+
+
+def test_failed_requests_are_retried_until_the_attempt_limit(tmp_path):
+    client, calls = _endpoint(tmp_path, {"flaky": 1, "broken": 99})
+    done = {}
+    summary = _sweep(tmp_path, client, max_attempts=3).run(lambda run_id, html, *_: done.setdefault(run_id, html))
+
+    assert done == {"ok": "<html>ok</html>", "flaky": "<html>flaky</html>"}
+    assert list(summary["failed"]) == ["broken"] and "broken overloaded" in summary["failed"]["broken"]
+    assert calls.count("ok") == 1 and calls.count("flaky") == 2 and calls.count("broken") == 3
+    assert summary["batches"] == 3 and summary["gave_up"] == 1 and summary["retrying"] == 0
+
+
+def test_error_file_only_batch_has_no_output_file(tmp_path):
+    client, _ = _endpoint(tmp_path, {"broken": 99})
+    uploaded = client.files.create(
+        file=("in.jsonl", (json.dumps({"custom_id": "a", "body": {"messages": ["broken"]}}) + "\n").encode()),
+        purpose="batch",
+    )
+    batch = client.batches.retrieve(client.batches.create(input_file_id=uploaded.id, endpoint="/v1/chat/completions").id)
+    assert batch.output_file_id is None and batch.error_file_id is not None
+
+
+def test_resume_keeps_attempt_counts(tmp_path):
+    client, calls = _endpoint(tmp_path, {"broken": 99})
+    _sweep(tmp_path, client, max_attempts=2).run()
+    assert calls.count("broken") == 2
+    summary = _sweep(tmp_path, client, max_attempts=2).run()
+    assert calls.count("broken") == 2
+    assert list(summary["failed"]) == ["broken"]
+
+
+class _ExpiringEndpoint(LocalBatchEndpoint):
+    """The first retrieved batch has ended as ``expired`` without any result file."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.expired = False
+        self.batches.retrieve = self._retrieve
+
+    def _retrieve(self, batch_id):
+        if not self.expired:
+            self.expired = True
+            return types.SimpleNamespace(id=batch_id, status="expired", output_file_id=None, error_file_id=None)
+        return self._retrieve_batch(batch_id)
+
+
+def test_dead_batch_counts_a_failed_attempt_and_is_resubmitted(tmp_path):
+    client, calls = _endpoint(tmp_path, {})
+    client = _ExpiringEndpoint(client.root, complete=client.complete)
+    summary = _sweep(tmp_path, client, max_attempts=3).run()
+
+    assert summary["failed"] == {} and summary["done"] == 3
+    assert summary["batches"] == 2 and calls.count("ok") == 1
+    state = json.loads((tmp_path / "state" / "state.json").read_text())
+    assert [batch["status"] for batch in state["batches"]] == ["expired", "completed"]
+    assert state["inflight"] is None
+
+
+def test_resume_does_not_poll_a_dead_batch_forever(tmp_path):
+    client, _ = _endpoint(tmp_path, {})
+    client = _ExpiringEndpoint(client.root, complete=client.complete)
+    sweep = _sweep(tmp_path, client)
+    sweep._submit({"x-0": {"custom_id": "x-0", "body": {"messages": ["ok"]}}})
+    summary = _sweep(tmp_path, client).run()
+
+    assert summary["done"] == 3
+    assert json.loads((tmp_path / "state" / "state.json").read_text())["attempts"]["x-0"]["count"] == 1
+
+
+def test_batch_replays_bypass_the_request_governor(tmp_path, monkeypatch):
+    from core import agent_base
+    from core.endpoints import EndpointPool
+
+    class NoGovernor:
+        def acquire(self, role, estimate):
+            raise AssertionError("a batch replay must not wait for rate limit capacity")
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(agent_base, "shared_pool", lambda key: EndpointPool(["x"], client_factory=lambda url: object()))
+    monkeypatch.setattr(agent_base, "GOVERNOR", NoGovernor())
+    agent = agent_base.AgentBase("PM", "system")
+    results = {}
+    with session_scope(BatchSession("run", results)) as session:
+        with pytest.raises(BatchPending):
+            agent.run("卖瓜子", coalesce=False)
+    custom_id = next(iter(session.pending))
+    results[custom_id] = {"text": "{}", "usage": {"total_tokens": 3}, "finish_reason": "stop"}
+    with session_scope(BatchSession("run", results)):
+        assert agent.run("卖瓜子", coalesce=False) == "{}"
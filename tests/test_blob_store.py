@@ -0,0 +1,77 @@
+import gc
+import os
+
+from core.blob_store import BlobHandle, BlobStore, materialize
+
+
+def _files(path):
+    return sorted(os.listdir(path))
+
+
+def test_small_values_stay_inline_and_large_ones_round_trip(tmp_path):
+    store = BlobStore(str(tmp_path), threshold=64)
+    assert store.spool("short") == "short"
+    assert store.spool(42) == 42
+
+    text = "瓜子" * 100
+    spec = {"sections": ["hero"] * 50}
+    text_handle, spec_handle = store.spool(text), store.spool(spec)
+    assert isinstance(text_handle, BlobHandle) and isinstance(spec_handle, BlobHandle)
+    assert materialize(text_handle) == text and materialize(spec_handle) == spec
+    assert materialize("plain") == "plain"
+    assert store.spool(text_handle) is text_handle
+    store.close()
+
+
+def test_identical_payloads_share_one_blob(tmp_path):
+    store = BlobStore(str(tmp_path), threshold=0)
+    first, second = store.put("x" * 100), store.put("x" * 100)
+
+    assert first is second
+    assert store.stats()["blobs_stored"] == 1 and store.stats()["deduplicated"] == 1
+    assert store.put(["x" * 100]) is not first  # 相同字节但类型不同，不共用
+    store.close()
+
+
+def test_live_handles_are_counted_per_segment(tmp_path):
+    store = BlobStore(str(tmp_path), threshold=0)
+    handles = [store.put(str(i) * 50) for i in range(3)]
+    assert store.stats()["live_handles"] == 3
+
+    del handles[0]
+    gc.collect()
+    stats = store.stats()
+    assert stats["live_handles"] == 2 and stats["disk_bytes"] == 150  # 段只追加，整段无引用时才回收
+    assert [materialize(h) for h in handles] == ["1" * 50, "2" * 50]
+    store.close()
+
+
+def test_sealed_segments_are_deleted_once_unreferenced(tmp_path):
+    store = BlobStore(str(tmp_path), threshold=0, segment_bytes=100)
+    old = [store.put(str(i) * 60) for i in range(2)]  # 每段只放得下一个 blob
+    current = store.put("z" * 60)
+    assert store.stats()["segments"] == 3 and len(_files(tmp_path)) == 3
+
+    del old
+    gc.collect()
+    assert store.stats()["segments"] == 1
+    assert len(_files(tmp_path)) == 1
+    assert materialize(current) == "z" * 60
+    store.close()
+
+
+def test_active_segment_is_truncated_and_reused_when_empty(tmp_path):
+    store = BlobStore(str(tmp_path), threshold=0)
+    handle = store.put("a" * 100)
+    (path,) = _files(tmp_path)
+
+    del handle
+    gc.collect()
+    stats = store.stats()
+    assert stats["segments"] == 1 and stats["disk_bytes"] == 0
+    assert os.path.getsize(tmp_path / path) == 0
+
+    fresh = store.put("b" * 10)
+    assert fresh.segment == 0 and fresh.offset == 0 and materialize(fresh) == "b" * 10
+    store.close()
+    assert _files(tmp_path) == []
@@ -0,0 +1,57 @@
+from core.brief_cache import PlanningCache, field_substitutions, substitute, unsafe_substitution
+from core.schemas import PRD
+
+
+OLD = "商品：新疆瓜子，做一个促销页，每袋 10 元，满 99 元包邮，图片 https://img.example.com/a.png"
+NEW = "商品：东北松子，做一个促销页，每袋 12 元，满 99 元包邮，图片 https://img.example.com/b.png"
+
+
+def test_field_substitutions_pair_changed_fields():
+    assert set(field_substitutions(OLD, NEW)) == {
+        ("新疆瓜子", "东北松子"),
+        ("10", "12"),
+        ("https://img.example.com/a.png", "https://img.example.com/b.png"),
+    }
+    assert field_substitutions(OLD, OLD + "，另附赠品") is None
+
+
+def test_substitute_replaces_whole_numbers_only():
+    text = "每袋 10 元 | 10% 折扣 | 100% 好评 | 1000 人已买 | 0.10 元 | ¥10.5 | 10元"
+    assert substitute(text, [("10", "12")]) == "每袋 12 元 | 12% 折扣 | 100% 好评 | 1000 人已买 | 0.10 元 | ¥10.5 | 12元"
+
+
+def test_substitute_is_single_pass_and_respects_words():
+    assert substitute("10 then 12", [("10", "12"), ("12", "15")]) == "12 then 15"
+    assert substitute("Pro ProMax pro", [("Pro", "Max")]) == "Max ProMax pro"
+    assert substitute("新疆瓜子香", [("瓜子", "松子")]) == "新疆松子香"
+
+
+def test_substitute_walks_dataclasses_and_containers():
+    prd = PRD(product="瓜子 10 元", goals=["卖出 10 袋"], target_users=[], page_sections=[])
+    result = substitute({"prd": prd, "tags": ["10", 10]}, [("10", "12")])
+    assert result["prd"].product == "瓜子 12 元"
+    assert result["prd"].goals == ["卖出 12 袋"]
+    assert result["tags"] == ["12", 10]
+
+
+def test_unsafe_substitutions_are_refused():
+    messages = [{"price": "每袋 10 元"}]
+    assert unsafe_substitution(OLD, messages, [("10", "12")]) is None
+    assert "longer value" in unsafe_substitution(OLD, [{"price": "每袋 10 元，1000 人已买"}], [("10", "12")])
+    assert "unit" in unsafe_substitution(OLD, [{"price": "每袋 10 元，立减 10%"}], [("10", "12")])
+    assert "too short" in unsafe_substitution("买 5 袋", messages, [("5", "6")])
+
+
+def test_lookup_falls_back_when_a_field_value_is_ambiguous():
+    cache = PlanningCache(threshold=0.3)
+    cache.store(OLD, [("prd", "PM", {"title": "新疆瓜子促销", "price": "10 元", "badge": "100% 好评"})])
+
+    lookup = cache.lookup(NEW)
+    assert not lookup.hit
+    assert lookup.reason.startswith("unsafe substitution")
+    assert cache.stats()["unsafe_substitution_rejects"] == 1
+
+    cache.store(OLD, [("prd", "PM", {"title": "新疆瓜子促销", "price": "10 元"})])
+    lookup = cache.lookup(NEW)
+    assert lookup.hit
+    assert lookup.messages == [("prd", "PM", {"title": "东北松子促销", "price": "12 元"})]
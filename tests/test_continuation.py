@@ -0,0 +1,62 @@
+from core.continuation import continuation_messages, html_closed, needs_continuation, stitch
+
+
+HEAD = "<!DOCTYPE html>\n<html>\n<head><style>body { margin: 0; }</style></head>\n<body>\n"
+
+
+def test_repeated_overlap_is_dropped():
+    previous = HEAD + '<section id="hero">\n  <h1>新疆瓜子</h1>\n  <p>颗颗饱满'
+    chunk = "  <h1>新疆瓜子</h1>\n  <p>颗颗饱满，现炒现发</p>\n</section>\n</body>\n</html>"
+    text, overlap = stitch(previous, chunk)
+    assert overlap == len("  <h1>新疆瓜子</h1>\n  <p>颗颗饱满")
+    assert text == HEAD + '<section id="hero">\n' + chunk
+    assert html_closed(text)
+
+
+def test_short_coincidental_overlap_is_kept():
+    text, overlap = stitch(HEAD + "<p>a", "<p>b</p></body></html>")
+    assert overlap == 0 and text.endswith("<p>a<p>b</p></body></html>")
+
+
+def test_truncated_half_line_is_replaced_by_the_restarted_line():
+    previous = HEAD + '<ul>\n  <li class="item">原味'
+    chunk = '\n  <li class="item">原味瓜子</li>\n</ul>\n</body>\n</html>'
+    text, overlap = stitch(previous, chunk, min_overlap=40)
+    assert overlap == len('  <li class="item">原味')
+    assert text == HEAD + '<ul>\n  <li class="item">原味瓜子</li>\n</ul>\n</body>\n</html>'
+
+
+def test_code_fences_are_stripped_from_the_chunk():
+    text, overlap = stitch(HEAD + "<main>", "```html\n</main>\n</body>\n</html>\n```")
+    assert overlap == 0 and text == HEAD + "<main></main>\n</body>\n</html>"
+
+
+def test_full_rewrite_replaces_the_previous_document():
+    rewrite = HEAD + "<p>重写</p>\n</body>\n</html>"
+    assert stitch(HEAD + "<p>截断", rewrite) == (rewrite, 0)
+
+
+def test_needs_continuation():
+    assert needs_continuation(HEAD + "<p>截断", "length")
+    assert not needs_continuation(HEAD + "</body></html>", "length")
+    assert not needs_continuation("```html\n" + HEAD + "</body>\n</html>\n```", "stop")
+    assert not needs_continuation("```html\n" + HEAD + "</body>\n</html>\n```", "length")
+    assert needs_continuation("```html\n" + HEAD + "<p>截断", None)
+    assert not needs_continuation(HEAD, "cancelled")
+    assert needs_continuation(HEAD + "<script>let a = 1;", "stop")
+    assert not needs_continuation(HEAD + "</body>\n</html>\n", "stop")
+    assert not needs_continuation('{"product": "瓜子"', None)
+
+
+def test_html_closed_requires_closed_script_and_style():
+    assert html_closed("<html><script>1</script><style></style></html>")
+    assert not html_closed("<html><script>document.write('</html>')</html>")
+    assert not html_closed("<html><body>")
+
+
+def test_continuation_messages_send_the_tail_as_the_assistant_turn():
+    messages = [{"role": "user", "content": [{"type": "text", "text": "做一个页面"}]}]
+    continued = continuation_messages(messages, "x" * 10 + "tail", tail_chars=4)
+    assert continued[0] is messages[0]
+    assert continued[1] == {"role": "assistant", "content": [{"type": "text", "text": "tail"}]}
+    assert continued[2]["role"] == "user"
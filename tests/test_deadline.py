@@ -0,0 +1,36 @@
+import time
+
+import pytest
+
+from core.deadline import DeadlineExceeded, StepLatencyHistory, budget, expired, remaining
+
+
+def test_budget_nests_to_the_tighter_scope():
+    assert remaining() is None
+    with budget(10):
+        with budget(0.05):
+            assert remaining() <= 0.05
+        assert remaining() > 5
+        with budget(60):
+            assert remaining() <= 10
+    assert remaining() is None
+
+
+def test_expired():
+    with budget(0.01):
+        time.sleep(0.02)
+        assert expired()
+    assert not expired()
+
+
+def test_reserve_uses_history_and_a_share_on_cold_start():
+    history = StepLatencyHistory()
+    assert history.reserve("Engineer", 10.0) == pytest.approx(5.0)
+    assert history.reserve("Engineer", 10.0, share=0.3) == pytest.approx(3.0)
+    assert history.reserve("Engineer", -1.0) == 0.0
+    history.record("Engineer", 4.0)
+    assert history.reserve("Engineer", 10.0) == 4.0
+
+
+def test_deadline_exceeded_is_a_timeout():
+    assert issubclass(DeadlineExceeded, TimeoutError)
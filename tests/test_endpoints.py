@@ -0,0 +1,139 @@
+import time
+
+import pytest
+
+from core.deadline import DeadlineExceeded
+from core.endpoints import EndpointPool, is_endpoint_failure
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def _pool(urls=("a", "b"), **kwargs):
+    kwargs.setdefault("cooldown", 60.0)
+    return EndpointPool(list(urls), failure_threshold=2, client_factory=lambda url: object(), **kwargs)
+
+
+def _fail(pool, endpoint, error=None):
+    pool.acquire(exclude=[other for other in pool.endpoints if other is not endpoint])
+    return pool.release(endpoint, 0.1, error or ConnectionError("reset"))
+
+
+class APIConnectionError(Exception):
+    """Same class name as the openai transport error (matched by name)."""
+
+
+class APITimeoutError(APIConnectionError):
+    pass
+
+
+def test_endpoint_failures_are_classified():
+    assert is_endpoint_failure(ConnectionError("reset")) and is_endpoint_failure(TimeoutError())
+    assert is_endpoint_failure(APIConnectionError()) and is_endpoint_failure(APITimeoutError())
+    assert is_endpoint_failure(StatusError(429)) and is_endpoint_failure(StatusError(503))
+    assert not is_endpoint_failure(StatusError(400))
+
+
+def test_caller_errors_are_not_endpoint_failures():
+    for error in (TypeError("bad argument"), ValueError("on_delta failed"), KeyError("x"), DeadlineExceeded("budget")):
+        assert not is_endpoint_failure(error)
+    pool = _pool()
+    a = pool.primary
+    for _ in range(3):
+        assert _fail(pool, a, ValueError("on_delta failed")) is False
+    assert a.state == "closed" and a.failures == 0
+
+
+def test_breaker_opens_after_consecutive_failures_and_traffic_moves_away():
+    pool = _pool()
+    a, b = pool.endpoints
+    assert _fail(pool, a) is True
+    assert a.state == "closed"
+    _fail(pool, a)
+    assert a.state == "open"
+    assert all(pool.acquire() is b for _ in range(3))
+
+
+def test_client_errors_do_not_fail_over_or_trip_the_breaker():
+    pool = _pool()
+    a = pool.primary
+    for _ in range(3):
+        assert _fail(pool, a, StatusError(400)) is False
+    assert a.state == "closed" and a.errors == 0 and a.outstanding == 0
+
+
+def test_half_open_admits_a_single_trial():
+    pool = _pool(cooldown=0.0)
+    a, b = pool.endpoints
+    _fail(pool, a)
+    _fail(pool, a)
+    b.outstanding = 10  # a 更空闲，冷却结束后应被选中试探
+    trial = pool.acquire()
+    assert trial is a and a.state == "half_open"
+    assert pool.acquire() is b  # 试探进行中，不再放行第二个请求
+
+    pool.release(a, 0.05)
+    assert a.state == "closed" and a.failures == 0
+
+
+def test_failed_trial_reopens_the_breaker():
+    pool = _pool(cooldown=0.0)
+    a, b = pool.endpoints
+    _fail(pool, a)
+    _fail(pool, a)
+    b.outstanding = 10
+    assert pool.acquire() is a
+    opened = a.opened_at
+    time.sleep(0.001)
+    assert pool.release(a, 0.1, TimeoutError("read timeout")) is True
+    assert a.state == "open" and a.opened_at > opened
+
+
+def test_all_open_still_tries_the_earliest_opened_endpoint():
+    pool = _pool()
+    a, b = pool.endpoints
+    _fail(pool, a)
+    _fail(pool, a)
+    time.sleep(0.001)
+    _fail(pool, b)
+    _fail(pool, b)
+    assert pool.acquire() is a
+
+
+def test_probes_feed_the_breaker():
+    healthy = {"a": False}
+
+    def probe(client):
+        if not healthy[client]:
+            raise ConnectionError("down")
+
+    pool = EndpointPool(["a"], failure_threshold=2, cooldown=60.0, client_factory=lambda url: url, probe=probe)
+    a = pool.primary
+    pool.check()
+    pool.check()
+    assert a.state == "open" and a.errors == 0 and a.probes == {"ok": 0, "failed": 2}
+
+    healthy["a"] = True
+    pool.check()
+    assert a.state == "half_open"
+    pool.acquire()
+    pool.release(a, 0.05)
+    assert pool.stats()["a"]["state"] == "closed"
+
+
+def test_ewma_prefers_the_faster_endpoint_until_it_queues_up():
+    pool = _pool(strategy="ewma")
+    a, b = pool.endpoints
+    pool.release(pool.acquire(exclude=[b]), 0.1)
+    pool.release(pool.acquire(exclude=[a]), 0.4)
+    assert pool.acquire() is a
+    a.outstanding = 4
+    assert pool.acquire() is b
+
+
+def test_unknown_strategy_is_rejected():
+    with pytest.raises(ValueError):
+        _pool(strategy="random")
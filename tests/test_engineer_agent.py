@@ -0,0 +1,67 @@
+import threading
+import time
+
+import pytest
+
+from core.feature_check import FeatureChecker
+from core.metrics import collect_calls, record_call
+
+
+GOOD = '<html><body><div id="countdown"></div><script>setInterval(tick, 1000)</script></body></html>'
+BAD = "<html><body>倒计时</body></html>"
+
+
+@pytest.fixture
+def engineer(monkeypatch):
+    from core import agent_base
+    from core.endpoints import EndpointPool
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(agent_base, "shared_pool", lambda key: EndpointPool(["x"], client_factory=lambda url: object()))
+    from agents.engineer_agent import EngineerAgent
+
+    return EngineerAgent()
+
+
+def _scripted_run(outputs, finished):
+    """Candidates answer in order: (seconds, text); slow ones stream until cancelled."""
+
+    lock, order, started = threading.Lock(), iter(outputs), threading.Barrier(len(outputs))
+
+    def run(user_prompt, context=None, on_delta=None, coalesce=True):
+        with lock:
+            seconds, text = next(order)
+        started.wait(2)  # 所有候选都已开始生成
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            if on_delta("<"):
+                record_call(agent="Engineer", finish_reason="cancelled")
+                finished.set()
+                return "<html"
+            time.sleep(0.005)
+        record_call(agent="Engineer", finish_reason="stop")
+        return text
+
+    return run
+
+
+def test_first_passing_candidate_wins_and_abandoned_records_are_dropped(engineer, monkeypatch):
+    finished = threading.Event()
+    monkeypatch.setattr(engineer, "run", _scripted_run([(0.0, GOOD), (5.0, BAD)], finished))
+    checker = FeatureChecker.from_inputs(brief="倒计时")
+    with collect_calls() as calls:
+        html = engineer._best_of("prompt", None, 2, checker)
+    assert finished.wait(2)  # 被放弃的候选随后才结束，且在步骤作用域之外记录
+
+    assert html == GOOD
+    assert calls == [{"agent": "Engineer", "finish_reason": "stop"}]
+    assert calls.notes["best_of"]["completed"] == 1 and calls.notes["best_of"]["cancelled"] == 1
+
+
+def test_best_scoring_candidate_is_used_when_none_passes(engineer, monkeypatch):
+    partial = '<html><body><div id="countdown"></div></body>'
+    monkeypatch.setattr(engineer, "run", _scripted_run([(0.0, BAD), (0.05, partial)], threading.Event()))
+    with collect_calls() as calls:
+        html = engineer._best_of("prompt", None, 2, FeatureChecker.from_inputs(brief="倒计时"))
+    assert html == BAD
+    assert len(calls) == 2 and calls.notes["best_of"]["passed"] is False
@@ -0,0 +1,53 @@
+from core.feature_check import FeatureChecker
+
+
+BRIEF = "需要购物车侧栏、数量增减、倒计时和优惠券领取"
+
+PAGE = """<!DOCTYPE html><html><head><style>.cart-panel { right: -320px; }</style></head><body>
+<div class="qty-stepper"><button id="minus">-</button><input id="qty" value="1"><button id="plus">+</button></div>
+<div id="countdown">00:59:59</div>
+<button class="coupon-btn" onclick="claim()">领取优惠券</button>
+<aside class="cart-panel"></aside><button id="cart-toggle">购物车</button>
+<script>
+const qty = document.getElementById('qty');
+document.getElementById('plus').addEventListener('click', () => { qty.value = +qty.value + 1; });
+document.getElementById('cart-toggle').addEventListener('click', () => {
+  document.querySelector('.cart-panel').classList.toggle('open');
+});
+setInterval(tick, 1000);
+</script></body></html>"""
+
+# 只在文案和 CSS 中提到功能、没有实现的页面
+MENTIONS_ONLY = """<!DOCTYPE html><html><head><style>
+.cart { display: none } .qty { width: 3em } .countdown { color: red } .coupon { color: red }
+</style></head><body>
+<p>打开购物车，点击 + 增加数量，倒计时结束前领取优惠券！open / toggle / show</p>
+<!-- <div id="countdown"></div> -->
+</body></html>"""
+
+
+def test_implemented_features_pass():
+    checker = FeatureChecker.from_inputs(brief=BRIEF)
+    assert checker.features == ["cart_sidebar", "quantity_stepper", "countdown", "coupon_center"]
+    result = checker.check(PAGE)
+    assert result.passed and result.missing_features == [] and result.score == 1.0
+
+
+def test_features_only_mentioned_in_copy_or_css_are_missing():
+    result = FeatureChecker.from_inputs(brief=BRIEF).check(MENTIONS_ONLY)
+    assert not result.passed
+    assert result.missing_features == ["cart_sidebar", "quantity_stepper", "countdown", "coupon_center"]
+
+
+def test_markup_without_behaviour_is_missing():
+    static = PAGE.replace("setInterval(tick, 1000);", "").replace('onclick="claim()"', "")
+    result = FeatureChecker.from_inputs(brief=BRIEF).check(static)
+    assert result.missing_features == ["countdown", "coupon_center"]
+
+
+def test_component_coverage_and_unclosed_pages():
+    spec = {"components": [{"id": "countdown"}, {"id": "qty-stepper"}, {"id": "reviews"}]}
+    checker = FeatureChecker.from_inputs(page_spec=spec, brief="", component_coverage=0.6)
+    result = checker.check(PAGE)
+    assert result.passed and result.missing_components == ["reviews"]
+    assert not checker.check(PAGE.replace("</html>", "")).passed
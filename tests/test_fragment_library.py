@@ -0,0 +1,143 @@
+from core.fragment_library import FragmentLibrary, _statements, component_text, extract_fragment
+
+
+PAGE = """<html><head><style>
+#stepper { display: flex; }
+.qty-btn { padding: 4px; }
+</style></head><body>
+<div id="stepper"><button class="qty-btn">-</button><span id="qty">1</span><button class="qty-btn">+</button></div>
+<script>
+function bump(delta) { qty.textContent = Math.max(1, +qty.textContent + delta); }
+</script>
+</body></html>"""
+
+SPEC = {
+    "components": [
+        {"id": "stepper", "html": "div", "children": [{"tag": "button", "content_hint": "数量加减 按钮"}]},
+    ]
+}
+
+
+def _library(tmp_path):
+    library = FragmentLibrary(path=str(tmp_path / "library.json"))
+    assert library.harvest(PAGE, SPEC)
+    return library
+
+
+def test_prefetched_components_are_served_by_match(tmp_path):
+    library = _library(tmp_path)
+    library.prefetch(SPEC["components"][0])
+    matches = library.match(SPEC)
+    assert list(matches) == ["stepper"]
+    assert library.stats()["prefetched"] == 1
+    # 预查结果只使用一次，下一次 match 重新查询
+    assert list(library.match(SPEC)) == ["stepper"]
+    assert library.stats()["prefetched"] == 1
+
+
+def test_prefetch_miss_is_reused_and_invalidated_by_new_fragments(tmp_path):
+    library = FragmentLibrary(path=str(tmp_path / "library.json"))
+    library.prefetch(SPEC["components"][0])
+    library.harvest(PAGE, SPEC)
+    assert list(library.match(SPEC)) == ["stepper"]
+    assert library.stats()["prefetched"] == 0
+
+
+WIDGETS = """<html><body>
+<div id="stepper"><button class="qty-btn" data-d="-1">-</button><span id="qty">1</span></div>
+<div id="countdown"><span class="cd-time"></span></div>
+<span id="cart-count">0</span>
+<script>
+const qtyEl = document.getElementById('qty');
+let unrelated = 0
+function bump(delta) { qtyEl.textContent = Math.max(1, +qtyEl.textContent + delta); }
+document.querySelectorAll('.qty-btn').forEach(btn => {
+  btn.addEventListener('click', () => bump(+btn.dataset.d));
+});
+// 倒计时
+const cd = document.querySelector('#countdown .cd-time');
+setInterval(() => { cd.textContent = new Date().toLocaleTimeString(); }, 1000);
+</script></body></html>"""
+
+
+def test_fragment_js_includes_handlers_timers_and_used_declarations():
+    stepper = extract_fragment(WIDGETS, "stepper")
+    assert "const qtyEl" in stepper.js and "function bump" in stepper.js
+    assert "addEventListener('click'" in stepper.js
+    assert "unrelated" not in stepper.js and "setInterval" not in stepper.js
+    assert stepper.self_contained
+
+    countdown = extract_fragment(WIDGETS, "countdown")
+    assert "const cd" in countdown.js and "setInterval" in countdown.js
+    assert "qtyEl" not in countdown.js
+    assert countdown.self_contained
+
+
+def test_script_touching_other_elements_is_not_self_contained():
+    page = WIDGETS.replace(
+        "</script>",
+        "qtyEl.addEventListener('change', () => { document.getElementById('cart-count').textContent = qtyEl.textContent; });\n</script>",
+    )
+    stepper = extract_fragment(page, "stepper")
+    assert "cart-count" in stepper.js
+    assert not stepper.self_contained
+
+
+def test_statements_respect_blocks_strings_and_asi():
+    script = "if (a) {\n  x('}')\n}\nelse {\n  y()\n}\nlet n = 1\nfoo()\n  .then(r => r)\nbar();"
+    assert _statements(script) == [
+        "if (a) {\n  x('}')\n}\nelse {\n  y()\n}",
+        "let n = 1",
+        "foo()\n  .then(r => r)",
+        "bar();",
+    ]
+
+
+def test_least_recently_matched_fragments_are_evicted(tmp_path):
+    library = FragmentLibrary(path=str(tmp_path / "library.json"), max_fragments=2)
+    specs = {
+        name: {"components": [{"id": name, "html": "div", "children": [{"tag": "p", "content_hint": hint}]}]}
+        for name, hint in (("stepper", "数量加减 按钮"), ("countdown", "限时 倒计时"), ("coupon", "领取 优惠券"))
+    }
+    pages = {name: f'<html><body><div id="{name}"><p>{name}</p></div></body></html>' for name in specs}
+    library.harvest(pages["stepper"], specs["stepper"])
+    library.harvest(pages["countdown"], specs["countdown"])
+    assert library.match(specs["stepper"])  # stepper 变为最近使用
+    library.harvest(pages["coupon"], specs["coupon"])
+
+    assert library.stats()["fragments"] == 2 and library.stats()["evicted"] == 1
+    assert library.match(specs["stepper"]) and library.match(specs["coupon"])
+    assert not library.match(specs["countdown"])
+    assert len(FragmentLibrary(path=library.path, max_fragments=2).match(specs["stepper"])) == 1
+
+
+def test_identical_component_matches_with_full_similarity(tmp_path):
+    library = _library(tmp_path)
+    [(key, score)] = library._index.query(component_text(SPEC["components"][0]), 0.0, limit=1)
+    assert key.startswith("stepper#") and score == 1.0
+
+
+RESPONSIVE = """<html><head><style>
+@import url("fonts.css");
+#banner { animation: pulse 2s infinite, fade-in .3s; }
+.other { color: red; }
+@media (max-width: 600px) {
+  #banner { font-size: 14px; }
+  .other { display: none; }
+}
+@media print { .other { display: none; } }
+@keyframes pulse { from { opacity: 1; } to { opacity: .5; } }
+@keyframes fade-in { 0% { opacity: 0; } 100% { opacity: 1; } }
+@keyframes spin { to { transform: rotate(1turn); } }
+@font-face { font-family: Demo; src: url(demo.woff2); }
+</style></head><body><div id="banner">限时</div><p class="other">x</p></body></html>"""
+
+
+def test_fragment_css_keeps_media_queries_and_used_keyframes():
+    css = extract_fragment(RESPONSIVE, "banner").css
+    assert "#banner {animation: pulse 2s infinite, fade-in .3s;}" in css
+    assert "@media (max-width: 600px) {\n#banner {font-size: 14px;}\n}" in css
+    assert "@keyframes pulse" in css and "to { opacity: .5; }" in css
+    assert "@keyframes fade-in" in css
+    assert "spin" not in css and ".other" not in css and "print" not in css
+    assert "@import" not in css and "@font-face" not in css
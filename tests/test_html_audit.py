@@ -0,0 +1,40 @@
+from core.html_audit import _storage_loops, audit_html
+
+
+def test_loop_without_body_does_not_borrow_a_later_block():
+    script = (
+        "for (let i = 0; i < items.length; i++) total += items[i];\n"
+        "function save() { localStorage.setItem('cart', JSON.stringify(cart)); }\n"
+    )
+    assert _storage_loops(script) == []
+
+
+def test_single_statement_body_is_checked():
+    script = "for (const key of keys) localStorage.removeItem(key);\n"
+    assert len(_storage_loops(script)) == 1
+
+
+def test_block_body_and_callback_loops():
+    script = (
+        "while (queue.length) {\n  const item = queue.shift();\n  localStorage['last'] = item;\n}\n"
+        "items.forEach(item => localStorage.setItem(item.id, item.qty));\n"
+        "items.map(item => item.id);\n"
+    )
+    findings = _storage_loops(script)
+    assert len(findings) == 2
+    assert findings[0].startswith("line 1:") and findings[1].startswith("line 5:")
+
+
+def test_do_while_tail_and_parens_in_strings():
+    script = (
+        "do { n--; } while (n > 0);\n"
+        "const cache = localStorage.getItem('x');\n"
+        "for (const s of [')', '{']) { localStorage.getItem(s); }\n"
+    )
+    findings = _storage_loops(script)
+    assert len(findings) == 1 and findings[0].startswith("line 3:")
+
+
+def test_audit_reports_storage_loops():
+    html = "<html><body><script>for (const k of ks) { localStorage.getItem(k); }</script></body></html>"
+    assert len(audit_html(html).storage_loops) == 1
@@ -0,0 +1,75 @@
+import json
+
+from core.json_stream import IncrementalJSONParser
+
+
+DOC = {
+    "title": "卖瓜子 {促销}",
+    "page_sections": [
+        {"name": "hero", "notes": '含 "转义" 与 ] } \\ 符号'},
+        {"name": "cart", "items": [1, [2, 3]]},
+    ],
+    "tags": ["a", 2, True, None],
+}
+
+
+def _feed_in_chunks(parser, text, size):
+    for start in range(0, len(text), size):
+        if parser.feed(text[start: start + size]):
+            break
+
+
+def test_items_are_emitted_as_each_element_closes():
+    text = json.dumps(DOC, ensure_ascii=False)
+    seen = []
+    parser = IncrementalJSONParser(
+        watch=[("page_sections",), ("tags",)], on_item=lambda path, value: seen.append((path, value))
+    )
+    for size in (1, 7, len(text)):
+        seen.clear()
+        parser.__init__(parser.watch, parser.on_item)
+        _feed_in_chunks(parser, text, size)
+        assert parser.done
+        assert seen == [
+            (("page_sections",), DOC["page_sections"][0]),
+            (("page_sections",), DOC["page_sections"][1]),
+            (("tags",), "a"),
+            (("tags",), 2),
+            (("tags",), True),
+            (("tags",), None),
+        ]
+        assert parser.root() == DOC
+
+
+def test_first_item_is_reported_before_the_document_closes():
+    text = json.dumps(DOC, ensure_ascii=False)
+    parser = IncrementalJSONParser(watch=[("page_sections",)])
+    parser.feed(text[: text.index('{"name": "cart"')])
+    assert not parser.done
+    assert parser.items == [(("page_sections",), DOC["page_sections"][0])]
+
+
+def test_prose_and_fences_are_skipped_and_trailing_text_ignored():
+    text = "下面是 PRD：\n```json\n" + json.dumps(DOC, ensure_ascii=False) + "\n```\n补充说明 {not json}"
+    parser = IncrementalJSONParser(watch=[("page_sections",)])
+    assert parser.feed(text)
+    assert parser.root() == DOC
+    assert parser.root_text() == json.dumps(DOC, ensure_ascii=False)
+    assert len(parser.items) == 2
+
+
+def test_nested_paths_and_unwatched_arrays():
+    doc = {"components": [{"id": "hero", "children": [{"tag": "h1"}]}], "colors": ["#fff"]}
+    parser = IncrementalJSONParser(watch=[("components",), ("components", "children")])
+    parser.feed(json.dumps(doc))
+    assert parser.items == [
+        (("components", "children"), {"tag": "h1"}),
+        (("components",), doc["components"][0]),
+    ]
+
+
+def test_incomplete_stream_is_not_done():
+    parser = IncrementalJSONParser(watch=[("page_sections",)])
+    assert not parser.feed('{"page_sections": [{"name": "hero"}, {"name": "ca')
+    assert parser.root() is None and parser.root_text() is None
+    assert len(parser.items) == 1
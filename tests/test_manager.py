@@ -0,0 +1,150 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("openai")
+
+from core import manager as manager_module  # noqa: E402
+from core.deadline import DeadlineExceeded, StepLatencyHistory, expired  # noqa: E402
+from core.manager import Manager  # noqa: E402
+from core.work_queue import SQLiteWorkQueue, Worker  # noqa: E402
+
+
+PLANNING = ("team_leader", "pm", "arch", "project")
+
+
+@pytest.fixture(autouse=True)
+def offline(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(manager_module, "STEP_LATENCIES", StepLatencyHistory())
+
+
+def _planning_output(content, context=None, **kwargs):
+    return {"from": content}
+
+
+def _engineer(content, context=None, **kwargs):
+    if expired():
+        raise DeadlineExceeded("Engineer: no time budget left")
+    return f"<html><body>{content}</body></html>"
+
+
+def _fake_agents(manager, planning=_planning_output, engineer=_engineer):
+    for name in PLANNING:
+        setattr(getattr(manager, name), "process", planning)
+    manager.eng.process = engineer
+    return manager
+
+
+def test_cold_start_deadline_degrades_instead_of_starving_the_engineer():
+    def slow_planning(content, context=None, **kwargs):
+        # 模拟一直占满步骤预算的慢模型
+        while not expired():
+            time.sleep(0.005)
+        raise DeadlineExceeded("planning step ran out of budget")
+
+    manager = _fake_agents(Manager(cp=False, sp=True), planning=slow_planning)
+    html, metrics = manager.run("卖瓜子", deadline=0.4)
+
+    assert html == "<html><body>卖瓜子</body></html>"
+    assert metrics["deadline"]["degraded"] is True
+    assert "PM" in metrics["deadline"]["cancelled"]
+
+
+def test_run_without_deadline_is_not_coalesced_with_a_budgeted_run():
+    entered, release = threading.Event(), threading.Event()
+
+    def blocking_engineer(content, context=None, **kwargs):
+        entered.set()
+        release.wait(5)
+        return _engineer(content)
+
+    leader = _fake_agents(Manager(cp=False, sp=False), engineer=blocking_engineer)
+    follower = _fake_agents(Manager(cp=False, sp=False))
+    results = {}
+    thread = threading.Thread(target=lambda: results.setdefault("leader", leader.run("卖瓜子", deadline=30)))
+    thread.start()
+    assert entered.wait(5)
+    results["follower"] = follower.run("卖瓜子")
+    release.set()
+    thread.join(5)
+
+    assert results["follower"][1]["coalesced"] is False
+    assert results["leader"][1]["coalesced"] is False
+
+
+def test_session_fork_reuses_only_steps_produced_with_the_same_config():
+    calls = []
+
+    def planning(content, context=None, **kwargs):
+        calls.append("planning")
+        return {"from": str(content), "context": len(context or [])}
+
+    def engineer(content, context=None, **kwargs):
+        calls.append("engineer")
+        return f"<html><body>{len(context or [])}</body></html>"
+
+    manager = _fake_agents(Manager(cp=True, sp=True), planning=planning, engineer=engineer)
+    html_cp, _ = manager.run("卖瓜子")
+    assert calls.count("engineer") == 1
+
+    calls.clear()
+    same, metrics = manager.run("卖瓜子", session=manager.bus.fork())
+    assert same == html_cp and calls == []
+    assert "Engineer" in metrics["session"]["reused"]
+
+    calls.clear()
+    html_op, metrics = manager.run("卖瓜子", cp=False, session=manager.bus.fork())
+    assert html_op != html_cp
+    assert calls.count("engineer") == 1 and calls.count("planning") == 3
+    assert metrics["session"]["reused"] == []
+
+
+def test_remote_deadline_exceeded_degrades_like_a_local_one(tmp_path):
+    def timed_out_planning(content, context=None, **kwargs):
+        # worker 上的模型调用在协调端等待超时之前就已超时
+        raise DeadlineExceeded("planning step ran out of budget")
+
+    queue = SQLiteWorkQueue(str(tmp_path / "queue.db"))
+    manager = _fake_agents(Manager(cp=False, sp=True, work_queue=queue), planning=timed_out_planning)
+    agents = {agent.name: agent for agent in (manager.team_leader, manager.pm, manager.arch, manager.project, manager.eng)}
+    worker = Worker(queue, agents=agents, lease=5.0, poll=0.01)
+    thread = threading.Thread(target=worker.run, kwargs={"idle_timeout": 1.0})
+    thread.start()
+    html, metrics = manager.run("卖瓜子", deadline=30)
+    thread.join(5)
+
+    assert html == "<html><body>卖瓜子</body></html>"
+    assert metrics["deadline"]["degraded"] is True
+
+
+def test_keep_skipped_runs_every_step_but_reports_the_unneeded_ones():
+    calls = []
+
+    def planning(content, context=None, **kwargs):
+        calls.append("planning")
+        return {"from": str(content)}
+
+    manager = _fake_agents(Manager(cp=False, sp=True), planning=planning)
+    _, metrics = manager.run("卖瓜子")
+    assert calls.count("planning") == 3
+    assert metrics["demand"]["skipped"] == ["TeamLeader"] and metrics["demand"]["kept"] == []
+
+    calls.clear()
+    _, metrics = manager.run("卖瓜子", keep_skipped=True)
+    assert calls.count("planning") == 4
+    assert metrics["demand"]["skipped"] == [] and metrics["demand"]["kept"] == ["TeamLeader"]
+
+
+def test_unknown_needed_topic_fails_before_any_step_runs():
+    calls = []
+
+    def planning(content, context=None, **kwargs):
+        calls.append("planning")
+        return {"from": str(content)}
+
+    manager = _fake_agents(Manager(cp=False, sp=True), planning=planning)
+    with pytest.raises(ValueError, match="task_plan"):
+        manager.run("卖瓜子", needed={"plan"})
+    assert calls == [] and manager.bus.history() == []
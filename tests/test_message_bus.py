@@ -0,0 +1,38 @@
+from core.blob_store import BlobHandle, BlobStore
+from core.message_bus import MessageBus
+
+
+def test_payload_bytes_counts_blobs_without_reading_them(tmp_path, monkeypatch):
+    bus = MessageBus(blobs=BlobStore(root=str(tmp_path), threshold=64))
+    bus.publish("brief", "User", "卖瓜子")
+    page = bus.publish("html", "Engineer", "<html>" + "x" * 500 + "</html>")["content"]
+    assert isinstance(page, BlobHandle)
+
+    monkeypatch.setattr(BlobHandle, "materialize", lambda self: (_ for _ in ()).throw(AssertionError("read")))
+    brief_bytes = len('"卖瓜子"'.encode("utf-8"))
+    assert bus.payload_bytes(["html"]) == len(page) + 2 == 515  # JSON 字符串带引号
+    assert bus.payload_bytes(["brief"]) == brief_bytes
+    assert bus.payload_bytes() == brief_bytes + 515
+
+
+def test_payload_bytes_measures_the_prompt_form_of_pickled_blobs(tmp_path):
+    bus = MessageBus(blobs=BlobStore(root=str(tmp_path), threshold=64))
+    spec = {"sections": [{"id": f"s{i}", "title": "促销"} for i in range(20)]}
+    assert isinstance(bus.publish("page_spec", "Architect", spec)["content"], BlobHandle)
+
+    (rendered,) = bus.chat_history(["page_spec"])
+    assert rendered["content"][0]["text"].endswith(MessageBus._json_dump(spec))
+    assert bus.payload_bytes(["page_spec"]) == len(MessageBus._json_dump(spec).encode("utf-8"))
+
+
+def test_payload_bytes_on_fork_sees_prefix_only(tmp_path):
+    bus = MessageBus(blobs=BlobStore(root=str(tmp_path)))
+    bus.publish("prd", "PM", {"title": "a"})
+    fork = bus.fork()
+    bus.publish("prd", "PM", {"title": "parent only"})
+    fork.publish("page_spec", "Architect", [1, 2])
+    assert fork.payload_bytes(["prd"]) == bus.payload_bytes(["prd"]) - len(
+        MessageBus._json_dump({"title": "parent only"}).encode("utf-8")
+    )
+    assert fork.payload_bytes(["page_spec"]) == len(MessageBus._json_dump([1, 2]).encode("utf-8"))
+    assert bus.payload_bytes(["page_spec"]) == 0
@@ -0,0 +1,69 @@
+from core.output_budget import OutputBudget
+
+
+PAGE = "<html><body>促销</body>"
+
+
+def _budget():
+    return OutputBudget(min_samples=2, min_tokens=1)
+
+
+def test_cancelled_and_usage_less_calls_are_not_sampled():
+    budget = _budget()
+    budget.record("PM", {}, {"completion_tokens": 5}, 1.0, "cancelled")
+    budget.record("PM", {}, {}, 1.0, "stop")
+    budget.record("PM", {}, {"completion_tokens": 0}, 1.0, "stop")
+    assert budget.limit("PM") is None
+    stats = budget.stats()["PM"]
+    assert (stats["calls"], stats["cancelled"], stats["unsampled"]) == (3, 1, 2)
+
+    budget.record("PM", {}, {"completion_tokens": 100}, 1.0, "stop")
+    budget.record("PM", {}, {"completion_tokens": 200}, 1.0, "stop")
+    assert budget.limit("PM") == 250
+
+
+def test_savings_are_only_credited_from_measured_trailing_output():
+    budget = _budget()
+    for tokens in (1000, 1200):
+        budget.record("Engineer", {}, {"completion_tokens": tokens}, tokens / 100, "stop")
+    options = budget.request_options("Engineer")
+    assert options["stop"] == ["</html>"] and options["max_tokens"] == 1500
+
+    # 没有实测的文档后输出：即使 stop 生效也不声称节省
+    report = budget.record("Engineer", options, {"completion_tokens": 600}, 6.0, "stop", PAGE)
+    assert "est_saved_seconds" not in report
+    assert budget.stats()["Engineer"]["stopped"] == 1
+
+    # 未带 stop 的调用在 </html> 之后又生成了与页面等长的说明：一半 token 属于多余输出
+    padded = PAGE + "</html>" + "x" * len(PAGE + "</html>")
+    budget.record("Engineer", {}, {"completion_tokens": 400}, 4.0, "stop", padded)
+    budget.record("Engineer", {}, {"completion_tokens": 400}, 4.0, "stop", PAGE + "</html>")
+    assert budget.stats()["Engineer"]["trailing_samples"] == 2
+
+    # 实测的多余 token 均值 (200 + 0) / 2，每 token 0.01 秒
+    report = budget.record("Engineer", options, {"completion_tokens": 600}, 6.0, "stop", PAGE)
+    assert report["est_saved_seconds"] == 1.0
+
+    # 自然结束（文本自带 </html>）的调用不计节省
+    report = budget.record("Engineer", options, {"completion_tokens": 600}, 6.0, "stop", PAGE + "</html>")
+    assert "est_saved_seconds" not in report
+
+
+def test_truncation_widens_headroom_without_sampling_or_savings():
+    budget = _budget()
+    for tokens in (100, 100):
+        budget.record("PM", {}, {"completion_tokens": tokens}, 1.0, "stop")
+    options = budget.request_options("PM")
+    report = budget.record("PM", options, {"completion_tokens": options["max_tokens"]}, 1.0, "length", "{")
+    assert report["truncated"]
+    assert budget.limit("PM") > options["max_tokens"]
+    assert budget.stats()["PM"]["saved_seconds"] == 0
+
+
+def test_finish_reappends_the_stripped_stop_only_when_it_fired():
+    budget = _budget()
+    options = {"stop": ["</html>"]}
+    assert budget.finish("Engineer", PAGE, options, "stop") == PAGE + "\n</html>"
+    assert budget.finish("Engineer", PAGE + "</html>", options, "stop") == PAGE + "</html>"
+    assert budget.finish("Engineer", PAGE, options, "length") == PAGE
+    assert budget.finish("Engineer", "抱歉", options, "stop") == "抱歉"
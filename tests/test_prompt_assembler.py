@@ -0,0 +1,72 @@
+import json
+
+from core.message_bus import MessageBus
+from core.prompt_assembler import REFERENCE, assemble_prompt, canonical_json
+
+
+BRIEF = "为新疆瓜子做一个限时促销落地页，突出颗粒饱满、现炒现发，并提供优惠券领取和加购按钮"
+PRD = {"product": "新疆瓜子促销页", "goals": ["提升加购率"], "target_users": ["学生"], "page_sections": []}
+TASK_PLAN = {"tasks": [{"id": "hero", "description": "首屏卖点与倒计时"}]}
+PAGE_SPEC = {"components": [{"id": "hero", "html": "section", "children": []}]}
+
+
+def _context(*messages):
+    bus = MessageBus()
+    for topic, sender, content in messages:
+        bus.publish(topic, sender, content)
+    return bus.chat_history()
+
+
+def _occurrences(assembled, needle):
+    texts = [assembled.user_prompt] + [part["text"] for message in assembled.context for part in message["content"]]
+    return sum(text.count(needle) for text in texts)
+
+
+def test_brief_string_is_sent_once():
+    assembled = assemble_prompt(BRIEF, _context(("brief", "User", BRIEF)))
+    assert assembled.user_prompt == REFERENCE.format(topic="brief")
+    assert _occurrences(assembled, BRIEF) == 1
+    assert assembled.report["referenced"] == ["brief"] and assembled.report["bytes_saved"] > 0
+
+
+def test_brief_field_of_a_payload_is_sent_once():
+    context = _context(("brief", "User", BRIEF), ("prd", "PM", PRD))
+    assembled = assemble_prompt({"brief": BRIEF}, context)
+    assert _occurrences(assembled, BRIEF) == 1
+    assert json.loads(assembled.user_prompt) == {"brief": REFERENCE.format(topic="brief")}
+
+
+def test_structured_artifacts_are_sent_once():
+    context = _context(("brief", "User", BRIEF), ("task_plan", "Project", TASK_PLAN), ("page_spec", "Architect", PAGE_SPEC))
+    assembled = assemble_prompt({"task_plan": TASK_PLAN, "page_spec": PAGE_SPEC}, context)
+    for artifact in (TASK_PLAN, PAGE_SPEC):
+        assert _occurrences(assembled, canonical_json(artifact)) == 1
+    assert sorted(assembled.report["referenced"]) == ["page_spec", "task_plan"]
+
+
+def test_short_strings_are_not_replaced_by_a_longer_reference():
+    assembled = assemble_prompt({"mode": "ok", "brief": BRIEF}, _context(("status", "PM", "ok")))
+    assert json.loads(assembled.user_prompt) == {"mode": "ok", "brief": BRIEF}
+    assert assembled.report["referenced"] == []
+
+
+def test_pm_sends_the_brief_once(monkeypatch):
+    from core import agent_base
+    from core.endpoints import EndpointPool
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(agent_base, "shared_pool", lambda key: EndpointPool(["x"], client_factory=lambda url: object()))
+    from agents.pm_agent import PMAgent
+
+    sent = []
+
+    def dispatch(messages, candidates, on_delta=None, options=None):
+        sent.extend(messages)
+        return json.dumps(PRD, ensure_ascii=False), {"model": candidates[0]}, {}
+
+    agent = PMAgent()
+    monkeypatch.setattr(agent, "_dispatch", dispatch)
+    prd = agent.process(BRIEF, context=_context(("brief", "User", BRIEF)))
+
+    assert prd.product == PRD["product"]
+    assert sum(part["text"].count(BRIEF) for message in sent for part in message["content"]) == 1
@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+from core.deadline import DeadlineExceeded, budget
+from core.rate_limiter import RequestGovernor, TokenBucket, estimate_tokens
+
+
+class TooManyRequests(Exception):
+    status_code = 429
+
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = TokenBucket(60)  # 每秒 1 个
+    now = bucket.updated
+    assert bucket.wait_time(60, now) == 0.0
+    bucket.take(60)
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now + 0.5) == pytest.approx(0.5)
+    # 超过容量的请求按装满放行，不会永久阻塞
+    assert bucket.wait_time(600, now + 0.5) == pytest.approx(59.5)
+    bucket.credit(1000)
+    assert bucket.level == 60
+    bucket.drain()
+    assert bucket.level == 0
+    assert TokenBucket(None).wait_time(10**9, now) == 0.0
+
+
+def test_estimate_uses_the_smaller_completion_cap():
+    messages = [{"role": "user", "content": "x" * 250}]
+    assert estimate_tokens(messages, "Engineer", 100) - estimate_tokens(messages, "Engineer", 50) == 50
+    assert estimate_tokens(messages, "Engineer", 10**6) == estimate_tokens(messages, "Engineer")
+
+
+def _admission_order(governor, arrivals):
+    """Queue ``(role, delay)`` arrivals behind one held slot and return the order they are admitted in."""
+
+    order, threads = [], []
+    blocker = governor.acquire("Engineer", 1)
+
+    def request(role):
+        with governor.acquire(role, 1):
+            order.append(role)
+
+    for role, delay in arrivals:
+        time.sleep(delay)
+        threads.append(threading.Thread(target=request, args=(role,)))
+        threads[-1].start()
+    deadline = time.monotonic() + 2
+    while governor.stats()["queued"] < len(arrivals) and time.monotonic() < deadline:
+        time.sleep(0.001)
+    blocker.__exit__(None, None, None)
+    for thread in threads:
+        thread.join(2)
+    return order
+
+
+def test_higher_priority_requests_go_first():
+    governor = RequestGovernor(max_concurrency=1)
+    order = _admission_order(governor, [("TeamLeader", 0), ("PM", 0.01), ("Engineer", 0.01)])
+    assert order == ["Engineer", "PM", "TeamLeader"]
+
+
+def test_priorities_age_so_planning_calls_are_not_starved():
+    governor = RequestGovernor(max_concurrency=1, aging=0.05)
+    order = _admission_order(governor, [("TeamLeader", 0), ("Engineer", 0.15), ("Engineer", 0)])
+    assert order == ["TeamLeader", "Engineer", "Engineer"]
+
+
+def test_settle_corrects_the_token_estimate():
+    governor = RequestGovernor(tpm=1000)
+    with governor.acquire("PM", 500) as permit:
+        permit.settle(100)
+    assert governor.tokens.level == pytest.approx(900, abs=1)
+
+
+def test_server_429_drains_the_buckets():
+    governor = RequestGovernor(rpm=60, tpm=10_000)
+    with pytest.raises(TooManyRequests):
+        with governor.acquire("PM", 10):
+            raise TooManyRequests()
+    now = time.monotonic()
+    assert governor.requests.wait_time(1, now) == pytest.approx(1.0, abs=0.05)
+    assert governor.tokens.wait_time(10, now) > 0
+    assert governor.stats()["server_429"] == 1
+
+
+def test_wait_beyond_the_time_budget_raises():
+    governor = RequestGovernor(rpm=60)
+    governor.requests.drain()
+    with budget(0.05), pytest.raises(DeadlineExceeded):
+        governor.acquire("PM", 1)
+    assert governor.stats()["queued"] == 0
+
+
+def test_disabled_governor_admits_immediately():
+    governor = RequestGovernor()
+    assert not governor.enabled
+    with governor.acquire("Engineer", 10**9) as permit:
+        assert permit.waited == 0.0
@@ -0,0 +1,48 @@
+from core.routing import ModelRouter, RoleRoute
+
+
+ROUTES = {
+    "Engineer": RoleRoute("big", ["small"]),
+    "TeamLeader": RoleRoute("small", ["big"]),
+}
+
+
+def _router(**kwargs):
+    return ModelRouter(routes=ROUTES, model_quality={"big": 1.0, "small": 0.7}, min_samples=3, **kwargs)
+
+
+def test_quality_floor_and_unknown_roles():
+    router = ModelRouter(routes={"Engineer": RoleRoute("big", ["small"], 0.9)}, model_quality={"big": 1.0, "small": 0.7})
+    assert router.candidates("Engineer", "default") == ["big"]
+    assert router.candidates("Other", "default") == ["default"]
+
+
+def test_table_order_wins_until_there_is_latency_evidence():
+    router = _router()
+    assert router.candidates("Engineer", "x") == ["big", "small"]
+    for _ in range(3):
+        router.record("big", 9.0, ok=True, role="Engineer")
+        router.record("small", 2.0, ok=True, role="Engineer")
+    assert router.candidates("Engineer", "x") == ["small", "big"]
+
+
+def test_latency_is_compared_per_role():
+    router = _router()
+    for _ in range(3):
+        router.record("big", 40.0, ok=True, role="Engineer")
+        router.record("small", 3.0, ok=True, role="TeamLeader")
+        router.record("big", 2.0, ok=True, role="TeamLeader")
+    assert router.candidates("TeamLeader", "x") == ["big", "small"]
+
+
+def test_error_rate_is_tracked_per_role():
+    router = _router()
+    for _ in range(5):
+        router.record("big", 60.0, ok=False, role="Engineer")
+        router.record("big", 1.0, ok=True, role="TeamLeader")
+        router.record("small", 3.0, ok=True, role="TeamLeader")
+
+    assert router.candidates("Engineer", "x") == ["small", "big"]
+    # Engineer 的超时不应让 TeamLeader 把 big 视为不健康
+    assert router.candidates("TeamLeader", "x") == ["big", "small"]
+    assert router.stats()["big"] == {"samples": 10, "error_rate": 0.5, "p50_latency": 1.0}
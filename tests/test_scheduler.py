@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+from core.scheduler import StageScheduler
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert condition()
+
+
+def _admission_order(scheduler, tickets, hold=0.02):
+    """Queue a backlog while the only slot is busy, then record the order in which it drains.
+
+    Every ticket waits from (almost) the same moment, so aging does not
+    favour anyone and the order reflects class, tenant lag and criticality.
+    """
+
+    admitted, gate = [], threading.Event()
+
+    def blocker():
+        with scheduler.slot("warmup"):
+            gate.wait(5)
+
+    def step(tenant, priority, critical):
+        with scheduler.slot(tenant, priority, critical=critical):
+            admitted.append(tenant)
+            time.sleep(hold)
+
+    threads = [threading.Thread(target=blocker)]
+    threads[0].start()
+    _wait_until(lambda: scheduler.running == 1)
+    for args in tickets:
+        threads.append(threading.Thread(target=step, args=args))
+        threads[-1].start()
+    _wait_until(lambda: scheduler.stats()["queued"] == len(tickets))
+    gate.set()
+    for thread in threads:
+        thread.join(10)
+    return admitted
+
+
+def test_tenant_shares_follow_the_configured_weights():
+    scheduler = StageScheduler(slots=1, tenant_weights={"a": 2.0, "b": 1.0, "c": 1.0})
+    tickets = [(tenant, "standard", False) for _ in range(8) for tenant in "abc"]
+    first = _admission_order(scheduler, tickets)[:16]
+    counts = {tenant: first.count(tenant) for tenant in "abc"}
+    assert 7 <= counts["a"] <= 9
+    assert 3 <= counts["b"] <= 5 and 3 <= counts["c"] <= 5
+
+
+def test_weight_scales_slot_time_once():
+    # 关键路径加成 0.1s：权重 2 的租户每步 0.02s 只记 0.01s 虚拟时间，约领先 10 步后按 2:1 轮转
+    scheduler = StageScheduler(slots=1, tenant_weights={"a": 2.0}, critical_bonus=0.1)
+    tickets = [("a", "standard", True)] * 14 + [("b", "standard", False)] * 4
+    order = _admission_order(scheduler, tickets)
+    assert 8 <= order.index("b") <= 11
+    tail = order[order.index("b"):]
+    assert tail.count("a") >= tail.count("b") - 1
+
+
+def test_priority_classes_and_critical_steps_go_first():
+    scheduler = StageScheduler(slots=1)
+    tickets = [("bulk", "bulk", False), ("standard", "standard", False), ("interactive", "interactive", False)]
+    tickets.append(("critical", "standard", True))
+    assert _admission_order(scheduler, tickets, hold=0.005) == ["interactive", "critical", "standard", "bulk"]
+    assert scheduler.stats()["overtaken"] == 3
+
+
+def test_unknown_priority_and_bad_slots_are_rejected():
+    with pytest.raises(ValueError):
+        StageScheduler(slots=0)
+    with pytest.raises(ValueError):
+        with StageScheduler(slots=1).slot(priority="urgent"):
+            pass
+
+
+def test_returning_tenant_gets_no_credit_for_idle_time():
+    scheduler = StageScheduler(slots=1)
+    with scheduler.slot("idle"):
+        time.sleep(0.005)
+    for _ in range(5):
+        with scheduler.slot("busy"):
+            time.sleep(0.02)
+    # 空闲租户返回时与一直活跃的租户轮流执行，而不是用积攒的虚拟时间连续插队
+    tickets = [("busy", "standard", False), ("idle", "standard", False)] * 4
+    first = _admission_order(scheduler, tickets)[:4]
+    assert first.count("idle") <= 2
@@ -0,0 +1,86 @@
+import threading
+import time
+
+from core.singleflight import SingleFlight, request_key
+
+
+def _run_concurrently(group, key, fn, callers):
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(group.do(key, fn))
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def _wait_for_waiters(group, count):
+    deadline = time.monotonic() + 5
+    while group.stats()["coalesced"] < count and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def test_concurrent_callers_share_one_execution():
+    group = SingleFlight("test")
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "page"
+
+    threads, results, errors = _run_concurrently(group, "k", fn, 1)
+    assert started.wait(5)
+    followers, more_results, _ = _run_concurrently(group, "k", fn, 4)
+    _wait_for_waiters(group, 4)
+    release.set()
+    for thread in threads + followers:
+        thread.join(5)
+
+    assert calls == [1]
+    assert not errors
+    shared = sorted(flag for _, flag in results + more_results)
+    assert shared == [False, True, True, True, True]
+    assert {value for value, _ in results + more_results} == {"page"}
+    assert group.stats() == {"executed": 1, "coalesced": 4, "in_flight": 0}
+
+
+def test_leader_error_reaches_every_waiter_and_key_is_released():
+    group = SingleFlight("test")
+    started, release = threading.Event(), threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise ValueError("boom")
+
+    leader, _, leader_errors = _run_concurrently(group, "k", failing, 1)
+    assert started.wait(5)
+    followers, _, follower_errors = _run_concurrently(group, "k", failing, 2)
+    _wait_for_waiters(group, 2)
+    release.set()
+    for thread in leader + followers:
+        thread.join(5)
+
+    assert [type(exc) for exc in leader_errors + follower_errors] == [ValueError] * 3
+    # 失败后键已释放：下一次调用重新执行
+    assert group.do("k", lambda: "retry") == ("retry", False)
+
+
+def test_sequential_calls_are_not_coalesced():
+    group = SingleFlight("test")
+    assert group.do("k", lambda: 1) == (1, False)
+    assert group.do("k", lambda: 2) == (2, False)
+    assert group.stats()["coalesced"] == 0
+
+
+def test_request_key_is_stable_and_order_sensitive():
+    assert request_key("a", {"x": 1, "y": 2}) == request_key("a", {"y": 2, "x": 1})
+    assert request_key("a", 1, 2) != request_key("a", 2, 1)
@@ -0,0 +1,82 @@
+import json
+import threading
+
+import pytest
+
+from core import tracing
+from core.tracing import Tracer
+
+
+def test_disabled_tracer_returns_a_falsy_noop():
+    tracer = Tracer(enabled=False)
+    with tracer.span("Manager.run") as s:
+        assert not s
+        s.set(tokens=1)
+    assert tracer.spans() == []
+
+
+def test_spans_nest_and_record_attributes_and_errors():
+    tracer = Tracer(enabled=True)
+    with tracer.span("Manager.run", cp=True) as run:
+        with tracer.span("Agent:PM") as pm:
+            pm.set(tokens=12)
+        with pytest.raises(RuntimeError):
+            with tracer.span("Agent:Engineer"):
+                raise RuntimeError("boom")
+
+    by_name = {record["name"]: record for record in tracer.spans()}
+    assert [record["name"] for record in tracer.spans()] == ["Manager.run", "Agent:PM", "Agent:Engineer"]
+    assert by_name["Manager.run"]["parent"] is None
+    assert by_name["Agent:PM"]["parent"] == run.span_id
+    assert by_name["Agent:Engineer"]["parent"] == run.span_id
+    assert by_name["Agent:PM"]["attrs"] == {"tokens": 12}
+    assert by_name["Agent:Engineer"]["attrs"] == {"error": "RuntimeError"}
+    assert by_name["Manager.run"]["duration_us"] >= by_name["Agent:PM"]["duration_us"]
+
+
+def test_each_thread_builds_its_own_tree():
+    tracer = Tracer(enabled=True)
+
+    def worker():
+        with tracer.span("worker"):
+            pass
+
+    with tracer.span("Manager.run"):
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+
+    records = {record["name"]: record for record in tracer.spans()}
+    assert records["worker"]["parent"] is None
+    assert records["worker"]["tid"] != records["Manager.run"]["tid"]
+
+
+def test_exports(tmp_path):
+    tracer = Tracer(enabled=True)
+    with tracer.span("Manager.run"):
+        with tracer.span("Agent:PM", model="m"):
+            pass
+
+    tracer.export_jsonl(str(tmp_path / "trace.jsonl"))
+    lines = [json.loads(line) for line in (tmp_path / "trace.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert [line["name"] for line in lines] == ["Manager.run", "Agent:PM"]
+    assert lines[1]["parent"] == lines[0]["id"]
+
+    tracer.export_chrome_trace(str(tmp_path / "trace.json"))
+    events = json.loads((tmp_path / "trace.json").read_text(encoding="utf-8"))["traceEvents"]
+    assert [(e["name"], e["cat"], e["ph"]) for e in events] == [("Manager.run", "Manager", "X"), ("Agent:PM", "Agent", "X")]
+    assert events[1]["args"] == {"model": "m"}
+    assert events[0]["ts"] <= events[1]["ts"] and events[0]["dur"] >= events[1]["dur"]
+
+    tracer.reset()
+    assert tracer.spans() == []
+
+
+def test_module_span_follows_enable_and_disable(monkeypatch):
+    monkeypatch.setattr(tracing, "TRACER", Tracer(enabled=False))
+    assert not tracing.span("x")
+    tracing.enable()
+    with tracing.span("x"):
+        pass
+    tracing.disable()
+    assert [record["name"] for record in tracing.TRACER.spans()] == ["x"]
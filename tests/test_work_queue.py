@@ -0,0 +1,115 @@
+import time
+
+import pytest
+
+from core import deadline
+from core.schemas import PRD, PageSection
+from core.work_queue import SQLiteWorkQueue, WorkItem, WorkQueue, Worker, decode, encode, raise_remote
+
+
+class EchoAgent:
+    name = "PM"
+    model = None
+
+    def process(self, content, context=None, **kwargs):
+        if content == "slow":
+            while not deadline.expired():
+                time.sleep(0.005)
+            raise deadline.DeadlineExceeded("PM: step budget exhausted")
+        if content == "bad":
+            raise KeyError("missing field")
+        if content == "invalid":
+            raise ValueError("not a brief")
+        return PRD(product=content, goals=["g"], target_users=["u"], page_sections=["hero"])
+
+
+def test_schema_dataclasses_round_trip():
+    prd = PRD(product="瓜子", goals=["卖货"], target_users=["学生"], page_sections=[PageSection("hero", "首屏")])
+    assert decode(encode({"prd": prd, "items": (1, 2)})) == {"prd": prd, "items": [1, 2]}
+    item = WorkItem(role="PM", method="process", content=prd, kwargs={"prd": prd}, expires_at=time.time() + 3.0)
+    assert WorkItem.from_json(item.to_json()) == item
+
+
+def test_work_queue_is_abstract():
+    with pytest.raises(TypeError):
+        WorkQueue()
+
+
+def _run(queue, content, budget=None):
+    expires_at = None if budget is None else time.time() + budget
+    item = WorkItem(role="PM", method="process", content=content, expires_at=expires_at)
+    queue.submit(item)
+    assert Worker(queue, agents={"PM": EchoAgent()}, lease=5.0).run(max_items=1) == 1
+    return queue.wait(item.id)
+
+
+def test_worker_result_comes_back_as_dataclass(tmp_path):
+    queue = SQLiteWorkQueue(str(tmp_path / "queue.db"))
+    outcome = _run(queue, "瓜子")
+    assert decode(outcome["result"]).product == "瓜子"
+    assert queue.stats()["items"] == {"done": 1}
+
+
+@pytest.mark.parametrize(
+    "content, budget, expected",
+    [("slow", 0.05, deadline.DeadlineExceeded), ("invalid", None, ValueError), ("bad", None, RuntimeError)],
+)
+def test_remote_errors_keep_their_type(tmp_path, content, budget, expected):
+    queue = SQLiteWorkQueue(str(tmp_path / "queue.db"))
+    outcome = _run(queue, content, budget)
+    with pytest.raises(expected) as raised:
+        raise_remote(outcome, "PM")
+    assert type(raised.value) is expected
+    assert "remote step PM failed" in str(raised.value)
+
+
+def test_expired_leases_are_requeued_then_failed(tmp_path):
+    queue = SQLiteWorkQueue(str(tmp_path / "queue.db"), max_attempts=2)
+    item = WorkItem(role="PM", method="process", content="x")
+    queue.submit(item)
+    for attempt in range(2):
+        assert queue.claim("dead-worker", lease=0.0).id == item.id
+        time.sleep(0.01)
+        queue.requeue_expired()
+    outcome = queue.result(item.id)
+    assert outcome["error_type"] == "RuntimeError"
+    with pytest.raises(RuntimeError):
+        raise_remote(outcome, "PM")
+    assert not queue.complete(item.id, "late-worker", {"result": "x"})
+
+
+def test_wait_cancels_on_deadline(tmp_path):
+    queue = SQLiteWorkQueue(str(tmp_path / "queue.db"))
+    item = WorkItem(role="PM", method="process", content="x")
+    queue.submit(item)
+    with deadline.budget(0.05), pytest.raises(deadline.DeadlineExceeded):
+        queue.wait(item.id, poll=0.01)
+    assert queue.result(item.id) == {"error": "cancelled"}
+
+
+def test_time_spent_queued_counts_against_the_budget(tmp_path):
+    queue = SQLiteWorkQueue(str(tmp_path / "queue.db"))
+    agent = EchoAgent()
+    agent.process = lambda *args, **kwargs: pytest.fail("an expired item must not run")
+    item = WorkItem(role="PM", method="process", content="x", expires_at=time.time() + 0.05, step="PM")
+    queue.submit(item)
+    time.sleep(0.1)  # 没有空闲 worker：预算在排队中耗尽
+    Worker(queue, agents={"PM": agent}).run(max_items=1)
+    outcome = queue.result(item.id)
+    assert outcome["error_type"] == "DeadlineExceeded" and "expired while queued" in outcome["error"]
+
+
+def test_worker_runs_with_what_is_left_of_the_budget(tmp_path):
+    queue = SQLiteWorkQueue(str(tmp_path / "queue.db"))
+    seen = {}
+
+    class BudgetAgent(EchoAgent):
+        def process(self, content, context=None, **kwargs):
+            seen["left"] = deadline.remaining()
+            return super().process(content, context)
+
+    item = WorkItem(role="PM", method="process", content="x", expires_at=time.time() + 1.0)
+    queue.submit(item)
+    time.sleep(0.3)
+    Worker(queue, agents={"PM": BudgetAgent()}).run(max_items=1)
+    assert 0.5 < seen["left"] < 0.75
@@ -0,0 +1,27 @@
+import pytest
+
+from core.workflow_graph import required_steps
+
+
+WORKFLOW = [
+    {"input_topic": "brief", "output_topic": "tasks"},
+    {"input_topic": "brief", "output_topic": "prd"},
+    {"input_topic": "prd", "output_topic": "page_spec"},
+    {"input_topic": "page_spec", "output_topic": "task_plan", "context_topics": ["tasks"]},
+    {"input_topic": "task_plan", "output_topic": "html", "fetch_topics": ["page_spec"]},
+]
+
+
+def test_required_steps_walks_inputs_and_fetches_backwards():
+    assert required_steps(WORKFLOW, {"html"}) == [1, 2, 3, 4]
+    assert required_steps(WORKFLOW, {"page_spec"}) == [1, 2]
+
+
+def test_context_topics_count_only_with_shared_context():
+    assert 0 not in required_steps(WORKFLOW, {"html"})
+    assert required_steps(WORKFLOW, {"html"}, with_context=True) == [0, 1, 2, 3, 4]
+
+
+def test_unknown_topic_is_rejected_instead_of_selecting_nothing():
+    with pytest.raises(ValueError, match="plan.*known topics: html, page_spec, prd, task_plan, tasks"):
+        required_steps(WORKFLOW, {"plan"})